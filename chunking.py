@@ -0,0 +1,174 @@
+"""Split knowledge text into token-bounded chunks.
+
+Blocks separated by blank lines stay whole when they fit the window of
+``RAG_CHUNK_TOKENS`` tokens. Longer blocks are cut at list items and
+sentences (words as a last resort) into windows overlapping by up to
+``RAG_CHUNK_OVERLAP`` tokens. Blocks shorter than ``RAG_CHUNK_MIN_TOKENS``
+are merged into the next block, or into the previous one at the end of a
+section.
+
+Markdown headings, including the ``## Sekce N`` markers written by the
+converters, start a new section. A chunk never spans two sections and a
+heading is kept together with the text that follows it.
+
+Tokens are counted as words and punctuation marks. That is close enough
+to the embedding model's word pieces without loading its tokenizer.
+"""
+
+import os
+import re
+from typing import List, Tuple
+
+DEFAULT_CHUNK_TOKENS = 100
+DEFAULT_CHUNK_OVERLAP = 20
+DEFAULT_CHUNK_MIN_TOKENS = 12
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_HEADING_RE = re.compile(r"^ {0,3}#{1,6}\s+\S")
+_LIST_RE = re.compile(r"^\s*(?:[-*+•]|\d+[.)])\s+\S")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+_BLOCK_RE = re.compile(r"\n[ \t]*\n")
+
+
+def count_tokens(text: str) -> int:
+    """Return the approximate number of tokens in *text*."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def _env_int(name: str, default: int) -> int:
+    """Return the integer environment variable *name* or *default*."""
+    env = os.getenv(name)
+    try:
+        return int(env) if env else default
+    except ValueError:  # pragma: no cover - environment may be invalid
+        return default
+
+
+def chunk_settings() -> Tuple[int, int, int]:
+    """Return ``(max_tokens, overlap, min_tokens)`` from the environment."""
+    max_tokens = max(_env_int("RAG_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS), 1)
+    overlap = min(max(_env_int("RAG_CHUNK_OVERLAP", DEFAULT_CHUNK_OVERLAP), 0), max_tokens // 2)
+    min_tokens = min(max(_env_int("RAG_CHUNK_MIN_TOKENS", DEFAULT_CHUNK_MIN_TOKENS), 0), max_tokens)
+    return max_tokens, overlap, min_tokens
+
+
+def _sections(text: str) -> List[Tuple[str | None, List[str]]]:
+    """Return ``(heading, blocks)`` pairs of *text* in document order."""
+    sections: List[Tuple[str | None, List[str]]] = [(None, [])]
+    for block in _BLOCK_RE.split(text):
+        lines: List[str] = []
+        for line in block.split("\n"):
+            if _HEADING_RE.match(line):
+                body = "\n".join(lines).strip()
+                if body:
+                    sections[-1][1].append(body)
+                lines = []
+                sections.append((line.strip(), []))
+            else:
+                lines.append(line)
+        body = "\n".join(lines).strip()
+        if body:
+            sections[-1][1].append(body)
+    return [s for s in sections if s[0] or s[1]]
+
+
+def _units(text: str, max_tokens: int) -> List[Tuple[str, str, int]]:
+    """Split *text* into ``(separator, unit, tokens)`` triples for packing.
+
+    Headings and list items are units of their own, prose is split into
+    sentences and anything still above *max_tokens* into single words.
+    """
+    units: List[Tuple[str, str, int]] = []
+    for n, block in enumerate(text.split("\n\n")):
+        runs: List[List[str]] = []
+        for line in block.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            if _HEADING_RE.match(line):
+                runs.append(["heading", line])
+            elif _LIST_RE.match(line):
+                runs.append(["item", line])
+            elif runs and runs[-1][0] != "heading":
+                runs[-1][1] += " " + line
+            else:
+                runs.append(["prose", line])
+        for i, (kind, run) in enumerate(runs):
+            sep = ("\n\n" if n else "") if i == 0 else "\n"
+            parts = [run] if kind != "prose" else _SENTENCE_RE.split(run)
+            for part in parts:
+                size = count_tokens(part)
+                if size <= max_tokens:
+                    units.append((sep, part, size))
+                else:
+                    words = part.split()
+                    units.append((sep, words[0], count_tokens(words[0])))
+                    units.extend((" ", w, count_tokens(w)) for w in words[1:])
+                sep = " "
+    return units
+
+
+def _join(window: List[Tuple[str, str, int]]) -> str:
+    return window[0][1] + "".join(sep + unit for sep, unit, _n in window[1:])
+
+
+def _split(text: str, max_tokens: int, overlap: int) -> List[str]:
+    """Cut *text* into windows of at most *max_tokens* tokens."""
+    chunks: List[str] = []
+    window: List[Tuple[str, str, int]] = []
+    size = 0
+    for unit in _units(text, max_tokens):
+        if window and size + unit[2] > max_tokens:
+            chunks.append(_join(window))
+            # Start the next window with the tail of this one.
+            keep: List[Tuple[str, str, int]] = []
+            kept = 0
+            for item in reversed(window):
+                if kept + item[2] > overlap:
+                    break
+                keep.insert(0, item)
+                kept += item[2]
+            while keep and kept + unit[2] > max_tokens:
+                kept -= keep.pop(0)[2]
+            window, size = keep, kept
+        window.append(unit)
+        size += unit[2]
+    if window:
+        chunks.append(_join(window))
+    return chunks
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int | None = None,
+    overlap: int | None = None,
+    min_tokens: int | None = None,
+) -> List[str]:
+    """Return the chunks of *text*; unset limits come from the environment."""
+    env_max, env_overlap, env_min = chunk_settings()
+    max_tokens = env_max if max_tokens is None else max_tokens
+    overlap = env_overlap if overlap is None else overlap
+    min_tokens = env_min if min_tokens is None else min_tokens
+
+    chunks: List[str] = []
+    for heading, blocks in _sections(text.replace("\r\n", "\n")):
+        section: List[str] = []
+        carry = heading + "\n" if heading else ""
+        for block in blocks:
+            block = carry + block
+            carry = ""
+            size = count_tokens(block)
+            if size < min_tokens:
+                carry = block + "\n\n"
+            elif size > max_tokens:
+                section.extend(_split(block, max_tokens, overlap))
+            else:
+                section.append(block)
+        carry = carry.strip()
+        if carry:
+            if section and count_tokens(section[-1]) + count_tokens(carry) <= max_tokens:
+                section[-1] += "\n\n" + carry
+            else:
+                section.append(carry)
+        chunks.extend(section)
+    return chunks
@@ -72,26 +72,7 @@ def convert_docx_to_md(input_path: Path, output_path: Path) -> None:
 
 
 if __name__ == "__main__":
-    for file in INPUT_DIR.iterdir():
-        out_path = OUTPUT_DIR / f"{file.stem}.md"
-        ext = file.suffix.lower()
-
-        if ext == ".txt":
-            convert_txt_to_md(file, out_path)
-        elif ext == ".pdf":
-            if pdfplumber is None:
-                print(
-                    f"Skipping {file.name}: install pdfplumber with 'pip install pdfplumber' to enable PDF conversion."
-                )
-                continue
-            convert_pdf_to_md(file, out_path)
-        elif ext == ".docx":
-            if Document is None:
-                print(
-                    f"Skipping {file.name}: install python-docx with 'pip install python-docx' to enable DOCX conversion."
-                )
-                continue
-            convert_docx_to_md(file, out_path)
-        else:
-            continue
-        print(f"Converted: {file.name} -> {out_path.name}")
+    # Kept for existing scripts; the parallel converter does the work.
+    from tools.convert import main
+
+    main(["--format", "md", "--input", str(INPUT_DIR), "--output", str(OUTPUT_DIR)])
@@ -43,17 +43,7 @@ def convert_docx(input_path: Path, output_path: Path) -> None:
 
 
 if __name__ == "__main__":
-    for file in INPUT_DIR.iterdir():
-        out_path = OUTPUT_DIR / f"{file.stem}.txt"
-        ext = file.suffix.lower()
-
-        if ext == ".txt":
-            convert_txt(file, out_path)
-        elif ext == ".pdf":
-            convert_pdf(file, out_path)
-        elif ext == ".docx":
-            convert_docx(file, out_path)
-        else:
-            continue
-        print(f"Converted: {file.name} -> {out_path.name}")
+    # Kept for existing scripts; the parallel converter does the work.
+    from tools.convert import main
 
+    main(["--format", "txt", "--input", str(INPUT_DIR), "--output", str(OUTPUT_DIR)])
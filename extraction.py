@@ -0,0 +1,166 @@
+"""Plain text extraction from knowledge documents.
+
+The same logic serves file uploads in :mod:`main` and the knowledge index in
+:mod:`rag_engine`. PDF and DOCX support needs ``pdfplumber`` and
+``python-docx``; both are imported only when such a file is extracted.
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".docx", ".pdf")
+"""Extensions indexed as knowledge, in order of precedence for one stem."""
+
+IGNORED_STEMS = {"readme"}
+"""Stems (lower case) of files describing a folder rather than knowledge."""
+
+
+def extract_text(path: str) -> str:
+    """Return the plain text of the TXT, MD, PDF or DOCX file *path*."""
+    ext = Path(path).suffix.lower()
+    if ext in {".txt", ".md"}:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    if ext == ".pdf":
+        try:
+            import pdfplumber
+        except Exception:
+            raise RuntimeError("pdfplumber required for PDF conversion")
+        lines = []
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                text = page.extract_text() or ""
+                lines.append(text.strip())
+        return "\n\n".join(lines)
+    if ext == ".docx":
+        try:
+            from docx import Document  # type: ignore
+        except Exception:
+            raise RuntimeError("python-docx required for DOCX conversion")
+        doc = Document(path)
+        paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
+        return "\n\n".join(paragraphs)
+    raise RuntimeError(f"Unsupported file type: {ext}")
+
+
+def list_documents(folder: str) -> List[str]:
+    """Return the supported documents directly inside *folder*, sorted.
+
+    When several files share a stem (``manual.pdf`` and a converted
+    ``manual.txt``) only the one listed first in
+    :data:`SUPPORTED_EXTENSIONS` is returned so it is not indexed twice.
+    Files such as ``README.md`` (:data:`IGNORED_STEMS`) are skipped.
+    """
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    best: Dict[str, Tuple[int, str]] = {}
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext not in SUPPORTED_EXTENSIONS or stem.startswith("."):
+            continue
+        if stem.lower() in IGNORED_STEMS:
+            continue
+        rank = SUPPORTED_EXTENSIONS.index(ext)
+        if stem not in best or rank < best[stem][0]:
+            best[stem] = (rank, name)
+    paths = [os.path.join(folder, name) for _rank, name in best.values()]
+    return [p for p in sorted(paths) if os.path.isfile(p)]
+
+
+class ExtractionCache:
+    """Extracted texts stored as ``<sha256>.txt`` files in *folder*."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.folder, f"{sha}.txt")
+
+    def get(self, sha: str) -> str | None:
+        try:
+            with open(self._path(sha), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, sha: str, text: str) -> None:
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            tmp = f"{self._path(sha)}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self._path(sha))
+        except OSError as e:  # pragma: no cover - the cache is only a speed-up
+            logging.warning("⚠️ Nelze uložit extrahovaný text %s: %s", sha, e)
+
+
+def _env_workers() -> int:
+    env = os.getenv("RAG_EXTRACT_WORKERS")
+    try:
+        return int(env) if env else min(4, os.cpu_count() or 1)
+    except ValueError:  # pragma: no cover - environment may be invalid
+        return 1
+
+
+def extract_files(
+    files: Iterable[Tuple[str, str]],
+    cache: ExtractionCache | None = None,
+    workers: int | None = None,
+) -> Dict[str, str]:
+    """Return ``{path: text}`` for ``(path, sha256)`` pairs.
+
+    Texts found in *cache* are reused. The rest are extracted in a pool of
+    *workers* processes (``RAG_EXTRACT_WORKERS``, default up to 4) and
+    stored in the cache. Files that cannot be extracted are logged and left
+    out of the result.
+    """
+    results: Dict[str, str] = {}
+    missing: List[Tuple[str, str]] = []
+    for path, sha in files:
+        text = cache.get(sha) if cache else None
+        if text is None:
+            missing.append((path, sha))
+        else:
+            results[path] = text
+    if not missing:
+        return results
+
+    workers = _env_workers() if workers is None else workers
+    paths = [path for path, _sha in missing]
+    if workers > 1 and len(missing) > 1:
+        # The caller may be a background thread of a process holding torch
+        # or faiss threads; forking it could deadlock the children.
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(missing)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = [pool.submit(extract_text, path) for path in paths]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+    else:
+        outcomes = []
+        for path in paths:
+            try:
+                outcomes.append(extract_text(path))
+            except Exception as e:
+                outcomes.append(e)
+
+    for (path, sha), outcome in zip(missing, outcomes):
+        if isinstance(outcome, Exception):
+            logging.error("❌ Nelze načíst %s: %s", path, outcome)
+            continue
+        results[path] = outcome
+        if cache:
+            cache.put(sha, outcome)
+    return results
@@ -10,10 +10,27 @@ from flask import (
 )
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from memory import vymazat_memory_range, _parse_dt
+from memory import (
+    MemoryCompactor,
+    MemorySearchIndex,
+    MemoryTimeline,
+    MemoryView,
+    SegmentedLog,
+    SqliteMemoryLog,
+    SqliteMemoryStore,
+    segment_dir,
+    _as_utc,
+    _parse_dt,
+)
+from extraction import extract_text as convert_file_to_txt
 from rag_engine import (
+    BackgroundKnowledgeBase,
     KnowledgeBase,
-    load_txt_file,
+    LayeredKnowledgeBase,
+    SEARCH_MODES,
+    batch_stats,
+    cache_stats,
+    model_stats,
     _strip_diacritics,
 )
 import difflib
@@ -28,7 +45,6 @@ import subprocess
 from filelock import FileLock
 import logging
 from logging.handlers import RotatingFileHandler
-from pathlib import Path
 from datetime import datetime, timedelta, UTC
 from typing import Any
 
@@ -123,31 +139,6 @@ def call_api(prompt: str, key: str | None = None) -> str:
     return ""
 
 
-def convert_file_to_txt(path: str) -> str:
-    ext = Path(path).suffix.lower()
-    if ext in {".txt", ".md"}:
-        return load_txt_file(path)
-    if ext == ".pdf":
-        try:
-            import pdfplumber
-        except Exception:
-            raise RuntimeError("pdfplumber required for PDF conversion")
-        lines = []
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                lines.append(text.strip())
-        return "\n\n".join(lines)
-    if ext == ".docx":
-        try:
-            from docx import Document  # type: ignore
-        except Exception:
-            raise RuntimeError("python-docx required for DOCX conversion")
-        doc = Document(path)
-        paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
-        return "\n\n".join(paragraphs)
-    raise RuntimeError(f"Unsupported file type: {ext}")
-
 # Threshold for knowledge base search
 threshold_env = os.getenv("RAG_THRESHOLD")
 try:
@@ -236,6 +227,9 @@ def _load_tokens() -> None:
     changed = False
     for token, info in list(data.items()):
         created = _parse_dt(info.get("created"))
+        if created:
+            # tokens saved before timestamps carried an offset are UTC
+            created = _as_utc(created)
         nick = info.get("nick")
         if (
             created
@@ -320,6 +314,14 @@ MEMORY_DIR = os.getenv("MEMORY_DIR", os.path.join(BASE_DIR, "memory"))
 DEFAULT_MEMORY_FOLDER = "public"
 memory_caches: dict[str, list[dict]] = {}
 memory_locks: dict[str, FileLock] = {}
+# Entry times of the caches, used to merge the newest entries of several folders.
+memory_timeline = MemoryTimeline()
+# Normalized text of the caches for /memory/search.
+memory_index = MemorySearchIndex(lambda text: _strip_diacritics(text.lower()))
+memory_logs: dict[tuple[str, str], SegmentedLog | SqliteMemoryLog] = {}
+# "jsonl" keeps day-segmented files, "sqlite" one database with full-text search.
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "jsonl").lower()
+memory_stores: dict[str, SqliteMemoryStore] = {}
 ANSWER_DIR = os.getenv("ANSWER_DIR", os.path.join(BASE_DIR, "answers"))
 MEMORY_RETENTION_DAYS = int(os.getenv("MEMORY_RETENTION_DAYS", "7"))
 
@@ -331,21 +333,30 @@ CORS(app)
 # Načti znalosti při startu
 KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(BASE_DIR, "knowledge"))
 PUBLIC_KNOWLEDGE_FOLDER = KNOWLEDGE_DIR
-knowledge = KnowledgeBase(PUBLIC_KNOWLEDGE_FOLDER)
-user_knowledge: dict[str, KnowledgeBase] = {}
+# Rebuilds triggered by uploads and reviews run in the background.
+knowledge = BackgroundKnowledgeBase(KnowledgeBase(PUBLIC_KNOWLEDGE_FOLDER))
+user_knowledge: dict[str, LayeredKnowledgeBase] = {}
 logging.info("✅ Znalosti načteny.")
 
 
-def get_knowledge_base(user: User | None) -> KnowledgeBase:
+def get_knowledge_base(user: User | None) -> BackgroundKnowledgeBase | LayeredKnowledgeBase:
+    """Return the knowledge base searched on behalf of *user*.
+
+    Users share the public index and only get a small overlay index of
+    their ``knowledge_folders`` and ``private_knowledge``.
+    """
     if not user:
         return knowledge
     kb = user_knowledge.get(user.nick)
     if kb is None:
-        folders = [PUBLIC_KNOWLEDGE_FOLDER]
-        for sub in user.knowledge_folders:
-            folders.append(os.path.join(PUBLIC_KNOWLEDGE_FOLDER, sub))
+        folders = [
+            os.path.join(PUBLIC_KNOWLEDGE_FOLDER, sub) for sub in user.knowledge_folders
+        ]
         folders.append(os.path.join(MEMORY_DIR, user.nick, "private_knowledge"))
-        kb = KnowledgeBase(folders)
+        overlay = BackgroundKnowledgeBase(
+            KnowledgeBase(folders, model_name=knowledge.model_name)
+        )
+        kb = LayeredKnowledgeBase(knowledge, overlay)
         user_knowledge[user.nick] = kb
     return kb
 
@@ -369,87 +380,155 @@ def _ensure_memory(folder: str) -> tuple[str, FileLock]:
         os.makedirs(os.path.dirname(path), exist_ok=True)
         open(path, "a", encoding="utf-8").close()
         memory_locks[lock_key] = FileLock(f"{path}.lock")
+        memory_compactor.track(folder)
     return path, memory_locks[lock_key]
 
 
+def _memory_store() -> SqliteMemoryStore:
+    """Return the SQLite memory database ``memory/memory.db``."""
+    path = os.path.join(MEMORY_DIR, "memory.db")
+    store = memory_stores.get(path)
+    if store is None:
+        store = memory_stores[path] = SqliteMemoryStore(path)
+    return store
+
+
+def _memory_log(folder: str) -> tuple[SegmentedLog | SqliteMemoryLog, FileLock]:
+    """Return the log and lock of *folder* in the ``MEMORY_BACKEND`` storage.
+
+    Segments of ``memory/public.jsonl`` live in ``memory/public.d/`` and
+    those of ``memory/<nick>/log.jsonl`` in ``memory/<nick>/log.d/``. The
+    single file only keeps lines without a time, such as feedback. With the
+    ``sqlite`` backend dated lines are imported into ``memory/memory.db``.
+    """
+    path, lock = _ensure_memory(folder)
+    log = memory_logs.get((MEMORY_BACKEND, path))
+    if log is None:
+        if MEMORY_BACKEND == "sqlite":
+            log = _memory_store().log(folder, legacy=path)
+        else:
+            log = SegmentedLog(segment_dir(path), legacy=path)
+        memory_logs[(MEMORY_BACKEND, path)] = log
+    return log, lock
+
+
 def _read_memory_file(folder: str) -> list[dict]:
-    path, _ = _ensure_memory(folder)
+    log, lock = _memory_log(folder)
     entries: list[dict] = []
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        cutoff = None
-        if MEMORY_RETENTION_DAYS > 0:
-            cutoff = datetime.now(UTC) - timedelta(days=MEMORY_RETENTION_DAYS)
-        pending_user: str | None = None
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                logging.warning("Skipping invalid memory line in %s: %s", path, line)
-                continue
+    times: list[float | None] = []
+    with lock:
+        log.migrate()
+    cutoff = None
+    if MEMORY_RETENTION_DAYS > 0:
+        cutoff = datetime.now(UTC) - timedelta(days=MEMORY_RETENTION_DAYS)
+    # Segments of days before the cutoff are not opened at all.
+    lines = log.lines(since=cutoff)
+    pending_user: str | None = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            logging.warning("Skipping invalid memory line in %s: %s", log.folder, line)
+            continue
 
-            ts_str = obj.get("timestamp")
-            if ts_str:
+        ts_str = obj.get("timestamp")
+        if ts_str:
+            try:
+                ts = datetime.fromisoformat(ts_str)
+            except ValueError:
+                ts = None
+        else:
+            dt = obj.get("date")
+            tm = obj.get("time")
+            ts = None
+            if dt and tm:
                 try:
-                    ts = datetime.fromisoformat(ts_str)
+                    ts = datetime.fromisoformat(f"{dt}T{tm}")
                 except ValueError:
                     ts = None
-            else:
-                dt = obj.get("date")
-                tm = obj.get("time")
-                ts = None
-                if dt and tm:
-                    try:
-                        ts = datetime.fromisoformat(f"{dt}T{tm}")
-                    except ValueError:
-                        ts = None
-                elif dt:
-                    try:
-                        ts = datetime.fromisoformat(f"{dt}T00:00:00")
-                    except ValueError:
-                        ts = None
-            if cutoff and ts and ts < cutoff:
+            elif dt:
+                try:
+                    ts = datetime.fromisoformat(f"{dt}T00:00:00")
+                except ValueError:
+                    ts = None
+        if cutoff and ts and _as_utc(ts) < cutoff:
+            pending_user = None
+            continue
+
+        if "role" in obj and "message" in obj:
+            role = obj.get("role")
+            msg = obj.get("message", "")
+            if role == "user":
+                pending_user = msg
+            elif role == "assistant" and pending_user is not None:
+                entries.append({"user": pending_user, "jarvik": msg})
+                times.append(_as_utc(ts).timestamp() if ts else None)
                 pending_user = None
-                continue
-
-            if "role" in obj and "message" in obj:
-                role = obj.get("role")
-                msg = obj.get("message", "")
-                if role == "user":
-                    pending_user = msg
-                elif role == "assistant" and pending_user is not None:
-                    entries.append({"user": pending_user, "jarvik": msg})
-                    pending_user = None
-                # ignore assistant line without preceding user
-            elif "user" in obj and "jarvik" in obj:
-                entries.append({"user": obj.get("user", ""), "jarvik": obj.get("jarvik", "")})
-            # ignore unrelated objects (e.g. feedback)
+            # ignore assistant line without preceding user
+        elif "user" in obj and "jarvik" in obj:
+            entries.append({"user": obj.get("user", ""), "jarvik": obj.get("jarvik", "")})
+            times.append(_as_utc(ts).timestamp() if ts else None)
+        # ignore unrelated objects (e.g. feedback)
     # Keep the entire cache unchanged.
+    memory_timeline.reset(folder, entries, times)
     return entries
 
 
+def _compact_memory(folder: str) -> int:
+    """Drop entries older than ``MEMORY_RETENTION_DAYS`` from the log of *folder*."""
+    if MEMORY_RETENTION_DAYS <= 0:
+        return 0
+    log, lock = _memory_log(folder)
+    cutoff = datetime.now(UTC) - timedelta(days=MEMORY_RETENTION_DAYS)
+    with lock:
+        removed = log.drop_before(cutoff)
+        if removed and folder in memory_caches:
+            memory_caches[folder] = _read_memory_file(folder)
+        elif folder in memory_caches:
+            # whole segments only go once their day is over, entries of a
+            # kept segment still expire from the cache one by one
+            memory_caches[folder] = memory_timeline.expire(folder, memory_caches[folder], cutoff)
+    return removed
+
+
+# Retention is applied by a background thread, not by every append.
+memory_compactor = MemoryCompactor(_compact_memory)
+
 # Cache default memory at startup
 memory_caches[DEFAULT_MEMORY_FOLDER] = _read_memory_file(DEFAULT_MEMORY_FOLDER)
 
 
-def load_memory(folders: list[str] | None = None) -> list[dict]:
-    """Return cached conversation memory from the given folders."""
-    folders = [DEFAULT_MEMORY_FOLDER] + (folders or [])
-    entries: list[dict] = []
-    for folder in folders:
+def _memory_caches(folders: list[str] | None = None) -> list[tuple[str, list[dict]]]:
+    """Return the caches of the public folder and *folders*, loading missing ones."""
+    caches = []
+    for folder in [DEFAULT_MEMORY_FOLDER] + (folders or []):
         cache = memory_caches.get(folder)
         if cache is None:
             cache = _read_memory_file(folder)
             memory_caches[folder] = cache
+        caches.append((folder, cache))
+    return caches
+
+
+def load_memory(folders: list[str] | None = None) -> list[dict]:
+    """Return cached conversation memory from the given folders."""
+    entries: list[dict] = []
+    for _folder, cache in _memory_caches(folders):
         entries.extend(cache)
     return entries
 
 
+def memory_view(folders: list[str] | None = None) -> MemoryView:
+    """Return the memory of the given folders ordered by time, without copying.
+
+    ``len()`` counts the entries and ``tail(n)`` returns the newest ones.
+    """
+    return memory_timeline.view(_memory_caches(folders))
+
+
 def reload_memory(folders: list[str] | None = None) -> None:
     for folder in [DEFAULT_MEMORY_FOLDER] + (folders or []):
         memory_caches[folder] = _read_memory_file(folder)
@@ -478,8 +557,7 @@ def append_to_memory(
     if attachments:
         entry["attachments"] = attachments
 
-    path, lock = _ensure_memory(folder)
-    cache = memory_caches.setdefault(folder, _read_memory_file(folder))
+    log, lock = _memory_log(folder)
 
     entry_user = {
         "timestamp": now_iso,
@@ -503,55 +581,72 @@ def append_to_memory(
     if attachments:
         entry_assist["attachments"] = attachments
 
+    data = json.dumps(entry_user) + "\n" + json.dumps(entry_assist) + "\n"
+    try:
+        when = datetime.fromisoformat(now_iso)
+    except ValueError:
+        when = now
     with lock:
+        # _compact_memory replaces the cache under the same lock
+        cache = memory_caches.get(folder)
+        if cache is None:
+            cache = memory_caches[folder] = _read_memory_file(folder)
         cache.append(entry)
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry_user) + "\n")
-            f.write(json.dumps(entry_assist) + "\n")
-        if MEMORY_RETENTION_DAYS > 0:
-            cutoff = (datetime.now(UTC) - timedelta(days=MEMORY_RETENTION_DAYS)).isoformat()
-            if vymazat_memory_range(path, do=cutoff):
-                memory_caches[folder] = _read_memory_file(folder)
+        memory_timeline.record(folder, cache, when)
+        memory_index.add(folder, cache)
+        log.append(data, _segment_day(now_date))
+    memory_compactor.note_append(folder, len(data.encode("utf-8")))
+
+
+def _segment_day(value: str) -> str:
+    """Return *value* if it is an ISO date, otherwise today's UTC date."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        return datetime.now(UTC).date().isoformat()
 
 
 def flush_memory(folders: list[str] | None = None) -> None:
     for folder in [DEFAULT_MEMORY_FOLDER] + (folders or []):
-        path, lock = _ensure_memory(folder)
+        _log, lock = _memory_log(folder)
         with lock:
             _flush_memory_locked(folder)
 
 
 def _flush_memory_locked(folder: str) -> None:
-    path, _ = _ensure_memory(folder)
+    """Replace the whole log of *folder* with its cache, stamped today."""
+    log, _ = _memory_log(folder)
     cache = memory_caches.get(folder, [])
-    lines = cache
-    with open(path, "w", encoding="utf-8") as f:
-        for item in lines:
-            now = datetime.now(UTC)
-            now_date = now.date().isoformat()
-            now_time = now.time().isoformat(timespec="seconds")
-            now_iso = f"{now_date}T{now_time}"
-            extra: dict[str, Any] = {}
-            if "context" in item and item["context"]:
-                extra["context"] = item["context"]
-            if "attachments" in item and item["attachments"]:
-                extra["attachments"] = item["attachments"]
-            f.write(json.dumps({
-                "timestamp": now_iso,
-                "role": "user",
-                "message": item.get("user", ""),
-                "date": now_date,
-                "time": now_time,
-                **extra,
-            }) + "\n")
-            f.write(json.dumps({
-                "timestamp": now_iso,
-                "role": "assistant",
-                "message": item.get("jarvik", ""),
-                "date": now_date,
-                "time": now_time,
-                **extra,
-            }) + "\n")
+    log.clear()
+    lines: list[str] = []
+    for item in cache:
+        now = datetime.now(UTC)
+        now_date = now.date().isoformat()
+        now_time = now.time().isoformat(timespec="seconds")
+        now_iso = f"{now_date}T{now_time}"
+        extra: dict[str, Any] = {}
+        if "context" in item and item["context"]:
+            extra["context"] = item["context"]
+        if "attachments" in item and item["attachments"]:
+            extra["attachments"] = item["attachments"]
+        lines.append(json.dumps({
+            "timestamp": now_iso,
+            "role": "user",
+            "message": item.get("user", ""),
+            "date": now_date,
+            "time": now_time,
+            **extra,
+        }) + "\n")
+        lines.append(json.dumps({
+            "timestamp": now_iso,
+            "role": "assistant",
+            "message": item.get("jarvik", ""),
+            "date": now_date,
+            "time": now_time,
+            **extra,
+        }) + "\n")
+    if lines:
+        log.append("".join(lines), datetime.now(UTC).date().isoformat())
 
 
 @app.route("/login", methods=["POST"])
@@ -575,6 +670,8 @@ def login():
 
 def search_memory(query, memory_entries):
     """Return up to five memory entries containing *query* in any form."""
+    if isinstance(memory_entries, MemoryView):
+        return memory_entries.find(memory_index, _strip_diacritics(query.lower()), limit=5)
     results = []
     q = _strip_diacritics(query.lower())
     for entry in reversed(memory_entries):
@@ -587,6 +684,19 @@ def search_memory(query, memory_entries):
     return results
 
 
+def search_memory_store(query: str, folders: list[str] | None = None) -> list[dict]:
+    """Return up to five entries matching the words of *query* via full-text search."""
+    cutoff = None
+    if MEMORY_RETENTION_DAYS > 0:
+        cutoff = datetime.now(UTC) - timedelta(days=MEMORY_RETENTION_DAYS)
+    folders = [DEFAULT_MEMORY_FOLDER] + (folders or [])
+    for folder in folders:
+        log, lock = _memory_log(folder)
+        with lock:
+            log.migrate()
+    return _memory_store().search(folders, query, limit=5, since=cutoff)
+
+
 def get_corrections(nick: str, query: str, threshold: float = 0.7) -> list[str]:
     """Return feedback corrections for *nick* similar to *query*."""
     path = os.path.join(MEMORY_DIR, nick, "log.jsonl")
@@ -640,8 +750,9 @@ def ask():
 
     user: User | None = getattr(g, "current_user", None)
     folders = [user.nick] + user.memory_folders if user else None
-    memory_context = load_memory(folders)
-    debug_log.append(f"🧠 Paměť: {len(memory_context)} záznamů")
+    history = memory_view(folders)
+    memory_context = history.tail(5)
+    debug_log.append(f"🧠 Paměť: {len(history)} záznamů")
     corrections = get_corrections(user.nick, message) if user else []
     if corrections:
         debug_log.append(f"✏️ Opravy: {len(corrections)}")
@@ -663,7 +774,7 @@ def ask():
     if rag_context:
         prompt += "\n".join([f"Znalost: {chunk}" for chunk in rag_context])
     if memory_context:
-        prompt += "\n" + "\n".join([f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context[-5:]])
+        prompt += "\n" + "\n".join([f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context])
     if corrections:
         prompt += "\n" + "\n".join([f"Poznámka: {c}" for c in corrections])
 
@@ -715,8 +826,9 @@ def ask_web():
 
     user: User | None = getattr(g, "current_user", None)
     folders = [user.nick] + user.memory_folders if user else None
-    memory_context = load_memory(folders)
-    debug_log.append(f"🧠 Paměť: {len(memory_context)} záznamů")
+    history = memory_view(folders)
+    memory_context = history.tail(5)
+    debug_log.append(f"🧠 Paměť: {len(history)} záznamů")
 
     corrections = get_corrections(user.nick, query) if user else []
     if corrections:
@@ -732,7 +844,7 @@ def ask_web():
         prompt += "\n".join([f"Znalost: {chunk}" for chunk in rag_context])
     if memory_context:
         prompt += "\n" + "\n".join(
-            [f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context[-5:]]
+            [f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context]
         )
     if corrections:
         prompt += "\n" + "\n".join([f"Poznámka: {c}" for c in corrections])
@@ -798,8 +910,9 @@ def ask_file():
 
     user: User | None = getattr(g, "current_user", None)
     folders = [user.nick] + user.memory_folders if user else None
-    memory_context = load_memory(folders)
-    debug_log.append(f"🧠 Paměť: {len(memory_context)} záznamů")
+    history = memory_view(folders)
+    memory_context = history.tail(5)
+    debug_log.append(f"🧠 Paměť: {len(history)} záznamů")
     corrections = get_corrections(user.nick, message) if user else []
     if corrections:
         debug_log.append(f"✏️ Opravy: {len(corrections)}")
@@ -823,7 +936,7 @@ def ask_file():
         prompt += "\n".join([f"Znalost: {chunk}" for chunk in rag_context])
     if memory_context:
         prompt += "\n" + "\n".join([
-            f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context[-5:]
+            f"Minulý dotaz: {m['user']} -> {m['jarvik']}" for m in memory_context
         ])
     if corrections:
         prompt += "\n" + "\n".join([f"Poznámka: {c}" for c in corrections])
@@ -937,9 +1050,11 @@ def memory_search():
     query = request.args.get("q", "")
     user: User | None = getattr(g, "current_user", None)
     folders = [user.nick] + user.memory_folders if user else None
-    memory_entries = load_memory(folders)
+    if query and MEMORY_BACKEND == "sqlite":
+        return jsonify(search_memory_store(query, folders))
+    memory_entries = memory_view(folders)
     if not query:
-        return jsonify(memory_entries[-5:])
+        return jsonify(memory_entries.tail(5))
     return jsonify(search_memory(query, memory_entries))
 
 
@@ -953,9 +1068,10 @@ def delete_memory_entries():
     keyword = data.get("keyword") or data.get("hledat_podle")
     user: User | None = getattr(g, "current_user", None)
     folder = user.nick if user else DEFAULT_MEMORY_FOLDER
-    path, lock = _ensure_memory(folder)
+    log, lock = _memory_log(folder)
     with lock:
-        removed = vymazat_memory_range(path, od=t_from, do=t_to, hledat_podle=keyword)
+        # Only the segments of days within the time range are rewritten.
+        removed = log.delete(od=t_from, do=t_to, hledat_podle=keyword)
         memory_caches[folder] = _read_memory_file(folder)
     return jsonify({"message": f"{removed} entries deleted"})
 
@@ -970,26 +1086,59 @@ def knowledge_search():
         thresh = float(thresh_param) if thresh_param is not None else RAG_THRESHOLD
     except ValueError:
         thresh = RAG_THRESHOLD
+    mode = request.args.get("mode") or None
+    if mode is not None and mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
     if not query:
         return jsonify([])
     user: User | None = getattr(g, "current_user", None)
     kb = get_knowledge_base(user)
-    if topics:
-        kb = KnowledgeBase(kb.folders, model_name=kb.model_name, topics=topics)
-    return jsonify(kb.search(query, threshold=thresh))
+    if str(request.args.get("sources")).lower() in {"1", "true", "yes", "on"}:
+        return jsonify(kb.search_cited(query, threshold=thresh, topics=topics, mode=mode))
+    return jsonify(kb.search(query, threshold=thresh, topics=topics, mode=mode))
 
 
 @app.route("/knowledge/reload", methods=["POST"])
 @require_auth
 def knowledge_reload():
-    """Reload knowledge base files and return how many chunks were loaded."""
+    """Schedule a rebuild of the knowledge index.
+
+    The rebuild runs in the background; the returned counts describe the
+    index currently searched. ``/knowledge/status`` reports the progress.
+    """
     user: User | None = getattr(g, "current_user", None)
     kb = get_knowledge_base(user)
     kb.reload()
     folders = [user.nick] + user.memory_folders if user else None
     reload_memory(folders)
-    logging.info("✅ Znalosti načteny.")
-    return jsonify({"status": "reloaded", "chunks": len(kb.chunks)})
+    logging.info("🔄 Přestavba znalostí naplánována.")
+    stats = kb.stats()
+    return jsonify(
+        {"status": "scheduled", "chunks": stats["chunks"], "duplicates": stats["duplicates"]}
+    )
+
+
+@app.route("/knowledge/status")
+@require_auth
+def knowledge_status():
+    """Return the generation and progress of background index builds."""
+    user: User | None = getattr(g, "current_user", None)
+    return jsonify(get_knowledge_base(user).status())
+
+
+@app.route("/knowledge/stats")
+@require_auth
+def knowledge_stats():
+    """Return the loaded embedding models, query cache and batching counters."""
+    user: User | None = getattr(g, "current_user", None)
+    return jsonify(
+        {
+            "models": model_stats(),
+            "caches": cache_stats(),
+            "batching": batch_stats(),
+            "knowledge": get_knowledge_base(user).stats(),
+        }
+    )
 
 
 @app.route("/knowledge/topics")
@@ -1083,10 +1232,10 @@ def knowledge_upload():
     with open(meta_path, "w", encoding="utf-8") as f:
         json.dump(meta, f)
 
-    kb = get_knowledge_base(user)
-    kb.reload()
-    if not private:
-        knowledge.reload()
+    if private and user:
+        get_knowledge_base(user).overlay.update()
+    else:
+        knowledge.update()
 
     folder = user.nick if user else DEFAULT_MEMORY_FOLDER
     msg = (
@@ -1156,7 +1305,7 @@ def knowledge_approve():
     meta["status"] = "approved"
     with open(meta_path, "w", encoding="utf-8") as f:
         json.dump(meta, f)
-    knowledge.reload()
+    knowledge.update()
     return jsonify({"status": "approved"})
 
 
@@ -1189,7 +1338,9 @@ def knowledge_reject():
         json.dump(meta, f)
     os.replace(file_path, dest_file)
     os.replace(meta_path, dest_meta)
-    knowledge.reload()
+    knowledge.update()
+    if uploader in user_knowledge:
+        user_knowledge[uploader].update()
     return jsonify({"status": "rejected"})
 
 
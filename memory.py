@@ -1,7 +1,17 @@
+import bisect
+import heapq
+import itertools
 import json
+import logging
 import os
-from datetime import datetime
-from typing import Any, Optional
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta, UTC
+from typing import Any, Callable, Iterable, Iterator, Optional
 
 
 def _parse_dt(value: Any) -> Optional[datetime]:
@@ -16,6 +26,27 @@ def _parse_dt(value: Any) -> Optional[datetime]:
     return None
 
 
+def _as_utc(value: datetime) -> datetime:
+    """Return *value* with naive datetimes taken as UTC."""
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
+def _entry_time(entry: Any) -> Optional[datetime]:
+    """Return the time of a memory log *entry* or ``None`` if it has none.
+
+    Entries written by ``append_to_memory`` carry a full ``timestamp`` next
+    to separate ``date`` and ``time`` fields; older ones may only have some.
+    """
+    if not isinstance(entry, dict):
+        return None
+    t = _parse_dt(entry.get("timestamp"))
+    if t is None and entry.get("date") and entry.get("time"):
+        t = _parse_dt(f"{entry['date']}T{entry['time']}")
+    if t is None:
+        t = _parse_dt(entry.get("time")) or _parse_dt(entry.get("date"))
+    return t
+
+
 def vymazat_memory_range(filepath: str, od: Any = None, do: Any = None, hledat_podle: str | None = None) -> int:
     """Delete entries from *filepath* within the given time range or containing a keyword.
 
@@ -40,6 +71,10 @@ def vymazat_memory_range(filepath: str, od: Any = None, do: Any = None, hledat_p
 
     start = _parse_dt(od)
     end = _parse_dt(do)
+    if start:
+        start = _as_utc(start)
+    if end:
+        end = _as_utc(end)
     key = (hledat_podle or "").lower()
 
     kept: list[str] = []
@@ -62,12 +97,9 @@ def vymazat_memory_range(filepath: str, od: Any = None, do: Any = None, hledat_p
                 continue
 
             if start or end:
-                t = None
-                for fld in ("time", "timestamp", "date"):
-                    if fld in entry:
-                        t = _parse_dt(entry[fld])
-                        break
+                t = _entry_time(entry)
                 if t is not None:
+                    t = _as_utc(t)
                     if ((start and t < start) or (end and t > end)):
                         kept.append(json.dumps(entry))
                     else:
@@ -80,3 +112,918 @@ def vymazat_memory_range(filepath: str, od: Any = None, do: Any = None, hledat_p
             for line in kept:
                 f.write(line + "\n")
     return removed
+
+
+_SEGMENT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl$")
+
+
+def segment_dir(legacy_path: str) -> str:
+    """Return the segment folder of the single-file log *legacy_path*.
+
+    ``memory/public.jsonl`` keeps its segments in ``memory/public.d/`` and
+    ``memory/<nick>/log.jsonl`` in ``memory/<nick>/log.d/``.
+    """
+    return os.path.splitext(legacy_path)[0] + ".d"
+
+
+def _segment_key(name: str) -> tuple[str, int]:
+    match = _SEGMENT_RE.match(name)
+    return match.group(1), int(match.group(2) or 0)
+
+
+def _day_bounds(day: str) -> tuple[datetime, datetime]:
+    start = datetime.combine(date.fromisoformat(day), datetime.min.time(), UTC)
+    return start, start + timedelta(days=1)
+
+
+def _count_lines(path: str) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+class SegmentedLog:
+    """Memory log stored as one JSONL segment per day.
+
+    Segments are named ``YYYY-MM-DD.jsonl`` after the UTC day of their
+    entries. A day that grows past *max_bytes* (``MEMORY_SEGMENT_BYTES``,
+    default 16 MiB) continues in ``YYYY-MM-DD.1.jsonl`` and so on.
+    ``manifest.json`` lists the segments, so retention drops whole files and
+    time-range deletes and reads only open the segments of the days they
+    cover.
+
+    :meth:`migrate` moves the dated lines of the single-file log *legacy*
+    into segments. Lines without a time, such as feedback, stay in *legacy*,
+    which is read before the segments. Callers serialize writers with the
+    lock of the log.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, folder: str, legacy: str | None = None, max_bytes: int | None = None):
+        if max_bytes is None:
+            max_bytes = int(os.getenv("MEMORY_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+        self.folder = folder
+        self.legacy = legacy
+        self.max_bytes = max_bytes
+        self._manifest = self._read_manifest()
+
+    # ------------------------------------------------------------------
+    def _read_manifest(self) -> dict[str, Any]:
+        try:
+            with open(os.path.join(self.folder, self.MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["segments"] = sorted(manifest["segments"], key=_segment_key)
+            return manifest
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        # Missing or damaged manifest: rebuild it from the folder.
+        try:
+            names = [n for n in os.listdir(self.folder) if _SEGMENT_RE.match(n)]
+        except OSError:
+            names = []
+        return {"segments": sorted(names, key=_segment_key), "legacy_size": None}
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp, os.path.join(self.folder, self.MANIFEST))
+
+    def _refresh(self) -> None:
+        """Pick up segments created by other processes."""
+        self._manifest = self._read_manifest()
+
+    def segments(self) -> list[str]:
+        """Return the segment file names from the oldest to the newest."""
+        return list(self._manifest["segments"])
+
+    # ------------------------------------------------------------------
+    def append(self, data: str, day: str) -> None:
+        """Append the JSONL lines *data* to the segment of *day*."""
+        names = [n for n in self._manifest["segments"] if _segment_key(n)[0] == day]
+        if not names:
+            self._refresh()
+            names = [n for n in self._manifest["segments"] if _segment_key(n)[0] == day]
+        name = names[-1] if names else f"{day}.jsonl"
+        path = os.path.join(self.folder, name)
+        if names and self.max_bytes > 0:
+            try:
+                if os.path.getsize(path) >= self.max_bytes:
+                    name = f"{day}.{_segment_key(name)[1] + 1}.jsonl"
+                    path = os.path.join(self.folder, name)
+            except OSError:
+                pass
+        if name not in self._manifest["segments"]:
+            os.makedirs(self.folder, exist_ok=True)
+            self._refresh()
+            if name not in self._manifest["segments"]:
+                self._manifest["segments"] = sorted(
+                    self._manifest["segments"] + [name], key=_segment_key
+                )
+                self._save_manifest()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def lines(self, since: datetime | None = None) -> Iterator[str]:
+        """Yield the lines of the legacy file and of segments newer than *since*."""
+        if since is not None:
+            since = _as_utc(since)
+        paths = [self.legacy] if self.legacy else []
+        self._refresh()
+        for name in self._manifest["segments"]:
+            if since is None or _day_bounds(_segment_key(name)[0])[1] > since:
+                paths.append(os.path.join(self.folder, name))
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    yield from f
+            except FileNotFoundError:
+                continue
+
+    def drop_before(self, cutoff: datetime) -> int:
+        """Delete segments holding only entries older than *cutoff*.
+
+        Returns the number of removed lines.
+        """
+        cutoff = _as_utc(cutoff)
+        self.migrate()
+        keep, removed = [], 0
+        for name in self._manifest["segments"]:
+            if _day_bounds(_segment_key(name)[0])[1] <= cutoff:
+                removed += self._unlink(name)
+            else:
+                keep.append(name)
+        if len(keep) != len(self._manifest["segments"]):
+            self._manifest["segments"] = keep
+            self._save_manifest()
+        return removed
+
+    def delete(self, od: Any = None, do: Any = None, hledat_podle: str | None = None) -> int:
+        """Remove entries like :func:`vymazat_memory_range`, segment by segment.
+
+        Without a keyword only segments overlapping the time range are
+        opened, and segments inside the range are deleted as a whole.
+        """
+        start, end = _parse_dt(od), _parse_dt(do)
+        start = _as_utc(start) if start else None
+        end = _as_utc(end) if end else None
+        if not (start or end or hledat_podle):
+            return 0
+        self.migrate()
+        removed = 0
+        if self.legacy and hledat_podle:
+            removed += vymazat_memory_range(self.legacy, od, do, hledat_podle)
+        keep = []
+        for name in self._manifest["segments"]:
+            first, after = _day_bounds(_segment_key(name)[0])
+            overlaps = (not start or after > start) and (not end or first <= end)
+            if not overlaps and not hledat_podle:
+                keep.append(name)
+                continue
+            inside = (
+                (start or end)
+                and (not start or start <= first)
+                and (not end or end >= after - timedelta(microseconds=1))
+            )
+            path = os.path.join(self.folder, name)
+            if inside:
+                removed += self._unlink(name)
+                continue
+            try:
+                removed += vymazat_memory_range(path, od, do, hledat_podle)
+                empty = os.path.getsize(path) == 0
+            except OSError:
+                empty = True
+            if empty:
+                self._unlink(name)
+            else:
+                keep.append(name)
+        if len(keep) != len(self._manifest["segments"]):
+            self._manifest["segments"] = keep
+            self._save_manifest()
+        return removed
+
+    def clear(self) -> None:
+        """Delete every segment and empty the legacy file."""
+        self._refresh()
+        for name in self._manifest["segments"]:
+            self._unlink(name)
+        self._manifest = {"segments": [], "legacy_size": 0}
+        self._save_manifest()
+        if self.legacy:
+            open(self.legacy, "w", encoding="utf-8").close()
+
+    def _unlink(self, name: str) -> int:
+        path = os.path.join(self.folder, name)
+        try:
+            count = _count_lines(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return count
+
+    # ------------------------------------------------------------------
+    def migrate(self) -> int:
+        """Move dated lines of the legacy file into segments; return their number.
+
+        The manifest marks a migration in progress with the legacy size and
+        the segment sizes before it, so a run interrupted by a crash is
+        finished or undone by :meth:`_recover` instead of copying the lines
+        twice.
+        """
+        if not self.legacy:
+            return 0
+        self._refresh()
+        self._recover()
+        try:
+            size = os.path.getsize(self.legacy)
+        except OSError:
+            return 0
+        if size == 0 or size == self._manifest.get("legacy_size"):
+            return 0
+        by_day: dict[str, list[str]] = {}
+        rest: list[str] = []
+        with open(self.legacy, "r", encoding="utf-8") as f:
+            for raw in f:
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    t = _entry_time(json.loads(line))
+                except json.JSONDecodeError:
+                    t = None
+                if t is None:
+                    rest.append(line)
+                else:
+                    by_day.setdefault(_as_utc(t).date().isoformat(), []).append(line)
+        if by_day:
+            self._manifest["migrating"] = {
+                "legacy_size": size,
+                "segments": {
+                    name: os.path.getsize(os.path.join(self.folder, name))
+                    for name in self._manifest["segments"]
+                    if os.path.exists(os.path.join(self.folder, name))
+                },
+            }
+            self._save_manifest()
+        for day in sorted(by_day):
+            self.append("".join(line + "\n" for line in by_day[day]), day)
+        moved = sum(len(lines) for lines in by_day.values())
+        if moved:
+            data = "".join(line + "\n" for line in rest)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.legacy) or ".", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.legacy)
+            size = len(data.encode("utf-8"))
+            logging.info("📦 %d řádků paměti %s převedeno do segmentů", moved, self.legacy)
+        self._manifest["legacy_size"] = size
+        self._manifest.pop("migrating", None)
+        self._save_manifest()
+        return moved
+
+    def _recover(self) -> None:
+        """Finish or undo a :meth:`migrate` that did not complete."""
+        marker = self._manifest.get("migrating")
+        if not marker:
+            return
+        try:
+            size = os.path.getsize(self.legacy)
+        except OSError:
+            size = None
+        if size != marker["legacy_size"]:
+            # The legacy file was rewritten, only the manifest is behind.
+            self._manifest["legacy_size"] = size
+        else:
+            before = marker["segments"]
+            keep = []
+            for name in self._manifest["segments"]:
+                path = os.path.join(self.folder, name)
+                try:
+                    if name not in before:
+                        os.remove(path)
+                        continue
+                    with open(path, "r+b") as f:
+                        f.truncate(before[name])
+                except OSError:
+                    if name not in before:
+                        continue
+                keep.append(name)
+            self._manifest["segments"] = keep
+            logging.warning("⚠️ Nedokončený převod paměti %s vrácen", self.legacy)
+        del self._manifest["migrating"]
+        self._save_manifest()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    folder TEXT NOT NULL,
+    ts REAL NOT NULL,
+    role TEXT,
+    message TEXT NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_folder_ts ON memory(folder, ts);
+CREATE TABLE IF NOT EXISTS memory_imports (
+    folder TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (folder, segment)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+    message, content='memory', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS memory_ai AFTER INSERT ON memory BEGIN
+    INSERT INTO memory_fts(rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS memory_ad AFTER DELETE ON memory BEGIN
+    INSERT INTO memory_fts(memory_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+"""
+
+
+def _memory_row(line: str) -> Optional[tuple[float, Optional[str], str, str]]:
+    """Return ``(ts, role, message, line)`` of a log line or ``None`` if undated."""
+    try:
+        entry = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    t = _entry_time(entry)
+    if t is None:
+        return None
+    if "role" in entry:
+        role, message = entry.get("role"), entry.get("message") or ""
+    else:
+        role, message = None, f"{entry.get('user', '')}\n{entry.get('jarvik', '')}"
+    return _as_utc(t).timestamp(), role, str(message), json.dumps(entry)
+
+
+class SqliteMemoryStore:
+    """Conversation memory of every folder in one SQLite database.
+
+    The database runs in WAL mode so reads do not wait for writers. Entries
+    are indexed on ``(folder, ts)`` for retention and time-range deletes, and
+    their messages in an FTS5 table whose ``unicode61`` tokenizer ignores
+    case and diacritics. :meth:`log` returns a per-folder view with the
+    interface of :class:`SegmentedLog`.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Python's lower() so keyword deletes match non-ASCII like vymazat_memory_range.
+        self._conn.create_function("py_lower", 1, lambda s: s.lower() if s else s, deterministic=True)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def log(self, folder: str, legacy: str | None = None) -> "SqliteMemoryLog":
+        """Return the log of *folder*; *legacy* is its JSONL file to import."""
+        return SqliteMemoryLog(self, folder, legacy)
+
+    def insert(
+        self, folder: str, lines: list[str], imported: list[tuple[str, int]] = ()
+    ) -> int:
+        """Store the dated *lines* of *folder*; return how many were stored.
+
+        *imported* lists ``(segment, size)`` of the JSONL segments the lines
+        were read from. They are recorded in the same transaction, so an
+        interrupted import does not store the lines twice.
+        """
+        rows = [(folder, *row) for row in map(_memory_row, lines) if row]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO memory(folder, ts, role, message, line) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO memory_imports(folder, segment, size) VALUES (?, ?, ?)",
+                    [(folder, name, size) for name, size in imported],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+    def execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            rows = cur.fetchall()
+            return rows if cur.description else [(cur.rowcount,)]
+
+    def search(
+        self,
+        folders: list[str],
+        query: str,
+        limit: int = 5,
+        since: datetime | None = None,
+    ) -> list[dict]:
+        """Return up to *limit* entries of *folders* matching *query*, newest first.
+
+        Every word of *query* must start a word of the user message or of
+        the answer; case and diacritics are ignored.
+        """
+        words = re.findall(r"\w+", query)
+        if not words or not folders:
+            return []
+        match = " ".join('"' + w + '"*' for w in words)
+        wanted = set(folders)
+        after = _as_utc(since).timestamp() if since is not None else float("-inf")
+        # FTS5 walks its rowids backwards without sorting every match.
+        sql = (
+            "SELECT f.rowid, m.folder, m.ts, m.role, m.line FROM ("
+            " SELECT rowid FROM memory_fts WHERE memory_fts MATCH ?"
+            " ORDER BY rowid DESC LIMIT ? OFFSET ?"
+            ") f JOIN memory m ON m.id = f.rowid ORDER BY f.rowid DESC"
+        )
+        results: list[dict] = []
+        seen: set[int] = set()
+        page, offset = max(limit, 1) * 4, 0
+        while len(results) < limit:
+            # Both lines of an entry may match, so fetch a few more than needed.
+            rows = self.execute(sql, (match, page, offset))
+            for row_id, folder, ts, role, line in rows:
+                if folder not in wanted or ts < after:
+                    continue
+                entry = self._entry(row_id, folder, role, line)
+                if entry is None or entry[0] in seen:
+                    continue
+                seen.add(entry[0])
+                results.append(entry[1])
+                if len(results) >= limit:
+                    break
+            if len(rows) < page:
+                break
+            offset += page
+            page = min(page * 4, 4096)
+        return results
+
+    def _entry(self, row_id: int, folder: str, role: str | None, line: str):
+        """Pair a matching line with its question or answer.
+
+        ``+folder`` keeps SQLite on the rowid instead of the folder index,
+        which would visit every row of the folder.
+        """
+        obj = json.loads(line)
+        if role is None:
+            return row_id, {"user": obj.get("user", ""), "jarvik": obj.get("jarvik", "")}
+        if role == "user":
+            nxt = self.execute(
+                "SELECT role, message FROM memory WHERE +folder = ? AND id > ? ORDER BY id LIMIT 1",
+                (folder, row_id),
+            )
+            if nxt and nxt[0][0] == "assistant":
+                return row_id, {"user": obj.get("message", ""), "jarvik": nxt[0][1]}
+            return None
+        if role == "assistant":
+            prev = self.execute(
+                "SELECT id, role, message FROM memory WHERE +folder = ? AND id < ? ORDER BY id DESC LIMIT 1",
+                (folder, row_id),
+            )
+            if prev and prev[0][1] == "user":
+                return prev[0][0], {"user": prev[0][2], "jarvik": obj.get("message", "")}
+        return None
+
+
+class SqliteMemoryLog:
+    """One folder of a :class:`SqliteMemoryStore` behind the :class:`SegmentedLog` interface.
+
+    Undated lines such as feedback stay in the JSONL file *legacy*, which is
+    read before the database rows.
+    """
+
+    def __init__(self, store: SqliteMemoryStore, folder: str, legacy: str | None = None):
+        self.store = store
+        self.folder = folder
+        self.legacy = legacy
+        self._imported: tuple | None = None
+
+    def append(self, data: str, day: str) -> None:
+        self.store.insert(self.folder, data.splitlines())
+
+    def lines(self, since: datetime | None = None) -> Iterator[str]:
+        if self.legacy:
+            try:
+                with open(self.legacy, "r", encoding="utf-8") as f:
+                    yield from f
+            except FileNotFoundError:
+                pass
+        ts = _as_utc(since).timestamp() if since is not None else float("-inf")
+        rows = self.store.execute(
+            "SELECT line FROM memory WHERE folder = ? AND ts >= ? ORDER BY id",
+            (self.folder, ts),
+        )
+        for (line,) in rows:
+            yield line + "\n"
+
+    def drop_before(self, cutoff: datetime) -> int:
+        self.migrate()
+        return self.store.execute(
+            "DELETE FROM memory WHERE folder = ? AND ts < ?",
+            (self.folder, _as_utc(cutoff).timestamp()),
+        )[0][0]
+
+    def delete(self, od: Any = None, do: Any = None, hledat_podle: str | None = None) -> int:
+        """Remove entries with the semantics of :func:`vymazat_memory_range`."""
+        start, end = _parse_dt(od), _parse_dt(do)
+        if not (start or end or hledat_podle):
+            return 0
+        self.migrate()
+        removed = 0
+        if self.legacy and hledat_podle:
+            removed += vymazat_memory_range(self.legacy, od, do, hledat_podle)
+        conds, params = [], []
+        if hledat_podle:
+            conds.append("instr(py_lower(line), ?) > 0")
+            params.append(hledat_podle.lower())
+        if start or end:
+            rng = []
+            if start:
+                rng.append("ts >= ?")
+                params.append(_as_utc(start).timestamp())
+            if end:
+                rng.append("ts <= ?")
+                params.append(_as_utc(end).timestamp())
+            conds.append("(" + " AND ".join(rng) + ")")
+        removed += self.store.execute(
+            f"DELETE FROM memory WHERE folder = ? AND ({' OR '.join(conds)})",
+            (self.folder, *params),
+        )[0][0]
+        return removed
+
+    def clear(self) -> None:
+        self.store.execute("DELETE FROM memory WHERE folder = ?", (self.folder,))
+        if self.legacy:
+            open(self.legacy, "w", encoding="utf-8").close()
+
+    def migrate(self) -> int:
+        """Import the dated lines of the JSONL log and its segments.
+
+        Segments are deleted after the import. How much of each segment was
+        imported is recorded with the rows, so a run interrupted before the
+        deletion only imports what was appended since.
+        """
+        if not self.legacy:
+            return 0
+        seen = self._signature()
+        if seen == self._imported:
+            return 0
+        jsonl = SegmentedLog(segment_dir(self.legacy), legacy=self.legacy)
+        jsonl.migrate()
+        names = jsonl.segments()
+        if not names:
+            self._forget_imports()
+            self._imported = self._signature()
+            return 0
+        done = dict(self.store.execute(
+            "SELECT segment, size FROM memory_imports WHERE folder = ?", (self.folder,)
+        ))
+        lines: list[str] = []
+        imported: list[tuple[str, int]] = []
+        for name in names:
+            with open(os.path.join(jsonl.folder, name), "rb") as f:
+                start = done.get(name, 0)
+                if start > os.fstat(f.fileno()).st_size:
+                    start = 0  # a new segment of the same name
+                f.seek(start)
+                data = f.read()
+            lines.extend(line for line in data.decode("utf-8").splitlines() if line.strip())
+            imported.append((name, start + len(data)))
+        moved = self.store.insert(self.folder, lines, imported)
+        jsonl.drop_before(datetime.max.replace(tzinfo=UTC))
+        self._forget_imports()
+        self._imported = self._signature()
+        logging.info("📦 %d řádků paměti %s převedeno do SQLite", moved, self.legacy)
+        return moved
+
+    def _forget_imports(self) -> None:
+        """Drop the import records once the segments are gone."""
+        self.store.execute("DELETE FROM memory_imports WHERE folder = ?", (self.folder,))
+
+    def _signature(self) -> tuple:
+        """Size of the legacy file and state of its segment folder."""
+        stats = []
+        for path in (self.legacy, segment_dir(self.legacy)):
+            try:
+                st = os.stat(path)
+                stats.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+
+
+class MemoryView:
+    """Entries of several memory caches ordered by time, without copying them.
+
+    *caches* holds ``(folder, entries, times)`` per folder, with ``times``
+    never decreasing. Entries of the same time keep the folder order, so the view
+    reads like the caches concatenated. ``len()`` adds up the cache lengths
+    and :meth:`tail` finds the newest entries by walking the caches backwards
+    in a k-way merge, so its cost depends on *n* and the number of folders,
+    not on the length of the history.
+    """
+
+    def __init__(self, caches: list[tuple[str, list[dict], list[float]]]):
+        # Later appends are not part of the view.
+        self._folders = [folder for folder, _entries, _times in caches]
+        self._caches = [(entries, times, len(times)) for _folder, entries, times in caches]
+
+    def __len__(self) -> int:
+        return sum(size for _entries, _times, size in self._caches)
+
+    def __iter__(self) -> Iterator[dict]:
+        runs = [
+            zip(itertools.islice(times, size), itertools.repeat(folder), entries)
+            for folder, (entries, times, size) in enumerate(self._caches)
+        ]
+        for _t, _folder, entry in heapq.merge(*runs, key=lambda item: item[:2]):
+            yield entry
+
+    def __reversed__(self) -> Iterator[dict]:
+        return self._newest([range(size - 1, -1, -1) for _e, _t, size in self._caches])
+
+    def _newest(self, positions: list[Iterable[int]]) -> Iterator[dict]:
+        """Merge descending *positions* of each cache, newest entry first."""
+        runs = [iter(p) for p in positions]
+        heap = []
+        for folder, run in enumerate(runs):
+            pos = next(run, None)
+            if pos is not None:
+                heap.append((-self._caches[folder][1][pos], -folder, pos))
+        heapq.heapify(heap)
+        while heap:
+            _t, folder, pos = heap[0]
+            yield self._caches[-folder][0][pos]
+            pos = next(runs[-folder], None)
+            if pos is not None:
+                heapq.heapreplace(heap, (-self._caches[-folder][1][pos], folder, pos))
+            else:
+                heapq.heappop(heap)
+
+    def find(self, index: "MemorySearchIndex", query: str, limit: int = 5) -> list[dict]:
+        """Return up to *limit* entries containing *query*, newest first."""
+        matches = [
+            index.matches(folder, entries, query, size)
+            for folder, (entries, _times, size) in zip(self._folders, self._caches)
+        ]
+        return list(itertools.islice(self._newest(matches), limit))
+
+    def tail(self, n: int) -> list[dict]:
+        """Return the *n* newest entries, oldest first."""
+        if n <= 0:
+            return []
+        newest = list(itertools.islice(reversed(self), n))
+        newest.reverse()
+        return newest
+
+
+class MemoryTimeline:
+    """Times of the entries in the memory caches of each folder.
+
+    :meth:`reset` stores the times read from a log, :meth:`record` the time
+    of an appended entry. Entries added to a cache some other way get the
+    time at which the timeline first sees them. Times are kept from
+    decreasing so every cache is sorted for :class:`MemoryView`.
+    """
+
+    def __init__(self):
+        self._folders: dict[str, tuple[list[dict], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def reset(self, folder: str, entries: list[dict], times: list[Optional[float]]) -> None:
+        """Use *times* for the cache *entries* of *folder*."""
+        known: list[float] = []
+        last = float("-inf")
+        for t in times:
+            last = last if t is None else max(last, t)
+            known.append(last)
+        with self._lock:
+            self._folders[folder] = (entries, known)
+
+    def record(self, folder: str, entries: list[dict], when: datetime) -> None:
+        """Note that *entries* of *folder* just got an entry from *when*."""
+        with self._lock:
+            times = self._sync(folder, entries, len(entries) - 1)
+            t = _as_utc(when).timestamp()
+            times.append(max(t, times[-1]) if times else t)
+
+    def expire(self, folder: str, entries: list[dict], cutoff: datetime) -> list[dict]:
+        """Return the cache *entries* of *folder* without those before *cutoff*.
+
+        Leading entries without a time are kept, as the log readers keep
+        undated lines. *entries* itself is returned when nothing
+        expired, otherwise a new list that takes over the remaining times.
+        """
+        limit = _as_utc(cutoff).timestamp()
+        with self._lock:
+            times = self._sync(folder, entries, len(entries))
+            undated = bisect.bisect_right(times, float("-inf"))
+            end = bisect.bisect_left(times, limit)
+            if end <= undated:
+                return entries
+            kept = entries[:undated] + entries[end:]
+            self._folders[folder] = (kept, times[:undated] + times[end:])
+            return kept
+
+    def view(self, caches: list[tuple[str, list[dict]]]) -> MemoryView:
+        """Return a :class:`MemoryView` of ``(folder, entries)`` pairs."""
+        with self._lock:
+            return MemoryView(
+                [
+                    (folder, entries, self._sync(folder, entries, len(entries)))
+                    for folder, entries in caches
+                ]
+            )
+
+    def _sync(self, folder: str, entries: list[dict], size: int) -> list[float]:
+        known = self._folders.get(folder)
+        if known is None or known[0] is not entries or len(known[1]) > len(entries):
+            known = self._folders[folder] = (entries, [])
+        times = known[1]
+        if len(times) < size:
+            now = time.time()
+            last = times[-1] if times else float("-inf")
+            times.extend([max(now, last)] * (size - len(times)))
+        return times
+
+
+class MemorySearchIndex:
+    """Normalized text and trigram index of the memory caches.
+
+    Finds the entries whose normalized question or answer contains a
+    normalized query, like scanning the cache with ``normalize`` applied to
+    both sides, but normalizes every entry only once. Queries of three or
+    more characters only check entries holding all of their trigrams.
+
+    :meth:`add` indexes entries appended to a cache. Entries added some
+    other way are indexed on the next search, and a cache replaced by a new
+    list, for example after a delete, is indexed again from scratch.
+    """
+
+    GRAM = 3
+
+    def __init__(self, normalize: Callable[[str], str]):
+        self._normalize = normalize
+        self._folders: dict[str, tuple[list[dict], list[tuple[str, str]], dict[str, array]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, folder: str, entries: list[dict]) -> None:
+        """Index the entries of *folder* that are not indexed yet."""
+        with self._lock:
+            self._sync(folder, entries)
+
+    def matches(self, folder: str, entries: list[dict], query: str, size: int) -> Iterator[int]:
+        """Yield positions below *size* whose text contains *query*, newest first.
+
+        *query* must already be normalized.
+        """
+        with self._lock:
+            _entries, texts, grams = self._sync(folder, entries)
+        size = min(size, len(texts))
+        if len(query) < self.GRAM:
+            candidates: Iterable[int] = range(size - 1, -1, -1)
+        else:
+            postings = [grams.get(g) for g in self._grams(query)]
+            if not all(postings):
+                return
+            postings.sort(key=len)
+            first, rest = postings[0], postings[1:]
+            candidates = (
+                first[i]
+                for i in range(bisect.bisect_left(first, size) - 1, -1, -1)
+                if all(_contains(p, first[i]) for p in rest)
+            )
+        for pos in candidates:
+            user_text, jarvik_text = texts[pos]
+            if query in user_text or query in jarvik_text:
+                yield pos
+
+    def _grams(self, text: str) -> set[str]:
+        return {text[i:i + self.GRAM] for i in range(len(text) - self.GRAM + 1)}
+
+    def _sync(self, folder: str, entries: list[dict]):
+        known = self._folders.get(folder)
+        if known is None or known[0] is not entries or len(known[1]) > len(entries):
+            known = self._folders[folder] = (entries, [], {})
+        _entries, texts, grams = known
+        for pos in range(len(texts), len(entries)):
+            entry = entries[pos]
+            text = (
+                self._normalize(entry.get("user", "")),
+                self._normalize(entry.get("jarvik", "")),
+            )
+            texts.append(text)
+            for gram in self._grams(text[0]) | self._grams(text[1]):
+                posting = grams.get(gram)
+                if posting is None:
+                    posting = grams[gram] = array("I")
+                posting.append(pos)
+        return known
+
+
+def _contains(posting: array, pos: int) -> bool:
+    i = bisect.bisect_left(posting, pos)
+    return i < len(posting) and posting[i] == pos
+
+
+class MemoryCompactor:
+    """Apply memory retention in the background instead of on every append.
+
+    :meth:`note_append` only counts the bytes appended to a folder. A worker
+    thread calls ``compact(folder)`` for every tracked folder each
+    *interval* seconds (``MEMORY_COMPACT_INTERVAL``, default 3600, ``0``
+    disables the schedule) and for a single folder as soon as *max_bytes*
+    (``MEMORY_COMPACT_BYTES``, default 1 MiB, ``0`` disables the trigger)
+    were appended to it since its last compaction.
+    """
+
+    def __init__(
+        self,
+        compact: Callable[[str], int],
+        interval: float | None = None,
+        max_bytes: int | None = None,
+    ):
+        if interval is None:
+            interval = float(os.getenv("MEMORY_COMPACT_INTERVAL", "3600"))
+        if max_bytes is None:
+            max_bytes = int(os.getenv("MEMORY_COMPACT_BYTES", str(1024 * 1024)))
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.runs = 0
+        self.removed = 0
+        self._compact = compact
+        self._grown: dict[str, int] = {}
+        self._due: set[str] = set()
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+
+    def track(self, folder: str) -> None:
+        """Include *folder* in the scheduled compactions."""
+        self.note_append(folder, 0)
+
+    def note_append(self, folder: str, nbytes: int) -> None:
+        """Record that *nbytes* were appended to the log of *folder*."""
+        with self._cond:
+            grown = self._grown.get(folder, 0) + nbytes
+            self._grown[folder] = grown
+            if self.max_bytes > 0 and grown >= self.max_bytes:
+                self._due.add(folder)
+                self._cond.notify()
+            if self._worker is None and (self.interval > 0 or self._due):
+                self._worker = threading.Thread(
+                    target=self._run, name="memory-compactor", daemon=True
+                )
+                self._worker.start()
+
+    def compact_now(self, folders: list[str] | None = None) -> int:
+        """Compact *folders* (default: all tracked) now; return removed entries."""
+        with self._cond:
+            folders = list(self._grown) if folders is None else folders
+            for folder in folders:
+                self._grown[folder] = 0
+                self._due.discard(folder)
+        return sum(self._compact_one(folder) for folder in folders)
+
+    def _compact_one(self, folder: str) -> int:
+        try:
+            removed = self._compact(folder)
+        except Exception as e:  # keep the worker alive
+            logging.warning("❌ Paměť %s nelze zkrátit: %s", folder, e)
+            return 0
+        self.runs += 1
+        self.removed += removed
+        if removed:
+            logging.info("🧹 Z paměti %s odstraněno %d starých záznamů", folder, removed)
+        return removed
+
+    def _run(self) -> None:
+        next_run = time.monotonic() + self.interval
+        while True:
+            with self._cond:
+                while not self._due:
+                    if self.interval <= 0:
+                        self._cond.wait()
+                        continue
+                    remaining = next_run - time.monotonic()
+                    if remaining <= 0:
+                        self._due.update(self._grown)
+                        next_run = time.monotonic() + self.interval
+                        break
+                    self._cond.wait(remaining)
+                due, self._due = self._due, set()
+                for folder in due:
+                    self._grown[folder] = 0
+            for folder in sorted(due):
+                self._compact_one(folder)
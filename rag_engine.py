@@ -1,26 +1,78 @@
 import os
 import glob
 import re
+import secrets
+import shutil
+import tempfile
+import hashlib
+import json
+import mmap
+import threading
 import unicodedata
 import difflib
+import heapq
+import itertools
 import logging
-from typing import List
+import math
+import time
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List
+
+from chunking import _env_int, chunk_settings, chunk_text
+from extraction import ExtractionCache, extract_files, extract_text, list_documents
 
 # Optional dependency --------------------------------------------------------
 VECTOR_SUPPORT = False
 
+try:  # pragma: no cover - environment specific
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - missing packages
+    np = None
+
 try:  # pragma: no cover - environment specific
     import faiss  # type: ignore
+except Exception:  # pragma: no cover - missing packages
+    faiss = None
+
+# Without faiss the vectors are searched by the NumPy brute-force index.
+try:  # pragma: no cover - environment specific
     from sentence_transformers import SentenceTransformer  # type: ignore
-    VECTOR_SUPPORT = True
+    VECTOR_SUPPORT = np is not None
 except Exception:  # pragma: no cover - missing packages
     VECTOR_SUPPORT = False
 
+try:  # pragma: no cover - environment specific
+    from filelock import FileLock  # type: ignore
+except Exception:  # pragma: no cover - missing packages
+    FileLock = None
+
 __all__ = [
     "load_txt_file",
     "load_knowledge",
     "search_knowledge",
     "KnowledgeBase",
+    "LayeredKnowledgeBase",
+    "BackgroundKnowledgeBase",
+    "BM25Index",
+    "MinHashIndex",
+    "VectorIndex",
+    "NumpyIndex",
+    "choose_index_type",
+    "choose_backend",
+    "choose_codec",
+    "SEARCH_MODES",
+    "get_model",
+    "model_stats",
+    "cache_stats",
+    "EmbeddingCache",
+    "ChunkStore",
+    "EmbeddingBatcher",
+    "CorpusEncoder",
+    "get_embedding_cache",
     "get_relevant_chunks",
     "_strip_diacritics",
 ]
@@ -46,8 +98,11 @@ def _normalize(text: str) -> str:
 
 def _similarity(a: str, b: str) -> float:
     """Return an ad-hoc similarity score between *a* and *b*."""
-    norm_a = _normalize(a)
-    norm_b = _normalize(b)
+    return _normalized_similarity(_normalize(a), _normalize(b))
+
+
+def _normalized_similarity(norm_a: str, norm_b: str) -> float:
+    """Return :func:`_similarity` for already normalized strings."""
     if norm_a:
         if " " in norm_a:
             if norm_a in norm_b:
@@ -56,10 +111,16 @@ def _similarity(a: str, b: str) -> float:
             return 1.0
     ratio = difflib.SequenceMatcher(None, norm_a, norm_b).ratio()
     if set(norm_a.split()) & set(norm_b.split()):
-        ratio += 0.5
+        ratio += _SHARED_WORD_BONUS
     return min(ratio, 1.0)
 
 
+# Score added by _similarity when the texts share a word. Paragraphs sharing
+# no word with the query only reach thresholds below it through their
+# character ratio, so only then are they scanned beyond the BM25 candidates.
+_SHARED_WORD_BONUS = 0.5
+
+
 def load_txt_file(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
@@ -69,6 +130,11 @@ def load_txt_file(path: str) -> str:
 
 
 def _split_paragraphs(text: str) -> List[str]:
+    """Return the blank-line separated blocks of *text*.
+
+    Knowledge files are indexed with :func:`chunking.chunk_text`; this
+    plain split is kept for tools comparing against it.
+    """
     paragraphs = [p.strip() for p in re.split(r"\n{2,}", text) if p.strip()]
     return paragraphs
 
@@ -76,11 +142,10 @@ def _split_paragraphs(text: str) -> List[str]:
 def _load_folder(folder: str) -> List[str]:
     """Return a list of non-empty knowledge paragraphs from *folder*."""
     chunks: List[str] = []
-    for path in glob.glob(os.path.join(folder, "*.txt")):
+    for path in list_documents(folder):
         try:
-            content = load_txt_file(path)
-            for para in _split_paragraphs(content):
-                chunks.append(para)
+            content = load_txt_file(path) if path.endswith(".txt") else extract_text(path)
+            chunks.extend(chunk_text(content))
         except Exception as e:  # pragma: no cover - just log errors
             logging.error("❌ Nelze načíst %s: %s", path, e)
     return chunks
@@ -100,136 +165,2607 @@ def _env_threshold() -> float:
         return 0.7
 
 
+def _env_float(name: str, default: float) -> float:
+    """Return the float environment variable *name* or *default*."""
+    env = os.getenv(name)
+    try:
+        return float(env) if env else default
+    except ValueError:  # pragma: no cover - environment may be invalid
+        return default
+
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+
+def _env_search_mode() -> str:
+    """Return the search mode set via ``RAG_SEARCH_MODE`` or ``vector``."""
+    mode = os.getenv("RAG_SEARCH_MODE", "vector").strip().lower()
+    if mode not in SEARCH_MODES:  # pragma: no cover - environment may be invalid
+        logging.warning("⚠️ Neznámý RAG_SEARCH_MODE %s, používám vector", mode)
+        return "vector"
+    return mode
+
+
 # ---------------------------------------------------------------------------
-# Vector search implementation
+# Lexical search
 # ---------------------------------------------------------------------------
 
-class KnowledgeBase:
-    """Manage loading and searching local knowledge files using FAISS."""
+class BM25Index:
+    """Incremental Okapi BM25 inverted index over normalized tokens.
 
-    def __init__(
-        self,
-        folder: str | List[str],
-        model_name: str | None = None,
-        topics: List[str] | None = None,
-    ):
-        self.folders = [folder] if isinstance(folder, str) else list(folder)
-        self.model_name = model_name or os.getenv(
-            "RAG_MODEL", "paraphrase-multilingual-MiniLM-L12-v2"
-        )
-        if VECTOR_SUPPORT:
-            self.model = SentenceTransformer(self.model_name)
-        else:  # pragma: no cover - fallback mode
-            self.model = None
-        self.chunks: List[str] = []
-        self.index: faiss.Index | None = None
-        self.topics: List[str] | None = topics
-        self.reload(topics)
+    Documents are tokenized with :func:`_normalize`, so matching ignores
+    case, punctuation and diacritics. Query terms missing from the
+    vocabulary are expanded to close spellings before scoring.
+    """
 
-    # ------------------------------------------------------------------
-    def reload(self, topics: List[str] | None = None) -> None:
-        """(Re)load knowledge files and rebuild the vector index.
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        self._lengths: dict[int, int] = {}
+        self._total_length = 0
+        self._by_length: dict[int, set[str]] = {}
 
-        If *topics* is provided, only subdirectories matching those topics
-        are loaded. Otherwise, only files directly in the folders are used.
-        """
-        if topics is not None:
-            self.topics = topics
-        topics = self.topics
+    def __len__(self) -> int:
+        return len(self._lengths)
 
-        chunks: List[str] = []
-        for folder in self.folders:
-            if topics:
-                for topic in topics:
-                    sub = os.path.join(folder, topic)
-                    if os.path.isdir(sub):
-                        chunks.extend(_load_folder(sub))
-            else:
-                chunks.extend(_load_folder(folder))
-        self.chunks = chunks
-        if not VECTOR_SUPPORT or not chunks or self.model is None:
-            self.index = None
+    def doc_ids(self) -> List[int]:
+        """Return the ids of all indexed documents."""
+        return list(self._lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Index *text* under *doc_id*."""
+        tokens = _normalize(text).split()
+        self._lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+        counts: dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                self._by_length.setdefault(len(token), set()).add(token)
+            posting[doc_id] = tf
+
+    def remove(self, doc_id: int, text: str) -> None:
+        """Drop *doc_id* previously indexed with *text*."""
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
             return
-        embeddings = self.model.encode(
-            chunks, show_progress_bar=False, normalize_embeddings=True
+        self._total_length -= length
+        for token in set(_normalize(text).split()):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[token]
+                self._by_length[len(token)].discard(token)
+
+    def _expand(self, token: str) -> List[str]:
+        """Return vocabulary terms used to look up the query *token*."""
+        if token in self._postings:
+            return [token]
+        # Only words whose length allows a ratio above the cutoff can match.
+        cutoff = 0.75
+        low = math.ceil(len(token) * cutoff / (2 - cutoff))
+        high = math.floor(len(token) * (2 - cutoff) / cutoff)
+        near: List[str] = []
+        for length in range(low, high + 1):
+            near.extend(self._by_length.get(length, ()))
+        return difflib.get_close_matches(token, near, n=2, cutoff=cutoff)
+
+    def search(self, query: str, top_k: int | None = None) -> List[tuple[float, int]]:
+        """Return ``(bm25, doc_id)`` pairs of documents sharing a query term.
+
+        The best *top_k* documents are selected with a heap; all matching
+        documents are returned when *top_k* is ``None``.
+        """
+        if not self._lengths:
+            return []
+        n_docs = len(self._lengths)
+        avg_length = self._total_length / n_docs or 1.0
+        scores: dict[int, float] = {}
+        terms = {t for token in set(_normalize(query).split()) for t in self._expand(token)}
+        for term in terms:
+            posting = self._postings[term]
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        if top_k is None:
+            ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        else:
+            ranked = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+        return [(score, doc_id) for doc_id, score in ranked]
+
+
+def _rerank(query: str, hits: List[tuple[int, str]], threshold: float) -> List[tuple[float, int]]:
+    """Score ``(doc_id, text)`` candidates with :func:`_similarity`.
+
+    Returns ``(score, doc_id)`` pairs above *threshold*, best first.
+
+    Only the candidates returned by :class:`BM25Index` are compared, so a
+    full-phrase match still scores 1.0 without scanning the whole corpus.
+    """
+    norm_q = _normalize(query)
+    scored = []
+    for doc_id, text in hits:
+        score = _normalized_similarity(norm_q, _normalize(text))
+        if score >= threshold:
+            scored.append((score, doc_id))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+
+def _rerank_all(
+    query: str,
+    hits: List[tuple[int, str]],
+    threshold: float,
+    top_k: int,
+    docs: Callable[[], Iterable[tuple[int, str]]],
+) -> List[tuple[float, int]]:
+    """:func:`_rerank` the BM25 *hits*, adding ratio-only matches at low thresholds.
+
+    When fewer than *top_k* candidates pass a *threshold* below
+    ``_SHARED_WORD_BONUS``, the remaining documents from *docs* are scored
+    too, as the full similarity scan did before the BM25 index.
+    """
+    scored = _rerank(query, hits, threshold)
+    if len(scored) < top_k and threshold < _SHARED_WORD_BONUS:
+        seen = {doc_id for doc_id, _text in hits}
+        rest = [(doc_id, text) for doc_id, text in docs() if doc_id not in seen]
+        scored = sorted(scored + _rerank(query, rest, threshold), key=lambda x: x[0], reverse=True)
+    return scored[:top_k]
+
+
+RRF_K = 60
+
+
+def _fuse_rankings(rankings: List[List[Any]], k: int = RRF_K) -> List[tuple[float, Any]]:
+    """Merge ranked lists of chunk ids with reciprocal rank fusion.
+
+    Every list contributes ``1 / (k + rank)`` to a chunk, so results
+    found by several retrievers rise to the top without comparing their
+    incompatible raw scores.
+    """
+    scores: dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return [(score, cid) for cid, score in fused]
+
+
+# ---------------------------------------------------------------------------
+# Near-duplicate detection
+# ---------------------------------------------------------------------------
+
+_MERSENNE = (1 << 31) - 1
+
+
+def _env_dedup_threshold() -> float:
+    """Return ``RAG_DEDUP_THRESHOLD``; ``0`` turns deduplication off."""
+    return _env_float("RAG_DEDUP_THRESHOLD", 0.85)
+
+
+class MinHashIndex:
+    """LSH buckets of MinHash signatures for near-duplicate lookups.
+
+    Texts are shingled into word trigrams of :func:`_normalize` tokens, so
+    case, punctuation and diacritics do not matter. A signature keeps the
+    minimum of ``NUM_PERM`` hash permutations and is split into ``BANDS``
+    bands; texts sharing a band are compared and the share of equal
+    signature values estimates their Jaccard similarity.
+    """
+
+    NUM_PERM = 64
+    BANDS = 16
+
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+        self._rows = self.NUM_PERM // self.BANDS
+        # A fixed seed keeps saved signatures valid across processes.
+        rng = np.random.default_rng(16)
+        self._a = rng.integers(1, _MERSENNE, self.NUM_PERM, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE, self.NUM_PERM, dtype=np.uint64)
+        self._signatures: dict[Any, Any] = {}
+        self._buckets: dict[tuple[int, bytes], set] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, text: str) -> Any:
+        """Return the MinHash signature of *text* as ``uint32`` values."""
+        tokens = _normalize(text).split()
+        shingles = {" ".join(tokens[i:i + 3]) for i in range(max(len(tokens) - 2, 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)
         )
-        dim = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(embeddings.astype("float32"))
+        values = (np.outer(hashes, self._a) + self._b) % _MERSENNE
+        return values.min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature: Any) -> List[tuple[int, bytes]]:
+        rows = self._rows
+        return [(b, signature[b * rows:(b + 1) * rows].tobytes()) for b in range(self.BANDS)]
+
+    def add(self, key: Any, signature: Any) -> None:
+        self._signatures[key] = signature
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key: Any) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in self._bands(signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def find(self, signature: Any) -> Any | None:
+        """Return the most similar key at or above the threshold, if any."""
+        candidates: set = set()
+        for band in self._bands(signature):
+            candidates.update(self._buckets.get(band, ()))
+        best, best_score = None, self.threshold
+        for key in sorted(candidates):
+            score = float(np.mean(self._signatures[key] == signature))
+            if score >= best_score and (best is None or score > best_score):
+                best, best_score = key, score
+        return best
+
+    def signatures(self) -> dict[Any, Any]:
+        return self._signatures
+
+
+# ---------------------------------------------------------------------------
+# Embedding models
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _LoadedModel:
+    model: Any
+    load_seconds: float
+    param_bytes: int
+    rss_delta_bytes: int
+
+
+_models: dict[str, _LoadedModel] = {}
+_models_lock = threading.Lock()
+
+
+def _default_model_name() -> str:
+    return os.getenv("RAG_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+
+
+def _rss_bytes() -> int:
+    """Return the resident set size of this process or 0 if unknown."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:  # pragma: no cover - non-Linux systems
+        return 0
+
+
+def _param_bytes(model: Any) -> int:
+    """Return the memory taken by the parameters of a torch *model*."""
+    try:
+        return int(sum(p.numel() * p.element_size() for p in model.parameters()))
+    except Exception:
+        return 0
+
+
+def get_model(name: str | None = None) -> Any:
+    """Return the shared embedding model *name*, loading it on first use.
+
+    Models are loaded once per process and shared by every
+    :class:`KnowledgeBase` as well as :func:`search_knowledge`.
+    """
+    name = name or _default_model_name()
+    entry = _models.get(name)
+    if entry is None:
+        with _models_lock:
+            entry = _models.get(name)
+            if entry is None:
+                rss = _rss_bytes()
+                start = time.perf_counter()
+                model = SentenceTransformer(name)
+                entry = _LoadedModel(
+                    model,
+                    time.perf_counter() - start,
+                    _param_bytes(model),
+                    max(_rss_bytes() - rss, 0),
+                )
+                _models[name] = entry
+                logging.info(
+                    "✅ Model %s načten za %.1f s (%.0f MB)",
+                    name,
+                    entry.load_seconds,
+                    (entry.param_bytes or entry.rss_delta_bytes) / 2**20,
+                )
+    return entry.model
+
+
+def model_stats() -> dict[str, dict[str, float]]:
+    """Return load time and memory size of every loaded model."""
+    return {
+        name: {
+            "load_seconds": round(entry.load_seconds, 3),
+            "param_bytes": entry.param_bytes,
+            "rss_delta_bytes": entry.rss_delta_bytes,
+        }
+        for name, entry in _models.items()
+    }
+
+
+def clear_models() -> None:
+    """Forget all loaded models so the next use loads them again."""
+    with _models_lock:
+        _models.clear()
+    with _batchers_lock:
+        _batchers.clear()
+    # Vectors of the old models must not be served for the new ones.
+    clear_caches()
+
+
+# ---------------------------------------------------------------------------
+# Embedding cache
+# ---------------------------------------------------------------------------
+
+_DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rag_cache"
+)
+
+
+def _env_cache_dir() -> str:
+    """Return the cache folder set via ``RAG_CACHE_DIR``.
+
+    An empty value disables the on-disk embedding cache.
+    """
+    return os.getenv("RAG_CACHE_DIR", _DEFAULT_CACHE_DIR)
+
+
+def _chunk_key(text: str) -> str:
+    """Return the cache key for the whitespace-normalized form of *text*."""
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk store of float32 embeddings for one model.
+
+    Vectors are appended as raw rows to ``<model>.f32`` and the SHA-1 of
+    each normalized chunk is appended to ``<model>.keys`` in the same order,
+    so the line number of a key is the row of its vector. The first line of
+    the key file holds the vector dimension.
+    """
+
+    def __init__(self, folder: str, model_name: str):
+        self.folder = folder
+        self.model_name = model_name
+        base = os.path.join(folder, re.sub(r"[^\w.-]+", "_", model_name))
+        self._vec_path = base + ".f32"
+        self._key_path = base + ".keys"
+        self._file_lock = FileLock(base + ".lock") if FileLock else None
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = {}
+        self._count = 0
+        self._dim: int | None = None
+        self._key_offset = 0
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
 
     # ------------------------------------------------------------------
-    def search(
-        self,
-        query: str,
-        threshold: float | None = None,
-        top_k: int = 5,
-    ) -> List[str]:
-        """Return up to *top_k* relevant paragraphs for *query*."""
-        if not self.chunks:
-            return []
+    def _refresh(self) -> None:
+        """Read keys appended since the last call, possibly by another process."""
+        if not os.path.exists(self._key_path):
+            return
+        with open(self._key_path, "rb") as f:
+            f.seek(self._key_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        self._key_offset += end
+        for line in data[:end].decode("ascii").splitlines():
+            if self._dim is None:
+                self._dim = int(line)
+                continue
+            self._rows.setdefault(line, self._count)
+            self._count += 1
+
+    def _store(self, keys: List[str], vectors: "np.ndarray") -> None:
+        """Append *vectors* for *keys* to the cache files."""
+        os.makedirs(self.folder, exist_ok=True)
+        lock = self._file_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            self._refresh()
+            if self._dim is not None and self._dim != vectors.shape[1]:
+                return
+            header = self._dim is None
+            with open(self._vec_path, "ab") as f:
+                # Drop rows written by an interrupted append without keys.
+                f.truncate(self._count * vectors.shape[1] * 4)
+                f.write(vectors.astype("float32").tobytes())
+            with open(self._key_path, "a", encoding="ascii") as f:
+                if header:
+                    f.write(f"{vectors.shape[1]}\n")
+                f.write("".join(f"{key}\n" for key in keys))
+            self._refresh()
+        finally:
+            if lock is not None:
+                lock.release()
 
-        if VECTOR_SUPPORT and self.index is not None and self.model is not None:
-            if threshold is None:
-                threshold = _env_threshold()
-            query_vec = self.model.encode(
-                [query], show_progress_bar=False, normalize_embeddings=True
+    def _read(self, rows: List[int]) -> "np.ndarray":
+        if self._vectors is None or self._vectors.shape[0] != self._count:
+            self._vectors = np.memmap(
+                self._vec_path,
+                dtype="float32",
+                mode="r",
+                shape=(self._count, self._dim),
             )
-            scores, idx = self.index.search(query_vec.astype("float32"), top_k)
-            results = []
-            for score, i in zip(scores[0], idx[0]):
-                if score >= threshold:
-                    results.append(self.chunks[i])
-            return results
+        return np.asarray(self._vectors[rows])
 
-        # Fallback string matching
-        threshold = _env_threshold()
-        scored = [
-            (_similarity(query, chunk), chunk) for chunk in self.chunks
-        ]
-        scored = [c for c in scored if c[0] >= threshold]
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [c[1] for c in scored[:top_k]]
+    # ------------------------------------------------------------------
+    def encode(
+        self,
+        chunks: List[str],
+        encode: Callable[[List[str]], "np.ndarray"],
+    ) -> "np.ndarray":
+        """Return embeddings for *chunks*, calling *encode* only for new ones."""
+        keys = [_chunk_key(c) for c in chunks]
+        with self._lock:
+            self._refresh()
+            missing: dict[str, str] = {}
+            for key, chunk in zip(keys, chunks):
+                if key not in self._rows:
+                    missing.setdefault(key, chunk)
+            fresh: dict[str, "np.ndarray"] = {}
+            dim = self._dim or 0
+            if missing:
+                vectors = np.asarray(encode(list(missing.values())), dtype="float32")
+                fresh = dict(zip(missing, vectors))
+                dim = vectors.shape[1]
+                if self._dim is not None and self._dim != dim:
+                    logging.warning(
+                        "Embedding cache %s has dimension %s, model returned %s",
+                        self._key_path,
+                        self._dim,
+                        dim,
+                    )
+                    return np.asarray(encode(chunks), dtype="float32")
+                try:
+                    self._store(list(missing), vectors)
+                except OSError as e:  # pragma: no cover - read-only disk etc.
+                    logging.warning("❌ Nelze uložit embeddingy do cache: %s", e)
+            cached = [i for i, key in enumerate(keys) if key not in fresh]
+            self.hits += len(cached)
+            self.misses += len(keys) - len(cached)
+
+            out = np.empty((len(keys), dim), dtype="float32")
+            if cached:
+                out[cached] = self._read([self._rows[keys[i]] for i in cached])
+            for i, key in enumerate(keys):
+                if key in fresh:
+                    out[i] = fresh[key]
+            return out
+
+
+_embedding_caches: dict[tuple[str, str], EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, folder: str | None = None) -> EmbeddingCache | None:
+    """Return the shared cache for *model_name* or ``None`` when disabled."""
+    folder = _env_cache_dir() if folder is None else folder
+    if not folder or np is None:
+        return None
+    key = (os.path.abspath(folder), model_name)
+    with _embedding_caches_lock:
+        cache = _embedding_caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(folder, model_name)
+            _embedding_caches[key] = cache
+        return cache
 
 
 # ---------------------------------------------------------------------------
-# Convenience API
+# Query caches
 # ---------------------------------------------------------------------------
 
-_DEFAULT_FOLDER = os.getenv(
-    "KNOWLEDGE_DIR",
-    os.path.join(os.path.dirname(__file__), "knowledge"),
+class _LRUCache:
+    """Thread-safe LRU mapping with an optional time to live per entry."""
+
+    def __init__(self, maxsize: int, ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        """Return the value stored for *key* or ``None``."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_query_embeddings = _LRUCache(
+    _env_int("RAG_QUERY_CACHE_SIZE", 1024), _env_float("RAG_CACHE_TTL", 600)
 )
-_default_kb: KnowledgeBase | None = None
+_search_results = _LRUCache(
+    _env_int("RAG_RESULT_CACHE_SIZE", 1024), _env_float("RAG_CACHE_TTL", 600)
+)
+_kb_ids = itertools.count()
 
 
-def _get_default_kb() -> KnowledgeBase:
-    global _default_kb
-    if _default_kb is None:
-        _default_kb = KnowledgeBase(_DEFAULT_FOLDER)
-    return _default_kb
+def cache_stats() -> dict[str, dict[str, int]]:
+    """Return size and hit/miss counters of the query caches."""
+    return {
+        "query_embeddings": _query_embeddings.stats(),
+        "search_results": _search_results.stats(),
+    }
 
 
-def search_knowledge(
-    query: str, knowledge_chunks: List[str], threshold: float | None = None
-) -> List[str]:
-    """Search a list of paragraphs without creating a persistent instance."""
+def clear_caches() -> None:
+    """Drop all cached query embeddings and search results."""
+    _query_embeddings.clear()
+    _search_results.clear()
 
-    if VECTOR_SUPPORT:
-        if threshold is None:
-            threshold = _env_threshold()
-        model = SentenceTransformer(
-            os.getenv("RAG_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
-        )
-        embeddings = model.encode(
-            knowledge_chunks, show_progress_bar=False, normalize_embeddings=True
+
+# ---------------------------------------------------------------------------
+# Query batching
+# ---------------------------------------------------------------------------
+
+class _PendingQuery:
+    __slots__ = ("text", "done", "result", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class EmbeddingBatcher:
+    """Encode queries of concurrent callers together in micro-batches.
+
+    The first query starts a worker thread that waits up to *window_ms*
+    (``RAG_BATCH_WINDOW_MS``, default 5) for more queries or until
+    *max_batch* (``RAG_BATCH_SIZE``, default 32) are queued, encodes them in
+    a single call and hands every caller its row. The worker exits once the
+    queue is empty. A window of ``0`` encodes every query directly.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Any],
+        window_ms: float | None = None,
+        max_batch: int | None = None,
+    ):
+        if window_ms is None:
+            window_ms = _env_float("RAG_BATCH_WINDOW_MS", 5.0)
+        self.window = window_ms / 1000
+        self.max_batch = max_batch or _env_int("RAG_BATCH_SIZE", 32)
+        self.batches = 0
+        self.queries = 0
+        self._encode_fn = encode_fn
+        self._pending: List[_PendingQuery] = []
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+
+    def encode(self, text: str) -> Any:
+        """Return the embedding row of *text*."""
+        if self.window <= 0 or self.max_batch <= 1:
+            return self._encode_fn([text])[0]
+        item = _PendingQuery(text)
+        with self._cond:
+            self._pending.append(item)
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="rag-batcher", daemon=True
+                )
+                self._worker.start()
+            elif len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _run(self) -> None:
+        batch: List[_PendingQuery] = []
+        try:
+            while True:
+                with self._cond:
+                    if not self._pending:
+                        self._worker = None
+                        return
+                    deadline = time.monotonic() + self.window
+                    while len(self._pending) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    batch = self._pending[: self.max_batch]
+                    del self._pending[: self.max_batch]
+                try:
+                    vectors = self._encode_fn([item.text for item in batch])
+                except Exception as e:  # hand the error to every waiting caller
+                    for item in batch:
+                        item.error = e
+                        item.done.set()
+                    batch = []
+                    continue
+                self.batches += 1
+                self.queries += len(batch)
+                for item, vector in zip(batch, vectors):
+                    item.result = vector
+                    item.done.set()
+                batch = []
+        finally:
+            # Only reached with the worker still registered when a
+            # BaseException such as KeyboardInterrupt escaped the encoder:
+            # fail the waiting callers and let the next query start a worker.
+            with self._cond:
+                failed: List[_PendingQuery] = []
+                if self._worker is threading.current_thread():
+                    self._worker = None
+                    failed = batch + self._pending
+                    self._pending = []
+            for item in failed:
+                item.error = RuntimeError("query encoding was interrupted")
+                item.done.set()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": self.queries / self.batches if self.batches else 0.0,
+        }
+
+
+_batchers: dict[int, EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model: Any) -> EmbeddingBatcher:
+    """Return the query batcher shared by every user of *model*."""
+    with _batchers_lock:
+        batcher = _batchers.get(id(model))
+        if batcher is None:
+            batcher = EmbeddingBatcher(
+                lambda texts: model.encode(
+                    texts, show_progress_bar=False, normalize_embeddings=True
+                )
+            )
+            _batchers[id(model)] = batcher
+        return batcher
+
+
+def batch_stats() -> dict[str, float]:
+    """Return how many query batches were encoded and their mean size."""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    batches = sum(b.batches for b in batchers)
+    queries = sum(b.queries for b in batchers)
+    return {
+        "batches": batches,
+        "queries": queries,
+        "mean_batch": queries / batches if batches else 0.0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Corpus encoding
+# ---------------------------------------------------------------------------
+
+_MIN_POOL_CHUNKS = 1024
+
+
+def _env_encode_processes() -> int:
+    """Return ``RAG_ENCODE_PROCESSES``; ``0`` or ``auto`` means one per core."""
+    env = (os.getenv("RAG_ENCODE_PROCESSES") or "1").strip().lower()
+    if env == "auto":
+        return os.cpu_count() or 1
+    try:
+        processes = int(env)
+    except ValueError:
+        logging.warning("Invalid RAG_ENCODE_PROCESSES value: %s", env)
+        return 1
+    return processes if processes > 0 else os.cpu_count() or 1
+
+
+class CorpusEncoder:
+    """Encode the paragraphs of one build, sharded across processes.
+
+    With more than one process (``RAG_ENCODE_PROCESSES``, default ``1``)
+    lists of at least *min_chunks* texts are split between worker processes
+    started through the multi-process pool of ``sentence-transformers``;
+    each worker holds its own copy of the model. The pool is started on the
+    first large list and stopped by :meth:`close`, so the copies only live
+    as long as the build. Texts are encoded *batch_size* at a time
+    (``RAG_ENCODE_BATCH``, default ``32``).
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        processes: int | None = None,
+        batch_size: int | None = None,
+        min_chunks: int | None = None,
+    ):
+        self.model = model
+        self.processes = _env_encode_processes() if processes is None else processes
+        self.batch_size = batch_size or _env_int("RAG_ENCODE_BATCH", 32)
+        self.min_chunks = _MIN_POOL_CHUNKS if min_chunks is None else min_chunks
+        self.pool_seconds = 0.0
+        self._pool: Any = None
+        if self.processes > 1 and not hasattr(model, "start_multi_process_pool"):
+            self.processes = 1
+
+    def __enter__(self) -> "CorpusEncoder":
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.close()
+
+    def __call__(self, texts: List[str]) -> Any:
+        """Return normalized float32 embeddings of *texts*."""
+        if self.processes <= 1 or len(texts) < max(self.min_chunks, 2):
+            return self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                normalize_embeddings=True,
+            )
+        if self._pool is None:
+            start = time.perf_counter()
+            self._pool = self.model.start_multi_process_pool(
+                target_devices=["cpu"] * self.processes
+            )
+            self.pool_seconds = time.perf_counter() - start
+            logging.info(
+                "✅ %d procesů pro embeddingy spuštěno za %.1f s",
+                self.processes, self.pool_seconds,
+            )
+        vectors = np.asarray(
+            self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size),
+            dtype="float32",
         )
-        index = faiss.IndexFlatIP(embeddings.shape[1])
-        index.add(embeddings.astype("float32"))
-        q_vec = model.encode(
-            [query], show_progress_bar=False, normalize_embeddings=True
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def close(self) -> None:
+        """Stop the worker processes, if any were started."""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            self.model.stop_multi_process_pool(pool)
+
+
+# ---------------------------------------------------------------------------
+# Vector indexes
+# ---------------------------------------------------------------------------
+
+VECTOR_BACKENDS = ("faiss", "numpy")
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+_FLAT_MAX = 50_000
+_IVF_MAX = 1_000_000
+_MIN_TRAIN = {"ivf": 1_000, "ivfpq": 10_000}
+_HNSW_M = 32
+_MAX_TOMBSTONES = 0.2
+
+VECTOR_CODECS = ("none", "fp16", "int8", "pq")
+_SQ_CODES = {"none": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+_MIN_PQ = 10_000
+_MIN_PCA = 1_000
+_PCA_SAMPLE = 20_000
+
+
+def choose_backend(backend: str | None = None) -> str:
+    """Return the library the vector indexes are built with.
+
+    *backend* defaults to ``RAG_VECTOR_BACKEND``. ``auto`` uses faiss when
+    it is installed and the exact :class:`NumpyIndex` otherwise.
+    """
+    backend = (backend or os.getenv("RAG_VECTOR_BACKEND") or "auto").strip().lower()
+    if backend not in VECTOR_BACKENDS and backend != "auto":  # pragma: no cover
+        logging.warning("⚠️ Neznámý RAG_VECTOR_BACKEND %s, používám auto", backend)
+        backend = "auto"
+    if backend == "faiss" and faiss is None:  # pragma: no cover - missing package
+        logging.warning("⚠️ faiss není nainstalován, používám numpy")
+        backend = "numpy"
+    if backend == "auto":
+        backend = "numpy" if faiss is None else "faiss"
+    return backend
+
+
+def build_index(vectors: Any, ids: Any) -> "VectorIndex | NumpyIndex":
+    """Return an index of the backend chosen by :func:`choose_backend`."""
+    if choose_backend() == "numpy":
+        return NumpyIndex.build(vectors, ids)
+    return VectorIndex.build(vectors, ids)
+
+
+def choose_index_type(size: int, kind: str | None = None) -> str:
+    """Return the index type used for a corpus of *size* vectors.
+
+    *kind* defaults to ``RAG_INDEX_TYPE``. ``auto`` keeps the exact flat
+    index below 50k vectors, uses IVF-Flat up to a million and IVF-PQ above.
+    The trained types fall back to ``flat`` until there are enough vectors
+    to train them.
+    """
+    kind = (kind or os.getenv("RAG_INDEX_TYPE") or "auto").strip().lower()
+    if kind == "auto":
+        kind = "flat" if size < _FLAT_MAX else "ivf" if size < _IVF_MAX else "ivfpq"
+    elif kind not in INDEX_TYPES:  # pragma: no cover - environment may be invalid
+        logging.warning("⚠️ Neznámý RAG_INDEX_TYPE %s, používám flat", kind)
+        return "flat"
+    if size < _MIN_TRAIN.get(kind, 0):
+        return "flat"
+    return kind
+
+
+def choose_codec(size: int, codec: str | None = None) -> str:
+    """Return how vectors of a corpus of *size* are stored.
+
+    *codec* defaults to ``RAG_VECTOR_CODEC``: ``none`` keeps float32,
+    ``fp16`` and ``int8`` quantize every component and ``pq`` stores
+    product quantization codes. ``pq`` falls back to ``int8`` until there
+    are enough vectors to train it.
+    """
+    codec = (codec or os.getenv("RAG_VECTOR_CODEC") or "none").strip().lower()
+    if codec not in VECTOR_CODECS:  # pragma: no cover - environment may be invalid
+        logging.warning("⚠️ Neznámý RAG_VECTOR_CODEC %s, používám none", codec)
+        return "none"
+    if codec == "pq" and size < _MIN_PQ:
+        return "int8"
+    return codec
+
+
+def choose_pca_dim(dim: int, size: int, pca_dim: int | None = None) -> int:
+    """Return the reduced dimension (``RAG_PCA_DIM``) or ``0`` to keep *dim*."""
+    pca_dim = _env_int("RAG_PCA_DIM", 0) if pca_dim is None else pca_dim
+    if not 0 < pca_dim < dim or size < _MIN_PCA:
+        return 0
+    return pca_dim
+
+
+def _pca_transform(train: Any, pca_dim: int) -> Any:
+    """Return a projection onto the top *pca_dim* principal axes of *train*.
+
+    The data is not centred, unlike ``faiss.PCAMatrix``, so inner products
+    of the projected vectors keep approximating those of the originals.
+    """
+    sample = train[:: max(1, len(train) // _PCA_SAMPLE)]
+    _u, _s, vt = np.linalg.svd(sample, full_matrices=False)
+    transform = faiss.LinearTransform(train.shape[1], pca_dim, False)
+    faiss.copy_array_to_vector(np.ascontiguousarray(vt[:pca_dim], dtype="float32").ravel(), transform.A)
+    transform.is_trained = True
+    return transform
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Return the largest number of PQ sub-vectors (at most 64) dividing *dim*."""
+    return next(m for m in range(min(64, dim), 0, -1) if dim % m == 0)
+
+
+class VectorIndex:
+    """ID-mapped inner product faiss index of a configurable type.
+
+    ``ivf`` and ``ivfpq`` are trained on the vectors passed as *train*; their
+    ``nprobe`` comes from ``RAG_NPROBE``. ``hnsw`` uses ``RAG_EF_SEARCH`` and,
+    as HNSW graphs cannot delete vectors, keeps removed ids as tombstones
+    that are filtered from the results until the index is rebuilt.
+
+    *codec* (see :func:`choose_codec`) selects how the vectors are stored
+    and a non-zero *pca_dim* projects them to fewer dimensions first.
+    Codecs and projections that need training are trained on *train* too.
+    """
+
+    backend = "faiss"
+
+    def __init__(
+        self, kind: str, dim: int, train: Any = None, codec: str = "none", pca_dim: int = 0
+    ):
+        self.kind = kind
+        self.dim = dim
+        self.codec = codec
+        self.pca_dim = pca_dim
+        self.trained_size = 0
+        size = pca_dim or dim
+        if kind == "ivfpq" or codec == "pq":
+            codes = f"PQ{_pq_subquantizers(size)}"
+        else:
+            codes = _SQ_CODES[codec]
+        if kind == "flat":
+            spec = codes
+        elif kind in ("ivf", "ivfpq"):
+            nlist = max(1, min(int(4 * math.sqrt(len(train))), len(train) // 39))
+            spec = f"IVF{nlist},{codes}"
+        elif kind == "hnsw":
+            spec = f"HNSW{_HNSW_M}" + ("" if codes == "Flat" else "_" + codes)
+        else:
+            raise ValueError(f"Unknown index type: {kind}")
+        base = faiss.index_factory(size, spec, faiss.METRIC_INNER_PRODUCT)
+        if pca_dim:
+            base = faiss.IndexPreTransform(_pca_transform(train, pca_dim), base)
+        if not base.is_trained:
+            base.train(train)
+            self.trained_size = len(train)
+        self.index = faiss.IndexIDMap2(base)
+        self._configure()
+        self._deleted: set[int] = set()
+
+    @classmethod
+    def build(
+        cls, vectors: Any, ids: Any, kind: str | None = None, codec: str | None = None
+    ) -> "VectorIndex":
+        """Return an index of the type chosen for ``len(vectors)`` holding *vectors*."""
+        size, dim = vectors.shape
+        index = cls(
+            choose_index_type(size, kind),
+            dim,
+            vectors,
+            choose_codec(size, codec),
+            choose_pca_dim(dim, size),
         )
-        scores, idx = index.search(
-            q_vec.astype("float32"), min(5, len(knowledge_chunks))
+        index.add(vectors, ids)
+        return index
+
+    @classmethod
+    def restore(
+        cls,
+        index: Any,
+        kind: str,
+        trained_size: int = 0,
+        deleted: List[int] | None = None,
+        codec: str = "none",
+        pca_dim: int = 0,
+    ) -> "VectorIndex":
+        """Wrap an ``IndexIDMap2`` read by ``faiss.read_index``."""
+        self = cls.__new__(cls)
+        self.kind = kind
+        self.dim = index.d
+        self.codec = codec
+        self.pca_dim = pca_dim
+        self.trained_size = trained_size
+        self.index = index
+        self._configure()
+        self._deleted = set(deleted or [])
+        return self
+
+    def save(self, path: str) -> dict[str, Any]:
+        """Write the index to *path* and return the metadata :meth:`load` needs."""
+        _write_atomic(path, lambda tmp: faiss.write_index(self.index, tmp))
+        return {
+            "kind": self.kind,
+            "codec": self.codec,
+            "pca_dim": self.pca_dim,
+            "trained_size": self.trained_size,
+            "deleted": sorted(self._deleted),
+            "ntotal": int(self.index.ntotal),
+        }
+
+    @classmethod
+    def load(cls, path: str, info: dict[str, Any], mmap: bool = False) -> "VectorIndex":
+        """Read an index written by :meth:`save`, memory mapping it if *mmap*."""
+        raw = faiss.read_index(path, faiss.IO_FLAG_MMAP if mmap else 0)
+        if raw.ntotal != info["ntotal"]:
+            raise ValueError(f"{os.path.basename(path)} does not match meta.json")
+        return cls.restore(
+            raw,
+            info["kind"],
+            info["trained_size"],
+            info["deleted"],
+            info.get("codec", "none"),
+            info.get("pca_dim", 0),
+        )
+
+    def _configure(self) -> None:
+        """Apply ``RAG_NPROBE`` or ``RAG_EF_SEARCH`` to the wrapped index."""
+        if self.kind in _MIN_TRAIN:
+            ivf = faiss.extract_index_ivf(self.index)
+            ivf.nprobe = min(ivf.nlist, _env_int("RAG_NPROBE", 32))
+        elif self.kind == "hnsw":
+            faiss.ParameterSpace().set_index_parameter(
+                self.index, "efSearch", _env_int("RAG_EF_SEARCH", 64)
+            )
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal - len(self._deleted)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """Whether the corpus outgrew this index or holds too many tombstones."""
+        if choose_index_type(self.ntotal) != self.kind:
+            return True
+        if choose_codec(self.ntotal) != self.codec:
+            return True
+        if choose_pca_dim(self.dim, self.ntotal) != self.pca_dim:
+            return True
+        if self.trained_size and self.ntotal > 4 * self.trained_size:
+            return True
+        return len(self._deleted) > self.index.ntotal * _MAX_TOMBSTONES
+
+    def add(self, vectors: Any, ids: Any) -> None:
+        self.index.add_with_ids(vectors, ids)
+
+    def remove(self, ids: List[int]) -> None:
+        if self.kind == "hnsw":
+            self._deleted.update(ids)
+        else:
+            self.index.remove_ids(np.asarray(ids, dtype="int64"))
+
+    def search(self, vectors: Any, k: int) -> tuple[Any, Any]:
+        """Return ``(scores, ids)`` of the *k* nearest vectors, ``-1`` padded."""
+        if not self._deleted:
+            return self.index.search(vectors, k)
+        scores, ids = self.index.search(vectors, k + len(self._deleted))
+        keep = ~np.isin(ids, np.fromiter(self._deleted, dtype="int64"))
+        out_scores = np.full((len(ids), k), -np.inf, dtype="float32")
+        out_ids = np.full((len(ids), k), -1, dtype="int64")
+        for row in range(len(ids)):
+            row_scores = scores[row][keep[row]][:k]
+            out_scores[row, : len(row_scores)] = row_scores
+            out_ids[row, : len(row_scores)] = ids[row][keep[row]][:k]
+        return out_scores, out_ids
+
+
+class NumpyIndex:
+    """Exact inner product index over one contiguous float32 matrix.
+
+    Used in place of :class:`VectorIndex` when faiss is not installed. The
+    normalized vectors are kept in a matrix that grows by doubling, and
+    removing a vector moves the last row into its place, so there are no
+    tombstones. A search scores every vector of all queries with one matrix
+    product and selects the top *k* of each query with ``argpartition``.
+    ``RAG_VECTOR_CODEC`` and ``RAG_PCA_DIM`` do not apply to this backend.
+    """
+
+    backend = "numpy"
+    kind = "flat"
+    codec = "none"
+    pca_dim = 0
+    trained_size = 0
+    needs_rebuild = False
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.empty((0, dim), dtype="float32")
+        self._ids = np.empty(0, dtype="int64")
+        self._rows: dict[int, int] = {}
+
+    @classmethod
+    def build(cls, vectors: Any, ids: Any, *_args: Any) -> "NumpyIndex":
+        """Return an index holding *vectors* under *ids*."""
+        index = cls(vectors.shape[1])
+        index.add(vectors, ids)
+        return index
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory taken by the live vectors and ids."""
+        return self.ntotal * (self.dim * 4 + 8)
+
+    def _reserve(self, size: int) -> None:
+        """Make room for *size* rows in writable arrays."""
+        capacity = len(self._vectors)
+        if size <= capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(size, 2 * capacity if size > capacity else capacity, 64)
+        vectors = np.empty((capacity, self.dim), dtype="float32")
+        ids = np.empty(capacity, dtype="int64")
+        vectors[: self.ntotal] = self._vectors[: self.ntotal]
+        ids[: self.ntotal] = self._ids[: self.ntotal]
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, vectors: Any, ids: Any) -> None:
+        vectors = np.asarray(vectors, dtype="float32")
+        start = self.ntotal
+        self._reserve(start + len(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._vectors[start:start + len(vectors)] = vectors / np.maximum(norms, 1e-12)
+        self._ids[start:start + len(vectors)] = ids
+        for row, cid in enumerate(np.asarray(ids).tolist(), start):
+            self._rows[cid] = row
+
+    def remove(self, ids: List[int]) -> None:
+        self._reserve(self.ntotal)
+        for cid in ids:
+            row = self._rows.pop(int(cid), None)
+            if row is None:
+                continue
+            last = len(self._rows)
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._rows[int(self._ids[row])] = row
+
+    def search(self, vectors: Any, k: int) -> tuple[Any, Any]:
+        """Return ``(scores, ids)`` of the *k* nearest vectors, ``-1`` padded."""
+        queries = np.asarray(vectors, dtype="float32").reshape(-1, self.dim)
+        out_scores = np.full((len(queries), k), -np.inf, dtype="float32")
+        out_ids = np.full((len(queries), k), -1, dtype="int64")
+        size = self.ntotal
+        if not size or k <= 0:
+            return out_scores, out_ids
+        scores = queries @ self._vectors[:size].T
+        top = min(k, size)
+        if top < size:
+            rows = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        else:
+            rows = np.broadcast_to(np.arange(size), (len(queries), size))
+        picked = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-picked, axis=1, kind="stable")
+        out_scores[:, :top] = np.take_along_axis(picked, order, axis=1)
+        out_ids[:, :top] = self._ids[np.take_along_axis(rows, order, axis=1)]
+        return out_scores, out_ids
+
+    def save(self, path: str) -> dict[str, Any]:
+        """Write the vectors to *path* and the ids next to it."""
+        size = self.ntotal
+        with_ids = path[: -len(".npy")] + ".ids.npy"
+        _write_atomic(path, lambda tmp: _save_array(tmp, self._vectors[:size]))
+        _write_atomic(with_ids, lambda tmp: _save_array(tmp, self._ids[:size]))
+        return {"kind": self.kind, "ntotal": size}
+
+    @classmethod
+    def load(cls, path: str, info: dict[str, Any], mmap: bool = False) -> "NumpyIndex":
+        """Read an index written by :meth:`save`, memory mapping the vectors if *mmap*."""
+        vectors = np.load(path, mmap_mode="r" if mmap else None)
+        ids = np.load(path[: -len(".npy")] + ".ids.npy")
+        if len(vectors) != info["ntotal"] or len(ids) != len(vectors):
+            raise ValueError(f"{os.path.basename(path)} does not match meta.json")
+        self = cls(vectors.shape[1])
+        self._vectors = vectors
+        self._ids = ids
+        self._rows = {cid: row for row, cid in enumerate(ids.tolist())}
+        return self
+
+
+def _save_array(path: str, array: Any) -> None:
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+# ---------------------------------------------------------------------------
+# Chunk store
+# ---------------------------------------------------------------------------
+
+class ChunkStore:
+    """Paragraph texts kept in one memory-mapped UTF-8 blob.
+
+    Chunk ids are positions in compact arrays of blob offsets, byte lengths
+    (``-1`` once removed), source file ids and topic ids. Texts are decoded
+    from the mmap on demand, so the corpus lives in the page cache, which
+    forked workers share, instead of in Python strings. Removed chunks keep
+    their bytes until the store is rebuilt. The ids of every topic are
+    also kept in an array of their own, so a single topic is listed
+    without walking the whole store.
+
+    The blob is appended to *path*, or to an anonymous temporary file when
+    no path is given. A store opened from a snapshot copies its blob to a
+    new file before the first append, because other processes may map it.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._file = open(path, "w+b") if path else tempfile.TemporaryFile()
+        self._writable = True
+        self._size = 0
+        self._mmap: mmap.mmap | None = None
+        self._offsets = array("q")
+        self._lengths = array("i")
+        self._file_ids = array("i")
+        self._topic_ids = array("i")
+        self.files: List[str] = []
+        self.topics: List[str | None] = [None]
+        self._file_index: dict[str, int] = {}
+        self._topic_index: dict[str | None, int] = {None: 0}
+        self._topic_chunks: List[array] = [array("i")]
+        self._live = 0
+        self._lock = threading.Lock()
+        _register_store(self)
+
+    # ------------------------------------------------------------------
+    def add(self, text: str, source: str, topic: str | None = None) -> int:
+        """Append *text* read from *source* and return its chunk id."""
+        data = text.encode("utf-8")
+        with self._lock:
+            if not self._writable:
+                self._detach()
+            self._file.seek(self._size)
+            self._file.write(data)
+            self._offsets.append(self._size)
+            self._lengths.append(len(data))
+            self._file_ids.append(self._intern(self._file_index, self.files, source))
+            tid = self._intern(self._topic_index, self.topics, topic)
+            self._topic_ids.append(tid)
+            if tid == len(self._topic_chunks):
+                self._topic_chunks.append(array("i"))
+            cid = len(self._offsets) - 1
+            self._topic_chunks[tid].append(cid)
+            self._size += len(data)
+            self._live += 1
+            return cid
+
+    def remove(self, cid: int) -> None:
+        if self._lengths[cid] >= 0:
+            self._lengths[cid] = -1
+            self._live -= 1
+
+    def get(self, cid: int) -> str:
+        """Return the text of chunk *cid*."""
+        length = self._lengths[cid]
+        if length < 0:
+            raise KeyError(cid)
+        offset = self._offsets[cid]
+        view = self._mmap
+        if view is None or offset + length > len(view):
+            view = self._remap()
+        return view[offset:offset + length].decode("utf-8")
+
+    def source(self, cid: int) -> str:
+        """Return the path of the file chunk *cid* was read from."""
+        return self.files[self._file_ids[cid]]
+
+    def topic(self, cid: int) -> str | None:
+        return self.topics[self._topic_ids[cid]]
+
+    def ids(self, topic: Any = ...) -> List[int]:
+        """Return ids of all live chunks, optionally only those of *topic*."""
+        if topic is ...:
+            return [cid for cid, length in enumerate(self._lengths) if length >= 0]
+        tid = self._topic_index.get(topic)
+        if tid is None:
+            return []
+        return [cid for cid in self._topic_chunks[tid] if self._lengths[cid] >= 0]
+
+    def __contains__(self, cid: int) -> bool:
+        return 0 <= cid < len(self._lengths) and self._lengths[cid] >= 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    @property
+    def next_id(self) -> int:
+        return len(self._offsets)
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _intern(index: dict, table: list, value: Any) -> int:
+        pos = index.get(value)
+        if pos is None:
+            pos = index[value] = len(table)
+            table.append(value)
+        return pos
+
+    def _remap(self) -> mmap.mmap | None:
+        with self._lock:
+            self._file.flush()
+            if self._size:
+                self._mmap = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+            return self._mmap
+
+    def _detach(self) -> None:
+        """Continue in a private copy of a blob opened from a snapshot."""
+        path = _new_blob_path(os.path.dirname(self.path))
+        # Copy from the open file, the snapshot may have replaced the blob.
+        self._file.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(self._file, f)
+        self._file.close()
+        self._file = open(path, "r+b")
+        self.path = path
+        self._writable = True
+        self._mmap = None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    # ------------------------------------------------------------------
+    def save_index(self, path: str) -> dict[str, Any]:
+        """Write the chunk arrays to *path* and return the metadata to keep."""
+
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                for arr in (self._offsets, self._lengths, self._file_ids, self._topic_ids):
+                    arr.tofile(f)
+
+        self.flush()
+        _write_atomic(path, write)
+        return {
+            "blob": os.path.basename(self.path or ""),
+            "size": self._size,
+            "count": len(self._offsets),
+            "files": self.files,
+            "topics": self.topics,
+        }
+
+    @classmethod
+    def open(cls, folder: str, index_path: str, meta: dict[str, Any]) -> "ChunkStore":
+        """Open a store saved by :meth:`save_index` without copying the blob."""
+        self = cls.__new__(cls)
+        self.path = os.path.join(folder, meta["blob"])
+        self._file = open(self.path, "rb")
+        self._writable = False
+        self._size = meta["size"]
+        if os.path.getsize(self.path) < self._size:
+            self._file.close()
+            raise ValueError(f"{meta['blob']} is shorter than recorded")
+        self._mmap = None
+        count = meta["count"]
+        with open(index_path, "rb") as f:
+            raw = f.read()
+        arrays, pos = [], 0
+        for code in ("q", "i", "i", "i"):
+            arr = array(code)
+            end = pos + count * arr.itemsize
+            arr.frombytes(raw[pos:end])
+            arrays.append(arr)
+            pos = end
+        if pos != len(raw):
+            self._file.close()
+            raise ValueError(f"{os.path.basename(index_path)} does not match its metadata")
+        self._offsets, self._lengths, self._file_ids, self._topic_ids = arrays
+        self.files = list(meta["files"])
+        self.topics = list(meta["topics"])
+        self._file_index = {f: i for i, f in enumerate(self.files)}
+        self._topic_index = {t: i for i, t in enumerate(self.topics)}
+        self._topic_chunks = [array("i") for _ in self.topics]
+        for cid, tid in enumerate(self._topic_ids):
+            self._topic_chunks[tid].append(cid)
+        self._live = sum(1 for length in self._lengths if length >= 0)
+        self._lock = threading.Lock()
+        _register_store(self)
+        return self
+
+
+def _new_blob_path(folder: str) -> str:
+    return os.path.join(folder, f"chunks-{secrets.token_hex(6)}.bin")
+
+
+# Chunk stores alive in this process, whose blobs must not be deleted.
+_open_stores: "weakref.WeakSet[ChunkStore]" = weakref.WeakSet()
+_open_stores_lock = threading.Lock()
+
+
+def _register_store(store: ChunkStore) -> None:
+    with _open_stores_lock:
+        _open_stores.add(store)
+
+
+def _blobs_in_use() -> set[str]:
+    """Return the absolute paths of the blobs of all open chunk stores."""
+    with _open_stores_lock:
+        return {os.path.abspath(s.path) for s in _open_stores if s.path}
+
+
+# ---------------------------------------------------------------------------
+# Index snapshots
+# ---------------------------------------------------------------------------
+
+_DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rag_index"
+)
+_SNAPSHOT_VERSION = 3
+_ENCODE_STEP = 1024
+
+
+def _env_index_dir() -> str:
+    """Return the snapshot folder set via ``RAG_INDEX_DIR``.
+
+    An empty value disables saving and loading index snapshots.
+    """
+    return os.getenv("RAG_INDEX_DIR", _DEFAULT_INDEX_DIR)
+
+
+def _index_file_name(topic: str | None, backend: str = "faiss") -> str:
+    ext = ".faiss" if backend == "faiss" else ".npy"
+    if topic is None:
+        return "index" + ext
+    return "topic-" + re.sub(r"[^\w.-]+", "_", topic) + ext
+
+
+def _write_atomic(path: str, write: Callable[[str], None]) -> None:
+    """Call ``write(tmp_path)`` and move the result over *path*."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _remove_stale_blobs(folder: str, keep: str) -> None:
+    """Delete chunk blobs of older snapshots that no open store uses.
+
+    Only the stores of this process are known. Other processes keep
+    reading a deleted blob through their open file and its mmap.
+    """
+    in_use = _blobs_in_use()
+    for path in glob.glob(os.path.join(folder, "chunks-*.bin")):
+        if os.path.basename(path) == keep or os.path.abspath(path) in in_use:
+            continue
+        try:
+            os.remove(path)
+        except OSError:  # pragma: no cover - still mapped on Windows
+            pass
+
+
+def _write_json(path: str, data: Any) -> None:
+    def write(tmp: str) -> None:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    _write_atomic(path, write)
+
+
+# ---------------------------------------------------------------------------
+# Vector search implementation
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _FileEntry:
+    """Manifest record of one indexed knowledge file."""
+
+    size: int
+    mtime: int
+    sha256: str
+    topic: str | None = None
+    chunk_ids: List[int] = field(default_factory=list)
+
+
+def _index_topics(folder: str) -> List[str]:
+    """Return the topic names listed in ``_index.json`` inside *folder*."""
+    path = os.path.join(folder, "_index.json")
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:  # pragma: no cover - ignore invalid index
+        return []
+    if isinstance(data, dict):
+        return [str(t) for t in data]
+    if isinstance(data, list):  # pragma: no cover - alternate format
+        return [str(t) for t in data]
+    return []
+
+
+class KnowledgeBase:
+    """Manage loading and searching local knowledge files using vector indexes.
+
+    Every indexed file is tracked in a manifest of size, modification time
+    and content hash. :meth:`update` compares the manifest with the disk and
+    only encodes chunks that were added, removing vectors of deleted
+    chunks from the ID-mapped index. Files are split with
+    :func:`chunking.chunk_text`.
+
+    Files directly inside the folders and those in the topic subfolders
+    listed in ``_index.json`` are indexed together. Each topic keeps its own
+    sub-index so that a topic filter only searches the selected topics.
+
+    The vector indexes are faiss indexes or, without faiss, exact
+    :class:`NumpyIndex` instances (see :func:`choose_backend`).
+
+    ``mode`` (default ``RAG_SEARCH_MODE``) selects vector, lexical or hybrid
+    search. Every search can ask for another mode, so the BM25 indexes are
+    built together with the vector indexes. *extra_topics* are indexed in
+    addition to ``topics`` and the topics of ``_index.json``. An instance
+    is never extended while it serves searches, :class:`BackgroundKnowledgeBase`
+    builds a successor.
+
+    With vector support the indexes, paragraphs and manifest are saved to
+    ``index_dir`` (default ``RAG_INDEX_DIR``) after every change. A new
+    instance for the same folders and model loads that snapshot, memory
+    mapping the indexes unless ``RAG_INDEX_MMAP=0``, and then only applies
+    the files changed since.
+
+    Chunks of one topic that are near-duplicates of an indexed chunk
+    (MinHash similarity of at least ``RAG_DEDUP_THRESHOLD``, default
+    ``0.85``) are not indexed again. They are kept as aliases of that
+    canonical chunk, whose search results list the sources of all copies.
+
+    *on_progress* is called as ``on_progress(phase, done, total)`` while
+    files are scanned, extracted, chunked and embedded. *load_snapshot*
+    ``False`` skips the saved snapshot and rebuilds everything.
+    """
+
+    def __init__(
+        self,
+        folder: str | List[str],
+        model_name: str | None = None,
+        topics: List[str] | None = None,
+        cache_dir: str | None = None,
+        model: Any = None,
+        mode: str | None = None,
+        index_dir: str | None = None,
+        on_progress: Callable[[str, int, int], None] | None = None,
+        load_snapshot: bool = True,
+        extra_topics: Iterable[str] = (),
+    ):
+        self.folders = [folder] if isinstance(folder, str) else list(folder)
+        self.model_name = model_name or _default_model_name()
+        self.cache_dir = _env_cache_dir() if cache_dir is None else cache_dir
+        self.index_dir = _env_index_dir() if index_dir is None else index_dir
+        self._model = model
+        self.manifest: dict[str, _FileEntry] = {}
+        self._indexes: dict[str | None, Any] = {}
+        self._lexical: dict[str | None, BM25Index] = {}
+        self._store = ChunkStore()
+        self._extra_topics: set[str] = set(extra_topics)
+        self._known_topics: set[str] = set()
+        self.topics: List[str] | None = topics
+        self.mode = mode or _env_search_mode()
+        self.generation = 0
+        self._uid = next(_kb_ids)
+        self._dedup_threshold = _env_dedup_threshold() if np is not None else 0.0
+        self._dedup: dict[str | None, MinHashIndex] | None = {}
+        self._canonical: dict[int, int] = {}
+        self._aliases: dict[int, List[int]] = {}
+        self._on_progress = on_progress
+        if load_snapshot and self._load_snapshot():
+            self.update()
+        else:
+            self.reload(topics)
+
+    def successor(
+        self,
+        topics: List[str] | None = None,
+        full: bool = False,
+        on_progress: Callable[[str, int, int], None] | None = None,
+        extra_topics: Iterable[str] = (),
+    ) -> "KnowledgeBase":
+        """Return a new instance with the files changed since this one.
+
+        The new instance starts from the snapshot saved by this one, or
+        from scratch when *full* is set or snapshots are disabled. It also
+        indexes *extra_topics*. This instance is left untouched and can keep serving searches.
+        """
+        return KnowledgeBase(
+            self.folders,
+            self.model_name,
+            self.topics if topics is None else topics,
+            self.cache_dir,
+            self._model,
+            self.mode,
+            self.index_dir,
+            on_progress,
+            load_snapshot=not full,
+            extra_topics=self._extra_topics | set(extra_topics),
+        )
+
+    @property
+    def chunks(self) -> List[str]:
+        """Return all indexed paragraphs."""
+        return [self._store.get(cid) for cid in self._indexed_ids()]
+
+    @property
+    def duplicates(self) -> int:
+        """Return the number of chunks collapsed into a canonical chunk."""
+        return len(self._canonical)
+
+    def stats(self) -> dict[str, int]:
+        """Return the number of indexed files, chunks and collapsed duplicates."""
+        return {
+            "files": len(self.manifest),
+            "chunks": len(self._store) - len(self._canonical),
+            "duplicates": len(self._canonical),
+        }
+
+    @property
+    def index(self) -> Any:
+        """Return the vector index of files directly inside the folders."""
+        return self._indexes.get(None)
+
+    def missing_topics(self, topics: List[str] | None = None) -> List[str]:
+        """Return topics of the *topics* filter that exist but are not indexed."""
+        if topics is None:
+            topics = self.topics
+        return [
+            t for t in topics or []
+            if t not in self._known_topics
+            and any(os.path.isdir(os.path.join(f, t)) for f in self.folders)
+        ]
+
+    @property
+    def model(self) -> Any:
+        """Return the embedding model, loading the shared instance lazily."""
+        if self._model is not None:
+            return self._model
+        if not VECTOR_SUPPORT:  # pragma: no cover - fallback mode
+            return None
+        return get_model(self.model_name)
+
+    # ------------------------------------------------------------------
+    def _indexed_topics(self) -> List[str]:
+        """Return every topic that gets its own sub-index."""
+        topics = dict.fromkeys(self.topics or [])
+        for folder in self.folders:
+            topics.update(dict.fromkeys(_index_topics(folder)))
+        topics.update(dict.fromkeys(sorted(self._extra_topics)))
+        return list(topics)
+
+    def _iter_files(self, topics: List[str]) -> List[tuple[str, str | None]]:
+        """Return ``(path, topic)`` of all knowledge files of this instance."""
+        files: List[tuple[str, str | None]] = []
+        for folder in self.folders:
+            for path in list_documents(folder):
+                files.append((path, None))
+            for topic in topics:
+                for path in list_documents(os.path.join(folder, topic)):
+                    files.append((path, topic))
+        return files
+
+    # ------------------------------------------------------------------
+    def reload(self, topics: List[str] | None = None) -> None:
+        """(Re)load knowledge files and rebuild the vector index.
+
+        If *topics* is provided, searches without an explicit topic filter
+        only look into those topic subfolders. Otherwise, only files
+        directly in the folders are searched by default.
+        """
+        if topics is not None:
+            self.topics = topics
+        self.manifest = {}
+        self._indexes = {}
+        self._lexical = {}
+        self._store = self._new_store()
+        self._dedup = {}
+        self._canonical = {}
+        self._aliases = {}
+        self.generation += 1
+        self.update()
+
+    def update(self) -> dict[str, int]:
+        """Bring the index in line with the files on disk.
+
+        Added files have their paragraphs inserted, removed files have their
+        vectors deleted and changed files are diffed paragraph by paragraph.
+        Returns the number of ``added``, ``changed`` and ``removed`` files.
+        """
+        stats = {"added": 0, "changed": 0, "removed": 0}
+        new_texts: dict[int, str] = {}
+        removed_ids: List[int] = []
+
+        topics = self._indexed_topics()
+        self._known_topics = set(topics)
+        current = set()
+        changed: List[tuple[str, str | None, os.stat_result, str, str | None]] = []
+        files = self._iter_files(topics)
+        for done, (path, topic) in enumerate(files, start=1):
+            self._report("scan", done, len(files))
+            current.add(path)
+            try:
+                st = os.stat(path)
+                old = self.manifest.get(path)
+                if old and old.size == st.st_size and old.mtime == st.st_mtime_ns:
+                    continue
+                with open(path, "rb") as f:
+                    raw = f.read()
+                sha = hashlib.sha256(raw).hexdigest()
+                if old and old.sha256 == sha:
+                    old.size, old.mtime = st.st_size, st.st_mtime_ns
+                    continue
+                text = None
+                if path.lower().endswith((".txt", ".md")):
+                    text = raw.decode("utf-8").replace("\r\n", "\n")
+                changed.append((path, topic, st, sha, text))
+            except Exception as e:  # pragma: no cover - just log errors
+                logging.error("❌ Nelze načíst %s: %s", path, e)
+
+        # PDF and DOCX files are extracted in parallel and cached by hash.
+        documents = [(path, sha) for path, _t, _st, sha, text in changed if text is None]
+        extracted = {}
+        if documents:
+            self._report("extract", 0, len(documents))
+            extracted = extract_files(documents, self._extraction_cache())
+            self._report("extract", len(documents), len(documents))
+
+        for done, (path, topic, st, sha, text) in enumerate(changed, start=1):
+            self._report("chunk", done, len(changed))
+            if text is None:
+                if path not in extracted:
+                    continue
+                text = extracted[path].replace("\r\n", "\n")
+            paragraphs = chunk_text(text)
+            old = self.manifest.get(path)
+
+            # Reuse ids of paragraphs that survived the edit.
+            pool: dict[str, List[int]] = {}
+            for cid in old.chunk_ids if old else []:
+                pool.setdefault(self._store.get(cid), []).append(cid)
+            ids: List[int] = []
+            for para in paragraphs:
+                reuse = pool.get(para)
+                if reuse:
+                    ids.append(reuse.pop())
+                    continue
+                cid = self._store.add(para, path, topic)
+                new_texts[cid] = para
+                ids.append(cid)
+            for stale in pool.values():
+                removed_ids.extend(stale)
+            self.manifest[path] = _FileEntry(
+                st.st_size, st.st_mtime_ns, sha, topic, ids
+            )
+            stats["changed" if old else "added"] += 1
+
+        for path in [p for p in self.manifest if p not in current]:
+            removed_ids.extend(self.manifest.pop(path).chunk_ids)
+            stats["removed"] += 1
+
+        texts, unindexed = self._deduplicate(new_texts, removed_ids)
+        self._update_index(texts, unindexed, removed_ids)
+        self._update_lexical(texts, unindexed)
+        for cid in removed_ids:
+            self._store.remove(cid)
+        if new_texts or removed_ids:
+            self.generation += 1
+            self._save_snapshot()
+        return stats
+
+    # ------------------------------------------------------------------
+    def _snapshot_dir(self) -> str | None:
+        """Return the snapshot folder of these folders, model and settings."""
+        if not self.index_dir or not VECTOR_SUPPORT:
+            return None
+        config = json.dumps([
+            [os.path.abspath(f) for f in self.folders],
+            self.model_name,
+            chunk_settings(),
+            self._dedup_threshold,
+            os.getenv("RAG_VECTOR_CODEC") or "none",
+            _env_int("RAG_PCA_DIM", 0),
+        ])
+        key = hashlib.sha1(config.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.index_dir, key)
+
+    def _new_store(self) -> ChunkStore:
+        """Return an empty chunk store, kept next to the snapshot if enabled."""
+        path = self._snapshot_dir()
+        if path is None:
+            return ChunkStore()
+        try:
+            os.makedirs(path, exist_ok=True)
+            return ChunkStore(_new_blob_path(path))
+        except OSError as e:  # pragma: no cover - fall back to a temporary file
+            logging.warning("⚠️ Nelze vytvořit %s: %s", path, e)
+            return ChunkStore()
+
+    def _save_snapshot(self) -> None:
+        """Write indexes, paragraphs and manifest to :meth:`_snapshot_dir`."""
+        path = self._snapshot_dir()
+        if path is None:
+            return
+        try:
+            os.makedirs(path, exist_ok=True)
+            lock = FileLock(os.path.join(path, ".lock")) if FileLock else None
+            if lock:
+                lock.acquire()
+            try:
+                if os.path.dirname(self._store.path or "") != path:
+                    return  # the store lives in a temporary file
+                indexes = {}
+                for topic, index in self._indexes.items():
+                    name = _index_file_name(topic, index.backend)
+                    info = index.save(os.path.join(path, name))
+                    indexes[topic or ""] = {"file": name, "backend": index.backend, **info}
+                chunks = self._store.save_index(os.path.join(path, "chunks.idx"))
+                if self._dedup is not None:
+                    _write_atomic(os.path.join(path, "minhash.npz"), self._save_signatures)
+                _write_json(os.path.join(path, "meta.json"), {
+                    "version": _SNAPSHOT_VERSION,
+                    "model_name": self.model_name,
+                    "chunks": chunks,
+                    "extra_topics": sorted(self._extra_topics),
+                    "duplicates": self._canonical,
+                    "manifest": {
+                        p: [e.size, e.mtime, e.sha256, e.topic, e.chunk_ids]
+                        for p, e in self.manifest.items()
+                    },
+                    "indexes": indexes,
+                })
+                _remove_stale_blobs(path, chunks["blob"])
+            finally:
+                if lock:
+                    lock.release()
+        except Exception as e:  # pragma: no cover - snapshot is only a speed-up
+            logging.warning("⚠️ Index nelze uložit do %s: %s", path, e)
+
+    def _load_snapshot(self) -> bool:
+        """Restore the state saved by :meth:`_save_snapshot`."""
+        path = self._snapshot_dir()
+        if path is None or not os.path.exists(os.path.join(path, "meta.json")):
+            return False
+        mmap = os.getenv("RAG_INDEX_MMAP", "1") != "0"
+        backend = choose_backend()
+        # Another process saving a snapshot deletes the blobs it replaced.
+        lock = FileLock(os.path.join(path, ".lock")) if FileLock else None
+        try:
+            if lock:
+                lock.acquire()
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != _SNAPSHOT_VERSION or meta["model_name"] != self.model_name:
+                return False
+            store = ChunkStore.open(path, os.path.join(path, "chunks.idx"), meta["chunks"])
+            indexes = {}
+            for topic, info in meta["indexes"].items():
+                if info.get("backend", "faiss") != backend:
+                    raise ValueError(f"{info['file']} was built with another backend")
+                cls = NumpyIndex if backend == "numpy" else VectorIndex
+                index = cls.load(os.path.join(path, info["file"]), info, mmap)
+                # RAG_INDEX_TYPE is not part of the snapshot key
+                if backend == "faiss" and index.kind != choose_index_type(index.ntotal):
+                    raise ValueError(f"{info['file']} is a {index.kind} index")
+                indexes[topic or None] = index
+        except Exception as e:
+            logging.warning("⚠️ Uložený index %s nelze načíst: %s", path, e)
+            return False
+        finally:
+            if lock:
+                lock.release()
+
+        self.manifest = {
+            p: _FileEntry(size, mtime, sha, topic, ids)
+            for p, (size, mtime, sha, topic, ids) in meta["manifest"].items()
+        }
+        self._store = store
+        self._indexes = indexes
+        self._extra_topics.update(meta["extra_topics"])
+        self._canonical = {int(alias): cid for alias, cid in meta["duplicates"].items()}
+        self._aliases = {}
+        for alias, cid in self._canonical.items():
+            self._aliases.setdefault(cid, []).append(alias)
+        self._dedup = None  # built from minhash.npz when chunks change
+        self._lexical = {}
+        self._update_lexical({cid: store.get(cid) for cid in self._indexed_ids()}, [])
+        self.generation += 1
+        logging.info("✅ Index načten z %s (%d odstavců)", path, len(store))
+        return True
+
+    def _save_signatures(self, tmp: str) -> None:
+        signatures = {}
+        for index in self._dedup.values():
+            signatures.update(index.signatures())
+        ids = np.fromiter(signatures, dtype="int64", count=len(signatures))
+        rows = list(signatures.values())
+        matrix = np.stack(rows) if rows else np.empty((0, MinHashIndex.NUM_PERM), "uint32")
+        with open(tmp, "wb") as f:
+            np.savez(f, ids=ids, signatures=matrix)
+
+    # ------------------------------------------------------------------
+    def _indexed_ids(self, topic: Any = ...) -> List[int]:
+        """Return ids of the live chunks that are not collapsed duplicates."""
+        return [cid for cid in self._store.ids(topic) if cid not in self._canonical]
+
+    def _minhash(self, topic: str | None) -> MinHashIndex:
+        index = self._dedup.get(topic)
+        if index is None:
+            index = self._dedup[topic] = MinHashIndex(self._dedup_threshold)
+        return index
+
+    def _ensure_dedup(self, pending: dict[int, str]) -> None:
+        """Fill the MinHash indexes after a snapshot load, reusing saved signatures.
+
+        Chunks in *pending* are stored but not deduplicated yet, so they are
+        left out.
+        """
+        if self._dedup is not None:
+            return
+        self._dedup = {}
+        saved: dict[int, Any] = {}
+        path = self._snapshot_dir()
+        try:
+            with np.load(os.path.join(path or "", "minhash.npz")) as data:
+                if data["signatures"].shape[1:] == (MinHashIndex.NUM_PERM,):
+                    saved = dict(zip(data["ids"].tolist(), data["signatures"]))
+        except (OSError, ValueError, KeyError):
+            pass
+        for cid in self._indexed_ids():
+            if cid in pending:
+                continue
+            index = self._minhash(self._store.topic(cid))
+            signature = saved.get(cid)
+            if signature is None:
+                signature = index.signature(self._store.get(cid))
+            index.add(cid, signature)
+
+    def _deduplicate(
+        self, new_texts: dict[int, str], removed_ids: List[int]
+    ) -> tuple[dict[int, str], List[int]]:
+        """Collapse near-duplicates among *new_texts* into indexed chunks.
+
+        Returns the texts to index and the ids to drop from the indexes.
+        When a canonical chunk is removed its first remaining alias takes
+        its place in the indexes.
+        """
+        if not self._dedup_threshold:
+            return new_texts, removed_ids
+        self._ensure_dedup(new_texts)
+        removed = set(removed_ids)
+        texts: dict[int, str] = {}
+        unindexed: List[int] = []
+        for cid in removed_ids:
+            canonical = self._canonical.pop(cid, None)
+            if canonical is not None:
+                aliases = self._aliases.get(canonical)
+                if aliases and cid in aliases:
+                    aliases.remove(cid)
+                    if not aliases:
+                        del self._aliases[canonical]
+                continue
+            unindexed.append(cid)
+            index = self._minhash(self._store.topic(cid))
+            index.remove(cid)
+            live = [a for a in self._aliases.pop(cid, []) if a not in removed]
+            if live:
+                head = live[0]
+                del self._canonical[head]
+                for alias in live[1:]:
+                    self._canonical[alias] = head
+                if live[1:]:
+                    self._aliases[head] = live[1:]
+                texts[head] = self._store.get(head)
+                index.add(head, index.signature(texts[head]))
+
+        collapsed = 0
+        for cid, text in new_texts.items():
+            index = self._minhash(self._store.topic(cid))
+            signature = index.signature(text)
+            canonical = index.find(signature)
+            if canonical is None:
+                index.add(cid, signature)
+                texts[cid] = text
+            else:
+                self._canonical[cid] = canonical
+                self._aliases.setdefault(canonical, []).append(cid)
+                collapsed += 1
+        if collapsed:
+            logging.info("🧹 Sloučeno %d téměř shodných odstavců", collapsed)
+        return texts, unindexed
+
+    def _update_index(
+        self, new_texts: dict[int, str], unindexed: List[int], removed_ids: List[int]
+    ) -> None:
+        """Add vectors for *new_texts* and drop *unindexed* from the indexes.
+
+        *removed_ids* are all chunks about to leave the store, including
+        collapsed duplicates that never had a vector; a rebuild skips them.
+        """
+        if not VECTOR_SUPPORT:
+            self._indexes = {}
+            return
+        by_topic: dict[str | None, List[int]] = {}
+        for cid in unindexed:
+            by_topic.setdefault(self._store.topic(cid), []).append(cid)
+        for topic, ids in by_topic.items():
+            index = self._indexes.get(topic)
+            if index is not None:
+                index.remove(ids)
+        rows: dict[str | None, List[int]] = {}
+        if new_texts:
+            embeddings = self._encode(list(new_texts.values())).astype("float32")
+            for row, cid in enumerate(new_texts):
+                rows.setdefault(self._store.topic(cid), []).append(row)
+            ids = np.fromiter(new_texts, dtype="int64", count=len(new_texts))
+            for topic, sel in rows.items():
+                index = self._indexes.get(topic)
+                if index is None:
+                    self._indexes[topic] = build_index(embeddings[sel], ids[sel])
+                else:
+                    index.add(embeddings[sel], ids[sel])
+        for topic in set(by_topic) | set(rows):
+            index = self._indexes.get(topic)
+            if index is not None and index.needs_rebuild:
+                self._rebuild_index(topic, new_texts, removed_ids)
+
+    def _rebuild_index(
+        self, topic: str | None, new_texts: dict[int, str], removed_ids: List[int]
+    ) -> None:
+        """Build the index of *topic* again with the type fitting its size."""
+        removed = set(removed_ids)
+        cids = [cid for cid in self._indexed_ids(topic) if cid not in removed]
+        old = self._indexes.pop(topic)
+        if not cids:
+            return
+        texts = [new_texts[cid] if cid in new_texts else self._store.get(cid) for cid in cids]
+        vectors = self._encode(texts).astype("float32")
+        index = build_index(vectors, np.asarray(cids, dtype="int64"))
+        self._indexes[topic] = index
+        logging.info(
+            "🔁 Index %s přestavěn: %s → %s (%d vektorů)",
+            topic or "/", old.kind, index.kind, len(cids),
+        )
+
+    def _update_lexical(self, new_texts: dict[int, str], removed_ids: List[int]) -> None:
+        """Keep the BM25 indexes of the lexical search modes up to date."""
+        for cid in removed_ids:
+            index = self._lexical.get(self._store.topic(cid))
+            if index is not None and cid in self._store:
+                index.remove(cid, self._store.get(cid))
+        for cid, text in new_texts.items():
+            topic = self._store.topic(cid)
+            if topic not in self._lexical:
+                self._lexical[topic] = BM25Index()
+            self._lexical[topic].add(cid, text)
+
+    def _select_topics(self, topics: List[str] | None) -> List[str | None]:
+        """Return the sub-indexes searched for the *topics* filter.
+
+        Topics that are not indexed have no sub-index and add no results;
+        see :meth:`missing_topics`.
+        """
+        if topics is None:
+            topics = self.topics
+        if not topics:
+            return [None]
+        return list(topics)
+
+    # ------------------------------------------------------------------
+    def _extraction_cache(self) -> ExtractionCache | None:
+        """Return the cache of extracted document texts below ``cache_dir``."""
+        if not self.cache_dir:
+            return None
+        return ExtractionCache(os.path.join(self.cache_dir, "text"))
+
+    def _report(self, phase: str, done: int, total: int) -> None:
+        if self._on_progress is not None:
+            self._on_progress(phase, done, total)
+
+    def _encode(self, chunks: List[str]):
+        """Return normalized embeddings for *chunks*, reusing cached vectors.
+
+        Long lists are encoded in steps of ``_ENCODE_STEP`` texts per encoding
+        process so that the progress of a build can be reported in between.
+        """
+        cache = get_embedding_cache(self.model_name, self.cache_dir)
+        parts = []
+        with CorpusEncoder(self.model) as encode:
+            step = _ENCODE_STEP * encode.processes
+            for start in range(0, max(len(chunks), 1), step):
+                part = chunks[start:start + step]
+                parts.append(encode(part) if cache is None else cache.encode(part, encode))
+                self._report("embed", start + len(part), len(chunks))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([np.asarray(p, dtype="float32") for p in parts])
+
+    # ------------------------------------------------------------------
+    def search(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[str]:
+        """Return up to *top_k* relevant paragraphs for *query*.
+
+        *topics* restricts the search to the given topic subfolders and
+        defaults to the topics passed to the constructor. *mode* overrides
+        the search mode of this instance.
+        """
+        hits = self.search_scored(query, threshold, top_k, topics, mode)
+        return [chunk for _score, chunk in hits]
+
+    def search_scored(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[tuple[float, str]]:
+        """Return up to *top_k* ``(score, paragraph)`` pairs, best first.
+
+        ``vector`` scores are cosine similarities and ``lexical`` scores come
+        from :func:`_similarity`. ``hybrid`` runs both searches and fuses
+        their rankings, so its scores are fusion scores. Without vector
+        support every mode uses the lexical search.
+
+        Results are cached per :attr:`generation`, which changes whenever
+        the indexed paragraphs do, so stale hits are never returned.
+        """
+        hits = self._search_ids(query, threshold, top_k, topics, mode)
+        return [(score, self._store.get(cid)) for score, cid in hits]
+
+    def search_cited(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[dict[str, Any]]:
+        """Return hits as ``{"text", "score", "source", "sources", "topic"}`` dicts.
+
+        ``source`` is the path of the paragraph's file relative to the
+        knowledge folder it was found in. ``sources`` also lists the files
+        of the near-duplicates collapsed into it.
+        """
+        return [
+            {
+                "text": self._store.get(cid),
+                "score": score,
+                "source": self._source_of(cid),
+                "sources": list(dict.fromkeys(
+                    self._source_of(c) for c in [cid] + self._aliases.get(cid, [])
+                )),
+                "topic": self._store.topic(cid),
+            }
+            for score, cid in self._search_ids(query, threshold, top_k, topics, mode)
+        ]
+
+    def _source_of(self, cid: int) -> str:
+        path = self._store.source(cid)
+        for folder in self.folders:
+            rel = os.path.relpath(path, folder)
+            if not rel.startswith(os.pardir):
+                return rel.replace(os.sep, "/")
+        return os.path.basename(path)  # pragma: no cover - file outside the folders
+
+    def _search_ids(
+        self,
+        query: str,
+        threshold: float | None,
+        top_k: int,
+        topics: List[str] | None,
+        mode: str | None,
+    ) -> List[tuple[float, int]]:
+        mode = mode or self.mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if not len(self._store):
+            return []
+        selected = self._select_topics(topics)
+        vector = VECTOR_SUPPORT and bool(self._indexes)
+        if threshold is None or not vector:
+            # The lexical fallback always uses RAG_THRESHOLD.
+            threshold = _env_threshold()
+
+        key = (self._uid, self.generation, query, threshold, top_k, tuple(selected), mode)
+        hits = _search_results.get(key)
+        if hits is None:
+            if not vector:
+                hits = self._lexical_hits(query, threshold, top_k, selected)
+            else:
+                hits = self._search(query, threshold, top_k, selected, mode)
+            _search_results.put(key, hits)
+        return hits
+
+    def _search(
+        self,
+        query: str,
+        threshold: float,
+        top_k: int,
+        selected: List[str | None],
+        mode: str,
+    ) -> List[tuple[float, int]]:
+        if mode == "vector":
+            return self._vector_hits(query, threshold, top_k, selected)
+        if mode == "lexical":
+            return self._lexical_hits(query, threshold, top_k, selected)
+        depth = max(top_k * 4, 20)
+        vector = self._vector_hits(query, threshold, depth, selected)
+        lexical = self._lexical_hits(query, threshold, depth, selected)
+        fused = _fuse_rankings([[cid for _s, cid in vector], [cid for _s, cid in lexical]])
+        return fused[:top_k]
+
+    def _embed_query(self, query: str) -> Any:
+        """Return the normalized embedding of *query*, cached per model.
+
+        Cache misses of concurrent searches are encoded together by the
+        model's :class:`EmbeddingBatcher`.
+        """
+        model = self.model
+        key = (self.model_name, query)
+        query_vec = _query_embeddings.get(key)
+        if query_vec is None:
+            row = get_batcher(model).encode(query)
+            query_vec = np.asarray(row, dtype="float32").reshape(1, -1)
+            _query_embeddings.put(key, query_vec)
+        return query_vec
+
+    def _vector_hits(
+        self, query: str, threshold: float, top_k: int, selected: List[str | None]
+    ) -> List[tuple[float, int]]:
+        query_vec = self._embed_query(query)
+        results = []
+        for topic in selected:
+            index = self._indexes.get(topic)
+            if index is None:
+                continue
+            scores, idx = index.search(query_vec, top_k)
+            for score, i in zip(scores[0], idx[0]):
+                if i >= 0 and score >= threshold:
+                    results.append((float(score), int(i)))
+        return heapq.nlargest(top_k, results, key=lambda x: x[0])
+
+    def _lexical_hits(
+        self, query: str, threshold: float, top_k: int, selected: List[str | None]
+    ) -> List[tuple[float, int]]:
+        hits: List[tuple[int, str]] = []
+        indexes = [self._lexical[t] for t in selected if t in self._lexical]
+        for index in indexes:
+            pool = index.search(query, max(top_k * 4, 20))
+            hits.extend((cid, self._store.get(cid)) for _score, cid in pool)
+
+        def docs() -> Iterable[tuple[int, str]]:
+            for index in indexes:
+                for cid in index.doc_ids():
+                    yield cid, self._store.get(cid)
+
+        return _rerank_all(query, hits, threshold, top_k, docs)
+
+
+class LayeredKnowledgeBase:
+    """Search a shared knowledge base together with a small private overlay.
+
+    The shared instance (typically the public knowledge folder) is built
+    once per process while every user only gets an overlay index of their
+    own folders. Results of both are merged by score.
+    """
+
+    def __init__(self, shared: KnowledgeBase, overlay: KnowledgeBase):
+        self.shared = shared
+        self.overlay = overlay
+
+    @property
+    def folders(self) -> List[str]:
+        return list(self.shared.folders) + list(self.overlay.folders)
+
+    @property
+    def model_name(self) -> str:
+        return self.shared.model_name
+
+    @property
+    def chunks(self) -> List[str]:
+        return self.shared.chunks + self.overlay.chunks
+
+    def reload(self, topics: List[str] | None = None) -> None:
+        """Rebuild the overlay and pick up changes of the shared index."""
+        self.overlay.reload(topics)
+        self.shared.update()
+
+    def update(self) -> dict[str, int]:
+        stats = self.shared.update()
+        for key, value in self.overlay.update().items():
+            stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def stats(self) -> dict[str, int]:
+        stats = self.shared.stats()
+        for key, value in self.overlay.stats().items():
+            stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def status(self) -> dict[str, Any]:
+        """Return the build status of the shared index and of the overlay."""
+        status = dict(self.shared.status())
+        status["overlay"] = self.overlay.status()
+        return status
+
+    def search(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[str]:
+        """Return up to *top_k* relevant paragraphs for *query*."""
+        hits = self.search_scored(query, threshold, top_k, topics, mode)
+        return [chunk for _score, chunk in hits]
+
+    def search_scored(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[tuple[float, str]]:
+        """Return the best *top_k* hits of the shared and overlay indexes."""
+        hits = self.shared.search_scored(query, threshold, top_k, topics, mode)
+        hits += self.overlay.search_scored(query, threshold, top_k, topics, mode)
+        best: dict[str, float] = {}
+        for score, chunk in hits:
+            if score > best.get(chunk, float("-inf")):
+                best[chunk] = score
+        merged = heapq.nlargest(top_k, best.items(), key=lambda x: x[1])
+        return [(score, chunk) for chunk, score in merged]
+
+    def search_cited(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[dict[str, Any]]:
+        """Return the best *top_k* hits of both layers with their sources."""
+        hits = self.shared.search_cited(query, threshold, top_k, topics, mode)
+        hits += self.overlay.search_cited(query, threshold, top_k, topics, mode)
+        best: dict[str, dict[str, Any]] = {}
+        for hit in hits:
+            if hit["text"] not in best or hit["score"] > best[hit["text"]]["score"]:
+                best[hit["text"]] = hit
+        return heapq.nlargest(top_k, best.values(), key=lambda h: h["score"])
+
+
+class BackgroundKnowledgeBase:
+    """Serve one :class:`KnowledgeBase` while its successor is built.
+
+    :meth:`update` and :meth:`reload` only schedule a build and return. A
+    worker thread creates the next instance with
+    :meth:`KnowledgeBase.successor` and swaps it in with one assignment,
+    so every search runs against a single consistent instance that no
+    build modifies. Requests arriving while a build runs are merged into
+    one follow-up build; a pending reload absorbs pending updates.
+
+    A search for a topic subfolder that is not indexed yet runs against the
+    current instance as it is and schedules a build that adds the topic.
+
+    Everything else is delegated to :attr:`current`.
+    """
+
+    def __init__(self, kb: KnowledgeBase):
+        self._current = kb
+        self.generation = 0
+        self.builds = 0
+        self.failures = 0
+        self.coalesced = 0
+        self._pending: dict[str, Any] | None = None
+        self._wanted_topics: set[str] = set()
+        self._building = False
+        self._progress = {"phase": "idle", "done": 0, "total": 0}
+        self._started: float | None = None
+        self._last_seconds: float | None = None
+        self._last_error: str | None = None
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+
+    @property
+    def current(self) -> KnowledgeBase:
+        """Return the instance searches currently run against."""
+        return self._current
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "_current":
+            raise AttributeError(name)
+        return getattr(self._current, name)
+
+    def update(self) -> dict[str, int]:
+        """Schedule a build picking up the files changed on disk.
+
+        The changes are not known yet, so the returned counts are empty;
+        :meth:`status` reports the progress of the build.
+        """
+        self._schedule(False, None)
+        return {}
+
+    def reload(self, topics: List[str] | None = None) -> None:
+        """Schedule a build of the whole index from scratch."""
+        self._schedule(True, topics)
+
+    def search(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[str]:
+        self._request(topics)
+        return self._current.search(query, threshold, top_k, topics, mode)
+
+    def search_scored(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[tuple[float, str]]:
+        self._request(topics)
+        return self._current.search_scored(query, threshold, top_k, topics, mode)
+
+    def search_cited(
+        self,
+        query: str,
+        threshold: float | None = None,
+        top_k: int = 5,
+        topics: List[str] | None = None,
+        mode: str | None = None,
+    ) -> List[dict[str, Any]]:
+        self._request(topics)
+        return self._current.search_cited(query, threshold, top_k, topics, mode)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until no build is running or pending; ``False`` on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._pending is None and not self._building, timeout
+            )
+
+    def status(self) -> dict[str, Any]:
+        """Return the build generation, state and progress."""
+        with self._cond:
+            return {
+                "generation": self.generation,
+                "state": "building" if self._building else "idle",
+                "pending": self._pending is not None,
+                "progress": dict(self._progress),
+                "started": self._started,
+                "builds": self.builds,
+                "failures": self.failures,
+                "coalesced": self.coalesced,
+                "last_seconds": self._last_seconds,
+                "last_error": self._last_error,
+            }
+
+    # ------------------------------------------------------------------
+    def _request(self, topics: List[str] | None) -> None:
+        """Schedule a build adding the topics a search asks for."""
+        missing = set(self._current.missing_topics(topics))
+        with self._cond:
+            missing -= self._wanted_topics
+            if not missing:
+                return
+            self._wanted_topics |= missing
+        self._schedule(False, None)
+
+    def _schedule(self, full: bool, topics: List[str] | None) -> None:
+        with self._cond:
+            if self._pending is None:
+                self._pending = {"full": full, "topics": topics}
+            else:
+                self.coalesced += 1
+                self._pending["full"] |= full
+                if topics is not None:
+                    self._pending["topics"] = topics
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="rag-builder", daemon=True
+                )
+                self._worker.start()
+
+    def _report(self, phase: str, done: int, total: int) -> None:
+        self._progress = {"phase": phase, "done": done, "total": total}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                job = self._pending
+                if job is None:
+                    self._worker = None
+                    self._cond.notify_all()
+                    return
+                self._pending = None
+                extra_topics = set(self._wanted_topics)
+                self._building = True
+                self._started = time.time()
+                self._report("start", 0, 0)
+            start = time.perf_counter()
+            try:
+                kb = self._current.successor(
+                    job["topics"], job["full"], self._report, extra_topics=extra_topics
+                )
+            except Exception as e:  # keep serving the previous instance
+                logging.error("❌ Index se nepodařilo sestavit: %s", e)
+                with self._cond:
+                    self.failures += 1
+                    self._last_error = str(e)
+                    self._building = False
+                    self._started = None
+                    self._report("idle", 0, 0)
+                continue
+            with self._cond:
+                self._current = kb
+                self.generation += 1
+                self.builds += 1
+                self._last_seconds = time.perf_counter() - start
+                self._last_error = None
+                self._building = False
+                self._started = None
+                self._report("idle", 0, 0)
+            logging.info(
+                "✅ Index sestaven na pozadí za %.1f s (generace %d)",
+                self._last_seconds, self.generation,
+            )
+
+
+# ---------------------------------------------------------------------------
+# Convenience API
+# ---------------------------------------------------------------------------
+
+_DEFAULT_FOLDER = os.getenv(
+    "KNOWLEDGE_DIR",
+    os.path.join(os.path.dirname(__file__), "knowledge"),
+)
+_default_kb: KnowledgeBase | None = None
+
+
+def _get_default_kb() -> KnowledgeBase:
+    global _default_kb
+    if _default_kb is None:
+        _default_kb = KnowledgeBase(_DEFAULT_FOLDER)
+    return _default_kb
+
+
+def search_knowledge(
+    query: str, knowledge_chunks: List[str], threshold: float | None = None
+) -> List[str]:
+    """Search a list of paragraphs without creating a persistent instance."""
+
+    if VECTOR_SUPPORT:
+        if threshold is None:
+            threshold = _env_threshold()
+        model = get_model()
+        embeddings = model.encode(
+            knowledge_chunks, show_progress_bar=False, normalize_embeddings=True
+        )
+        if choose_backend() == "faiss":
+            index = faiss.IndexFlatIP(embeddings.shape[1])
+            index.add(embeddings.astype("float32"))
+        else:
+            index = NumpyIndex.build(
+                embeddings.astype("float32"), np.arange(len(knowledge_chunks), dtype="int64")
+            )
+        q_vec = model.encode(
+            [query], show_progress_bar=False, normalize_embeddings=True
+        )
+        scores, idx = index.search(
+            q_vec.astype("float32"), min(5, len(knowledge_chunks))
         )
         results = []
         for score, i in zip(scores[0], idx[0]):
@@ -237,13 +2773,17 @@ def search_knowledge(
                 results.append(knowledge_chunks[i])
         return results
 
-    # Fallback string matching honoring the threshold argument
+    # Fallback lexical search honoring the threshold argument
     if threshold is None:
         threshold = _env_threshold()
-    scored = [(_similarity(query, c), c) for c in knowledge_chunks]
-    scored = [c for c in scored if c[0] >= threshold]
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [c[1] for c in scored]
+    index = BM25Index()
+    for i, chunk in enumerate(knowledge_chunks):
+        index.add(i, chunk)
+    hits = [(i, knowledge_chunks[i]) for _score, i in index.search(query)]
+    ranked = _rerank_all(
+        query, hits, threshold, len(knowledge_chunks), lambda: enumerate(knowledge_chunks)
+    )
+    return [knowledge_chunks[i] for _score, i in ranked]
 
 
 def get_relevant_chunks(query: str, threshold: float = 0.7, top_k: int = 5) -> List[str]:
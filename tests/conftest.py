@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 @pytest.fixture
@@ -8,3 +10,19 @@ def reload_spy():
         called.append(True)
 
     return called, fake_reload
+
+
+@pytest.fixture(autouse=True)
+def _index_snapshots_in_tmp(monkeypatch, tmp_path):
+    """Keep index snapshots of the tests out of the repository."""
+    monkeypatch.setenv("RAG_INDEX_DIR", str(tmp_path / "rag_index"))
+
+
+@pytest.fixture(autouse=True)
+def _clear_model_registry():
+    """Do not leak embedding models or cached queries of one test into the next."""
+    yield
+    rag_engine = sys.modules.get("rag_engine")
+    if rag_engine is not None:
+        rag_engine.clear_models()
+        rag_engine.clear_caches()
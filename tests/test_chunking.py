@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chunking import chunk_settings, chunk_text, count_tokens
+
+
+def test_long_paragraph_is_split_with_overlap():
+    text = " ".join(f"Věta {i} má pět tokenů." for i in range(30))
+    chunks = chunk_text(text, max_tokens=20, overlap=6, min_tokens=0)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 20 for c in chunks)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        # the last sentence of a window opens the next one
+        assert nxt.startswith(prev.rsplit(". ", 1)[-1])
+    assert "Věta 29 má pět tokenů." in chunks[-1]
+
+
+def test_headings_start_sections_and_stay_with_text():
+    text = "# Manuál\n\nÚvod k dokumentu.\n## Sekce 1\nPrvní strana.\n\n## Sekce 2\nDruhá strana."
+    assert chunk_text(text, max_tokens=50, overlap=0, min_tokens=0) == [
+        "# Manuál\nÚvod k dokumentu.",
+        "## Sekce 1\nPrvní strana.",
+        "## Sekce 2\nDruhá strana.",
+    ]
+
+
+def test_tiny_fragments_are_merged_and_lists_split_at_items():
+    text = "Postup:\n\n- první krok\n- druhý krok\n- třetí krok\n- čtvrtý krok\n\nKonec."
+    chunks = chunk_text(text, max_tokens=8, overlap=0, min_tokens=3)
+    assert chunks == [
+        "Postup:\n\n- první krok\n- druhý krok",
+        "- třetí krok\n- čtvrtý krok\n\nKonec.",
+    ]
+
+
+def test_oversized_sentence_is_split_into_words():
+    text = " ".join(f"slovo{i}" for i in range(25))
+    chunks = chunk_text(text, max_tokens=10, overlap=2, min_tokens=0)
+    assert [count_tokens(c) for c in chunks] == [10, 10, 9]
+    assert chunks[1].startswith("slovo8 slovo9")
+
+
+def test_chunk_settings_from_env(monkeypatch):
+    monkeypatch.setenv("RAG_CHUNK_TOKENS", "64")
+    monkeypatch.setenv("RAG_CHUNK_OVERLAP", "100")
+    monkeypatch.setenv("RAG_CHUNK_MIN_TOKENS", "8")
+    assert chunk_settings() == (64, 32, 8)
+    # an empty value keeps the default, as for the other RAG_* settings
+    monkeypatch.setenv("RAG_CHUNK_TOKENS", "")
+    assert chunk_settings()[0] == 100
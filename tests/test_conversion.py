@@ -116,3 +116,52 @@ def test_unsupported_extension_skipped(tmp_path, monkeypatch):
     out_dir_md = Path("knowledge_md")
     assert out_dir_md.exists()
     assert not any(out_dir_md.iterdir())
+
+
+def test_parallel_converter_matches_old_output_and_skips_unchanged(tmp_path, monkeypatch):
+    from tools import convert
+
+    monkeypatch.setattr(convert, "pdfplumber", DummyPdfPlumber(["p1", "p2", "p3"]))
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "a.pdf").write_text("dummy")
+    (input_dir / "b.txt").write_text("first\n\nsecond", encoding="utf-8")
+    (input_dir / "c.xyz").write_text("dummy")
+
+    out = tmp_path / "out"
+    stats = convert.convert_folder(input_dir, out, "txt", workers=1, pages_per_task=2)
+    assert stats["converted"] == 2
+    assert (out / "a.txt").read_text(encoding="utf-8") == "p1\n\np2\n\np3"
+    assert (out / "b.txt").read_text(encoding="utf-8") == "first\n\nsecond"
+    assert sorted(p.name for p in out.iterdir()) == [".convert_manifest.json", "a.txt", "b.txt"]
+
+    stats = convert.convert_folder(input_dir, out, "txt", workers=1)
+    assert stats["converted"] == 0 and stats["skipped"] == 2
+
+    monkeypatch.setattr(convert_to_md, "pdfplumber", DummyPdfPlumber(["p1", "p2", "p3"]))
+    md_out = tmp_path / "md"
+    convert.convert_folder(input_dir, md_out, "md", workers=1, pages_per_task=1)
+    for name in ("a", "b"):
+        src = input_dir / (name + (".pdf" if name == "a" else ".txt"))
+        old = tmp_path / f"{name}_old.md"
+        if name == "a":
+            convert_to_md.convert_pdf_to_md(src, old)
+        else:
+            convert_to_md.convert_txt_to_md(src, old)
+        assert (md_out / f"{name}.md").read_text(encoding="utf-8") == old.read_text(encoding="utf-8")
+
+
+def test_parallel_converter_skips_sources_with_the_same_stem(tmp_path, monkeypatch):
+    from tools import convert
+
+    monkeypatch.setattr(convert, "pdfplumber", DummyPdfPlumber(["from pdf"]))
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "x.pdf").write_text("dummy")
+    (input_dir / "x.txt").write_text("from txt", encoding="utf-8")
+
+    out = tmp_path / "out"
+    stats = convert.convert_folder(input_dir, out, "txt", workers=2)
+    assert stats["converted"] == 1 and stats["duplicates"] == 1
+    assert (out / "x.txt").read_text(encoding="utf-8") == "from txt"
+    assert sorted(p.name for p in out.iterdir()) == [".convert_manifest.json", "x.txt"]
@@ -19,11 +19,13 @@ import rag_engine
 
 class DummyKB:
     last_topics = None
+    model = None
+    mode = "vector"
 
-    def __init__(self, folder=None, model_name=None, topics=None):
+    def __init__(self, folder=None, model_name=None, topics=None, **_kwargs):
         self.folder = folder
         self.model_name = model_name
-        self.folders = [folder] if folder and not isinstance(folder, list) else folder
+        self.folders = [folder] if folder and not isinstance(folder, list) else (folder or [])
         self.chunks = ["dummy"]
         self.topics = topics
         DummyKB.last_topics = topics
@@ -33,9 +35,34 @@ class DummyKB:
         if topics is not None:
             self.topics = topics
 
-    def search(self, query, threshold=None):
+    def update(self):
+        return {"added": 0, "changed": 0, "removed": 0}
+
+    def stats(self):
+        return {"files": 1, "chunks": len(self.chunks), "duplicates": 0}
+
+    def successor(self, topics=None, full=False, on_progress=None, **_kwargs):
+        return DummyKB(self.folders, self.model_name, topics or self.topics)
+
+    def missing_topics(self, topics=None):
+        return []
+
+    def status(self):
+        return {"generation": 0, "state": "idle", "pending": False}
+
+    def search(self, query, threshold=None, top_k=5, topics=None, mode=None):
+        DummyKB.last_topics = topics
+        DummyKB.last_mode = mode
         return [f"kb:{query}"]
 
+    def search_cited(self, query, threshold=None, top_k=5, topics=None, mode=None):
+        return [{"text": f"kb:{query}", "score": 1.0, "source": "a.txt", "topic": None}]
+
+    def search_scored(self, query, threshold=None, top_k=5, topics=None, mode=None):
+        DummyKB.last_topics = topics
+        DummyKB.last_mode = mode
+        return [(1.0, f"kb:{query}")]
+
 
 class DummyResp:
     def raise_for_status(self):
@@ -204,6 +231,98 @@ def test_memory_search_with_invalid_line(client):
     assert len(res.get_json()) == 3
 
 
+def test_memory_search_returns_newest_entries_of_all_folders(client):
+    import main
+
+    now = main.datetime.now(main.UTC)
+    logs = {
+        os.path.join(main.MEMORY_DIR, "public.jsonl"): (6, 4, 2),
+        os.path.join(main.MEMORY_DIR, "bob", "log.jsonl"): (5, 3, 1),
+    }
+    for path, ages in logs.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for age in ages:
+                ts = (now - main.timedelta(minutes=age)).isoformat()
+                f.write(json.dumps({"timestamp": ts, "role": "user", "message": f"q{age}"}) + "\n")
+                f.write(json.dumps({"timestamp": ts, "role": "assistant", "message": "a"}) + "\n")
+    main.memory_caches.pop("shared")
+    main.reload_memory(["bob"])
+
+    res = client.get("/memory/search", headers=_auth())
+    assert [e["user"] for e in res.get_json()] == ["q5", "q4", "q3", "q2", "q1"]
+    assert len(main.memory_view(["bob", "shared"])) == 6
+
+
+def test_memory_compaction_drops_expired_entries(client):
+    import main
+
+    path = os.path.join(main.MEMORY_DIR, "public.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        now = main.datetime.now(main.UTC).isoformat()
+        for ts, msg in (("2000-01-01T00:00:00", "old"), (now, "new")):
+            f.write(json.dumps({"timestamp": ts, "role": "user", "message": msg}) + "\n")
+            f.write(json.dumps({"timestamp": ts, "role": "assistant", "message": msg}) + "\n")
+
+    assert main.memory_compactor.compact_now([main.DEFAULT_MEMORY_FOLDER]) == 2
+    with open(path, "r", encoding="utf-8") as f:
+        assert "old" not in f.read()
+    assert main.memory_caches[main.DEFAULT_MEMORY_FOLDER] == [{"user": "new", "jarvik": "new"}]
+    segments = os.listdir(os.path.join(main.MEMORY_DIR, "public.d"))
+    assert not any(name.startswith("2000-01-01") for name in segments)
+
+
+def test_memory_compaction_expires_cached_entries_of_kept_segments(client):
+    import main
+
+    folder = main.DEFAULT_MEMORY_FOLDER
+    now = main.datetime.now(main.UTC)
+    cache = [{"user": "old", "jarvik": "old"}, {"user": "new", "jarvik": "new"}]
+    main.memory_caches[folder] = cache
+    expired = now - main.timedelta(days=main.MEMORY_RETENTION_DAYS + 1)
+    main.memory_timeline.reset(folder, cache, [expired.timestamp(), now.timestamp()])
+
+    main.memory_compactor.compact_now([folder])
+    assert main.memory_caches[folder] == [{"user": "new", "jarvik": "new"}]
+    assert [e["user"] for e in main.memory_view()] == ["new"]
+
+
+def test_memory_reload_migrates_single_file_log(client, monkeypatch):
+    import main
+
+    path = os.path.join(main.MEMORY_DIR, "public.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for day in ("2024-01-01", "2024-01-02"):
+            f.write(json.dumps({"timestamp": f"{day}T10:00:00", "role": "user", "message": day}) + "\n")
+            f.write(json.dumps({"timestamp": f"{day}T10:00:00", "role": "assistant", "message": "ok"}) + "\n")
+    monkeypatch.setattr(main, "MEMORY_RETENTION_DAYS", 0)
+    main.reload_memory()
+
+    assert [e["user"] for e in main.memory_caches[main.DEFAULT_MEMORY_FOLDER]] == ["2024-01-01", "2024-01-02"]
+    assert sorted(os.listdir(os.path.join(main.MEMORY_DIR, "public.d"))) == [
+        "2024-01-01.jsonl",
+        "2024-01-02.jsonl",
+        "manifest.json",
+    ]
+    assert os.path.getsize(path) == 0
+
+
+def test_memory_search_with_sqlite_backend(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "MEMORY_BACKEND", "sqlite")
+    now = main.datetime.now(main.UTC).isoformat()
+    with open(os.path.join(main.MEMORY_DIR, "public.jsonl"), "w", encoding="utf-8") as f:
+        for msg in ("Jak se má kůň?", "Kde je pes?"):
+            f.write(json.dumps({"timestamp": now, "role": "user", "message": msg}) + "\n")
+            f.write(json.dumps({"timestamp": now, "role": "assistant", "message": "dobře"}) + "\n")
+
+    res = client.get("/memory/search", query_string={"q": "KUN"}, headers=_auth())
+    assert res.status_code == 200
+    assert res.get_json() == [{"user": "Jak se má kůň?", "jarvik": "dobře"}]
+    assert os.path.exists(os.path.join(main.MEMORY_DIR, "memory.db"))
+
+
 def test_knowledge_search(client):
     res = client.get("/knowledge/search", query_string={"q": "test"}, headers=_auth())
     assert res.status_code == 200
@@ -225,6 +344,44 @@ def test_knowledge_search_topics(client):
     assert DummyKB.last_topics == ["t1", "t2"]
 
 
+def test_knowledge_search_sources(client):
+    res = client.get(
+        "/knowledge/search",
+        query_string={"q": "x", "sources": "1"},
+        headers=_auth(),
+    )
+    assert res.status_code == 200
+    assert res.get_json()[0]["source"] == "a.txt"
+
+
+def test_knowledge_search_mode(client):
+    res = client.get(
+        "/knowledge/search",
+        query_string={"q": "x", "mode": "hybrid"},
+        headers=_auth(),
+    )
+    assert res.status_code == 200
+    assert DummyKB.last_mode == "hybrid"
+
+    res = client.get(
+        "/knowledge/search",
+        query_string={"q": "x", "mode": "fuzzy"},
+        headers=_auth(),
+    )
+    assert res.status_code == 400
+
+
+def test_knowledge_stats(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "model_stats", lambda: {"m": {"load_seconds": 1.0}})
+    res = client.get("/knowledge/stats", headers=_auth())
+    assert res.status_code == 200
+    assert res.get_json()["models"] == {"m": {"load_seconds": 1.0}}
+    assert "hits" in res.get_json()["caches"]["search_results"]
+    assert res.get_json()["batching"]["batches"] == 0
+    assert res.get_json()["knowledge"]["chunks"] >= 1
+
+
 def test_login_and_token(client):
     import main
     res = client.post("/login", json={"nick": "bob", "password": "pw"})
@@ -305,9 +462,9 @@ def test_per_user_knowledge_folders(client):
     import main
     client.get("/knowledge/search", query_string={"q": "hello"}, headers=_auth())
     kb = main.user_knowledge["bob"]
-    assert main.PUBLIC_KNOWLEDGE_FOLDER in kb.folder[0]
-    assert os.path.join(main.PUBLIC_KNOWLEDGE_FOLDER, "private") in kb.folder[1]
-    assert os.path.join(main.MEMORY_DIR, "bob", "private_knowledge") in kb.folder[2]
+    assert kb.shared is main.knowledge
+    assert os.path.join(main.PUBLIC_KNOWLEDGE_FOLDER, "private") in kb.overlay.folder[0]
+    assert os.path.join(main.MEMORY_DIR, "bob", "private_knowledge") in kb.overlay.folder[1]
 
 
 def test_ask_web_endpoint(client, monkeypatch):
@@ -392,6 +549,15 @@ def test_knowledge_reload(client, monkeypatch, reload_spy):
     assert called
 
 
+def test_knowledge_status(client):
+    res = client.get("/knowledge/status", headers=_auth())
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data["state"] == "idle"
+    assert data["overlay"]["state"] in {"idle", "building"}
+    assert "progress" in data["overlay"]
+
+
 def test_model_switch(client, monkeypatch):
     import main
     called = []
@@ -538,7 +704,7 @@ def test_knowledge_upload(client, monkeypatch, tmp_path, reload_spy):
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     called, fake_reload = reload_spy
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = fake_reload
+    main.knowledge.update = fake_reload
     data = {
         "file": (io.BytesIO(b"hello"), "info.txt"),
         "private": "0",
@@ -559,7 +725,7 @@ def test_knowledge_upload_sanitizes_filename(client, monkeypatch, tmp_path, relo
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     called, fake_reload = reload_spy
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = fake_reload
+    main.knowledge.update = fake_reload
     data = {
         "file": (io.BytesIO(b"hello"), "../evil.txt"),
         "private": "0",
@@ -583,7 +749,7 @@ def test_knowledge_upload_records_description(client, monkeypatch, tmp_path, rel
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     called, fake_reload = reload_spy
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = fake_reload
+    main.knowledge.update = fake_reload
     data = {
         "file": (io.BytesIO(b"hello"), "note.txt"),
         "private": "0",
@@ -611,7 +777,7 @@ def test_knowledge_upload_creates_meta(client, monkeypatch, tmp_path, reload_spy
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     called, fake_reload = reload_spy
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = fake_reload
+    main.knowledge.update = fake_reload
     data = {
         "file": (io.BytesIO(b"hello"), "meta.txt"),
         "private": "0",
@@ -651,7 +817,7 @@ def test_knowledge_upload_suggests_topic(client, monkeypatch, tmp_path, reload_s
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     called, fake_reload = reload_spy
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = fake_reload
+    main.knowledge.update = fake_reload
     data = {
         "file": (io.BytesIO(b"dogs are great"), "info.txt"),
         "private": "0",
@@ -684,7 +850,7 @@ def test_private_knowledge_upload_saves_to_memory(client, monkeypatch, tmp_path)
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(pub))
     monkeypatch.setattr(main, "MEMORY_DIR", str(mem))
     main.knowledge.folder = str(pub)
-    main.knowledge.reload = lambda: None
+    main.knowledge.update = lambda: None
 
     data = {"file": (io.BytesIO(b"hello"), "priv.txt"), "private": "1"}
     res = client.post(
@@ -767,7 +933,7 @@ def test_knowledge_pending_and_approve(client, monkeypatch, tmp_path):
 
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(tmp_path))
     main.knowledge.folder = str(tmp_path)
-    main.knowledge.reload = lambda: None
+    main.knowledge.update = lambda: None
 
     data = {"file": (io.BytesIO(b"x"), "pend.txt"), "private": "0"}
     res = client.post(
@@ -807,7 +973,7 @@ def test_knowledge_reject_moves_file(client, monkeypatch, tmp_path):
     monkeypatch.setattr(main, "PUBLIC_KNOWLEDGE_FOLDER", str(pub))
     monkeypatch.setattr(main, "MEMORY_DIR", str(tmp_path / "mem"))
     main.knowledge.folder = str(pub)
-    main.knowledge.reload = lambda: None
+    main.knowledge.update = lambda: None
 
     data = {"file": (io.BytesIO(b"x"), "rej.txt"), "private": "0"}
     res = client.post(
@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import pytest
+from datetime import datetime, UTC
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
@@ -61,3 +63,307 @@ def test_invalid_json_lines_kept(tmp_path):
     assert "{bad json}" in lines
     assert len(lines) == 2
     assert all("delete" not in line for line in lines)
+
+
+def test_naive_timestamps_are_compared_as_utc(tmp_path):
+    path = tmp_path / "mem.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"timestamp": "2024-01-01T00:00:00", "id": 1}) + "\n")
+        f.write(json.dumps({"timestamp": "2024-01-10T00:00:00+00:00", "id": 2}) + "\n")
+
+    assert vymazat_memory_range(str(path), do="2024-01-05T00:00:00+00:00") == 1
+
+    with open(path, "r", encoding="utf-8") as f:
+        remaining = [json.loads(line) for line in f if line.strip()]
+    assert [e["id"] for e in remaining] == [2]
+
+
+def test_compactor_runs_on_size_and_schedule():
+    import threading
+    import time
+
+    from memory import MemoryCompactor
+
+    calls = []
+    ran = threading.Event()
+
+    def compact(folder):
+        calls.append(folder)
+        ran.set()
+        return 1
+
+    compactor = MemoryCompactor(compact, interval=0, max_bytes=100)
+    compactor.note_append("bob", 60)
+    assert not ran.wait(0.1)
+    compactor.note_append("bob", 60)
+    assert ran.wait(5)
+    assert calls == ["bob"]
+
+    # the schedule compacts every tracked folder
+    ran.clear()
+    scheduled = MemoryCompactor(compact, interval=0.05, max_bytes=0)
+    scheduled.track("public")
+    scheduled.note_append("bob", 10**6)
+    assert ran.wait(5)
+    time.sleep(0.05)
+    assert {"public", "bob"} <= set(calls[1:])
+    assert scheduled.compact_now(["bob"]) == 1
+
+
+def _line(ts, msg):
+    return json.dumps({"timestamp": ts, "role": "user", "message": msg}) + "\n"
+
+
+def test_segmented_log_rolls_over_and_drops_days(tmp_path):
+    from memory import SegmentedLog
+
+    log = SegmentedLog(str(tmp_path / "log.d"), max_bytes=100)
+    for i in range(3):
+        log.append(_line("2024-01-01T10:00:00", f"a{i}"), "2024-01-01")
+    log.append(_line("2024-01-02T10:00:00", "b"), "2024-01-02")
+    assert log.segments() == ["2024-01-01.jsonl", "2024-01-01.1.jsonl", "2024-01-02.jsonl"]
+
+    # a fresh instance reads the manifest written by the first one
+    since = datetime(2024, 1, 2, tzinfo=UTC)
+    assert [json.loads(line)["message"] for line in SegmentedLog(log.folder).lines(since)] == ["b"]
+
+    assert log.drop_before(since) == 3
+    assert log.segments() == ["2024-01-02.jsonl"]
+    assert not os.path.exists(tmp_path / "log.d" / "2024-01-01.jsonl")
+
+
+def test_segmented_log_delete_only_opens_days_in_range(tmp_path):
+    from memory import SegmentedLog
+
+    log = SegmentedLog(str(tmp_path / "log.d"))
+    log.append(_line("2024-01-01T10:00:00", "old"), "2024-01-01")
+    log.append(_line("2024-01-02T09:00:00", "morning") + _line("2024-01-02T18:00:00", "evening"), "2024-01-02")
+    log.append(_line("2024-01-03T10:00:00", "new"), "2024-01-03")
+    untouched = tmp_path / "log.d" / "2024-01-03.jsonl"
+    untouched.write_text("not json but outside the range\n", encoding="utf-8")
+
+    assert log.delete(od="2024-01-01T00:00:00", do="2024-01-02T12:00:00") == 2
+    assert log.segments() == ["2024-01-02.jsonl", "2024-01-03.jsonl"]
+    day = (tmp_path / "log.d" / "2024-01-02.jsonl").read_text(encoding="utf-8")
+    assert [json.loads(line)["message"] for line in day.splitlines()] == ["evening"]
+    assert untouched.read_text(encoding="utf-8") == "not json but outside the range\n"
+
+    assert log.delete(hledat_podle="evening") == 1
+    assert log.segments() == ["2024-01-03.jsonl"]
+
+
+def test_segmented_log_migrates_legacy_file(tmp_path):
+    from memory import SegmentedLog, segment_dir
+
+    legacy = tmp_path / "log.jsonl"
+    feedback = json.dumps({"type": "feedback", "correction": "x"}) + "\n"
+    legacy.write_text(
+        _line("2024-01-01T10:00:00", "a") + feedback
+        + json.dumps({"date": "2024-01-02", "time": "08:00:00", "user": "b", "jarvik": "c"}) + "\n",
+        encoding="utf-8",
+    )
+    log = SegmentedLog(segment_dir(str(legacy)), legacy=str(legacy))
+    assert log.folder == str(tmp_path / "log.d")
+
+    assert log.migrate() == 2
+    assert log.segments() == ["2024-01-01.jsonl", "2024-01-02.jsonl"]
+    assert legacy.read_text(encoding="utf-8") == feedback
+    assert log.migrate() == 0
+    assert len(list(log.lines())) == 3
+
+
+@pytest.mark.parametrize("crash", ["before_rewrite", "after_rewrite"])
+def test_segmented_log_recovers_interrupted_migration(tmp_path, monkeypatch, crash):
+    import memory
+    from memory import SegmentedLog, segment_dir
+
+    legacy = tmp_path / "log.jsonl"
+    feedback = json.dumps({"type": "feedback", "correction": "x"}) + "\n"
+    legacy.write_text(
+        _line("2024-01-01T10:00:00", "a") + feedback + _line("2024-01-02T10:00:00", "b"),
+        encoding="utf-8",
+    )
+    log = SegmentedLog(segment_dir(str(legacy)), legacy=str(legacy))
+    log.append(_line("2024-01-01T08:00:00", "older"), "2024-01-01")
+
+    replace = os.replace
+
+    def crashing_replace(src, dst):
+        if crash == "before_rewrite" and dst == str(legacy):
+            raise KeyboardInterrupt
+        replace(src, dst)
+        if crash == "after_rewrite" and dst == str(legacy):
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(memory.os, "replace", crashing_replace)
+    with pytest.raises(KeyboardInterrupt):
+        log.migrate()
+    monkeypatch.setattr(memory.os, "replace", replace)
+
+    restarted = SegmentedLog(segment_dir(str(legacy)), legacy=str(legacy))
+    restarted.migrate()
+    messages = [json.loads(line).get("message") for line in restarted.lines()]
+    assert sorted(m for m in messages if m) == ["a", "b", "older"]
+    assert legacy.read_text(encoding="utf-8") == feedback
+    assert restarted.migrate() == 0
+
+
+def test_sqlite_store_searches_and_deletes(tmp_path):
+    from memory import SqliteMemoryStore
+
+    store = SqliteMemoryStore(str(tmp_path / "memory.db"))
+    assert store.execute("PRAGMA journal_mode")[0][0] == "wal"
+    log = store.log("bob")
+    log.append(_line("2024-01-01T10:00:00", "Kolik stojí žluťoučký kůň?")
+               + json.dumps({"timestamp": "2024-01-01T10:00:00", "role": "assistant", "message": "Hodně"}) + "\n",
+               "2024-01-01")
+    log.append(_line("2024-01-02T10:00:00", "kun znovu")
+               + json.dumps({"timestamp": "2024-01-02T10:00:00", "role": "assistant", "message": "Málo"}) + "\n",
+               "2024-01-02")
+    store.log("alice").append(_line("2024-01-03T10:00:00", "kůň") + "\n", "2024-01-03")
+
+    # case and diacritics are ignored, words match by prefix, newest first
+    assert store.search(["bob"], "KUN") == [
+        {"user": "kun znovu", "jarvik": "Málo"},
+        {"user": "Kolik stojí žluťoučký kůň?", "jarvik": "Hodně"},
+    ]
+    assert store.search(["bob"], "zlutou") == [{"user": "Kolik stojí žluťoučký kůň?", "jarvik": "Hodně"}]
+    assert store.search(["bob"], "hodne", limit=1) == [{"user": "Kolik stojí žluťoučký kůň?", "jarvik": "Hodně"}]
+    assert store.search(["bob"], "kun", since=datetime(2024, 1, 2, tzinfo=UTC)) == [
+        {"user": "kun znovu", "jarvik": "Málo"}
+    ]
+
+    assert log.delete(do="2024-01-01T23:59:59") == 2
+    assert log.delete(hledat_podle="ZNOVU") == 1
+    assert [json.loads(line)["message"] for line in log.lines()] == ["Málo"]
+    assert len(list(store.log("alice").lines())) == 1
+    assert store.log("alice").drop_before(datetime(2025, 1, 1, tzinfo=UTC)) == 1
+
+
+def test_sqlite_log_imports_jsonl_files(tmp_path):
+    from memory import SegmentedLog, SqliteMemoryStore, segment_dir
+
+    legacy = tmp_path / "log.jsonl"
+    feedback = json.dumps({"type": "feedback", "correction": "x"}) + "\n"
+    legacy.write_text(_line("2024-01-01T10:00:00", "a") + feedback, encoding="utf-8")
+    SegmentedLog(segment_dir(str(legacy))).append(_line("2024-01-02T10:00:00", "b"), "2024-01-02")
+
+    log = SqliteMemoryStore(str(tmp_path / "memory.db")).log("bob", legacy=str(legacy))
+    assert log.migrate() == 2
+    assert log.migrate() == 0
+    assert legacy.read_text(encoding="utf-8") == feedback
+    assert not [n for n in os.listdir(segment_dir(str(legacy))) if n.endswith(".jsonl")]
+    assert [json.loads(line).get("message") for line in log.lines()] == [None, "a", "b"]
+
+
+def test_sqlite_log_import_survives_a_crash_before_the_cleanup(tmp_path, monkeypatch):
+    from memory import SegmentedLog, SqliteMemoryStore, segment_dir
+
+    legacy = tmp_path / "log.jsonl"
+    legacy.write_text("", encoding="utf-8")
+    segments = SegmentedLog(segment_dir(str(legacy)))
+    segments.append(_line("2024-01-02T10:00:00", "b"), "2024-01-02")
+    store = SqliteMemoryStore(str(tmp_path / "memory.db"))
+
+    def killed(self, cutoff):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(SegmentedLog, "drop_before", killed)
+    with pytest.raises(KeyboardInterrupt):
+        store.log("bob", legacy=str(legacy)).migrate()
+    monkeypatch.undo()
+
+    # lines appended after the crash are still picked up
+    segments.append(_line("2024-01-02T11:00:00", "c"), "2024-01-02")
+    log = store.log("bob", legacy=str(legacy))
+    assert log.migrate() == 1
+    assert [json.loads(line)["message"] for line in log.lines()] == ["b", "c"]
+    assert store.execute("SELECT COUNT(*) FROM memory_imports")[0][0] == 0
+
+
+def test_memory_view_merges_newest_entries_by_time():
+    from memory import MemoryTimeline
+
+    public = [{"user": "p1"}, {"user": "p2"}, {"user": "p3"}]
+    bob = [{"user": "b1"}, {"user": "b2"}]
+    timeline = MemoryTimeline()
+    timeline.reset("public", public, [10.0, 30.0, 50.0])
+    # a missing time sorts with the entry before it
+    timeline.reset("bob", bob, [20.0, None])
+
+    view = timeline.view([("public", public), ("bob", bob)])
+    assert len(view) == 5
+    assert [e["user"] for e in view] == ["p1", "b1", "b2", "p2", "p3"]
+    assert [e["user"] for e in view.tail(3)] == ["b2", "p2", "p3"]
+    assert view.tail(0) == []
+
+    bob.append({"user": "b3"})
+    timeline.record("bob", bob, datetime(2000, 1, 1, tzinfo=UTC))
+    # the view keeps the lengths it was created with
+    assert len(view) == 5
+    assert [e["user"] for e in timeline.view([("public", public), ("bob", bob)]).tail(1)] == ["b3"]
+
+
+def test_memory_timeline_expires_entries_before_cutoff():
+    from memory import MemoryTimeline
+
+    entries = [{"user": "undated"}, {"user": "old"}, {"user": "new"}]
+    timeline = MemoryTimeline()
+    timeline.reset("public", entries, [None, 10.0, 50.0])
+    cutoff = datetime.fromtimestamp(30.0, UTC)
+
+    kept = timeline.expire("public", entries, cutoff)
+    assert [e["user"] for e in kept] == ["undated", "new"]
+    assert [e["user"] for e in timeline.view([("public", kept)])] == ["undated", "new"]
+    # nothing left to expire keeps the list
+    assert timeline.expire("public", kept, cutoff) is kept
+
+
+def test_memory_view_keeps_folder_order_for_unknown_times():
+    from memory import MemoryTimeline
+
+    public = [{"user": "a"}, {"user": "b"}]
+    shared = [{"user": "c"}]
+    view = MemoryTimeline().view([("public", public), ("shared", shared)])
+    assert [e["user"] for e in view] == ["a", "b", "c"]
+    assert [e["user"] for e in reversed(view)] == ["c", "b", "a"]
+
+
+def test_memory_search_index_matches_linear_scan():
+    import random
+    import unicodedata
+
+    from memory import MemorySearchIndex, MemoryTimeline
+
+    def normalize(text):
+        text = unicodedata.normalize("NFKD", text.lower())
+        return "".join(c for c in text if not unicodedata.combining(c))
+
+    def scan(entries, query):
+        q = normalize(query)
+        hits = [e for e in reversed(entries) if q in normalize(e["user"]) or q in normalize(e["jarvik"])]
+        return hits[:5]
+
+    rng = random.Random(0)
+    words = "kůň Žluťoučký pes audit dodavatel Příliš úpěl ďábelské ódy".split()
+    entries = [
+        {"user": " ".join(rng.choices(words, k=4)), "jarvik": " ".join(rng.choices(words, k=6))}
+        for _ in range(300)
+    ]
+    index = MemorySearchIndex(normalize)
+    timeline = MemoryTimeline()
+    timeline.reset("public", entries, list(range(len(entries))))
+    index.add("public", entries)
+
+    for query in ["kun", "ŽLUŤ", "s a", "ó", "", "pes kůň", "dit do", "nothing", "l ú"]:
+        view = timeline.view([("public", entries)])
+        assert view.find(index, normalize(query)) == scan(entries, query), query
+
+    # appended entries are found, a replaced cache is indexed again
+    entries.append({"user": "nové slovo", "jarvik": ""})
+    view = timeline.view([("public", entries)])
+    assert view.find(index, "nove") == [entries[-1]]
+    replaced = entries[:10]
+    view = timeline.view([("public", replaced)])
+    assert view.find(index, "nove") == []
+    assert view.find(index, "kun") == scan(replaced, "kun")
@@ -18,6 +18,12 @@ def knowledge_dir(tmp_path):
     return folder
 
 
+@pytest.fixture
+def tiny_chunks(monkeypatch):
+    """Keep every paragraph of the tiny test files a chunk of its own."""
+    monkeypatch.setenv("RAG_CHUNK_MIN_TOKENS", "1")
+
+
 def test_search_knowledge_word_match():
     chunks = [
         "This is a hello text",
@@ -191,3 +197,882 @@ def test_search_knowledge_threshold_vector(monkeypatch):
     monkeypatch.setenv("RAG_THRESHOLD", "1.0")
     result = search_knowledge("x", chunks, threshold=0.2)
     assert result == ["a"]
+
+
+class CountingModel:
+    """Tiny deterministic embedding model recording every encode call."""
+
+    calls: list = []
+
+    def __init__(self, *_args, **_kwargs):
+        pass
+
+    def encode(self, data, **_kwargs):
+        import numpy as np
+
+        CountingModel.calls.append(list(data))
+        vecs = np.array(
+            [[float(len(t)), float(sum(map(ord, t)) % 7) + 1.0] for t in data],
+            dtype="float32",
+        )
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_embedding_cache_persists_vectors(tmp_path):
+    np = pytest.importorskip("numpy")
+    CountingModel.calls = []
+    model = CountingModel()
+
+    def encode(texts):
+        return model.encode(texts)
+
+    cache = rag_engine.EmbeddingCache(str(tmp_path), "dummy/model")
+    first = cache.encode(["alpha", "beta"], encode)
+    assert CountingModel.calls == [["alpha", "beta"]]
+
+    # A new instance (e.g. after a restart) reads the vectors from disk
+    cache = rag_engine.EmbeddingCache(str(tmp_path), "dummy/model")
+    second = cache.encode(["beta  ", "alpha", "gamma"], encode)
+    assert CountingModel.calls[-1] == ["gamma"]
+    assert np.allclose(second[0], first[1])
+    assert np.allclose(second[1], first[0])
+    assert cache.hits == 2 and cache.misses == 1
+
+
+def test_knowledge_base_reload_encodes_only_new_paragraphs(monkeypatch, tmp_path, tiny_chunks):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    CountingModel.calls = []
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setattr(rag_engine, "SentenceTransformer", CountingModel, raising=False)
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir=str(tmp_path / "cache"))
+    assert CountingModel.calls == [["alpha", "beta"]]
+
+    (folder / "b.txt").write_text("gamma", encoding="utf-8")
+    kb.reload()
+    assert CountingModel.calls[-1] == ["gamma"]
+    assert kb.index.ntotal == 3
+
+
+def test_knowledge_base_update_applies_file_changes(monkeypatch, tmp_path, tiny_chunks):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    CountingModel.calls = []
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setattr(rag_engine, "SentenceTransformer", CountingModel, raising=False)
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    (folder / "b.txt").write_text("gamma", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="")
+    assert kb.index.ntotal == 3
+
+    assert kb.update() == {"added": 0, "changed": 0, "removed": 0}
+
+    (folder / "a.txt").write_text("alpha\n\ndelta\n\nepsilon", encoding="utf-8")
+    (folder / "b.txt").unlink()
+    (folder / "c.txt").write_text("zeta", encoding="utf-8")
+    calls_before = len(CountingModel.calls)
+    assert kb.update() == {"added": 1, "changed": 1, "removed": 1}
+    assert len(CountingModel.calls) == calls_before + 1
+    assert sorted(CountingModel.calls[-1]) == ["delta", "epsilon", "zeta"]
+    assert sorted(kb.chunks) == ["alpha", "delta", "epsilon", "zeta"]
+    assert kb.index.ntotal == 4
+
+
+def test_layered_knowledge_base_merges_shared_and_overlay(tmp_path, tiny_chunks):
+    public = tmp_path / "public"
+    private = tmp_path / "private"
+    public.mkdir()
+    private.mkdir()
+    (public / "a.txt").write_text("alpha\n\ncommon", encoding="utf-8")
+    (private / "b.txt").write_text("beta\n\ncommon", encoding="utf-8")
+
+    shared = KnowledgeBase(str(public))
+    kb = rag_engine.LayeredKnowledgeBase(shared, KnowledgeBase(str(private)))
+
+    assert kb.search("alpha") == ["alpha"]
+    assert kb.search("beta") == ["beta"]
+    # Identical paragraphs from both layers are returned once
+    assert kb.search("common") == ["common"]
+    assert kb.folders == [str(public), str(private)]
+    assert sorted(kb.chunks) == ["alpha", "beta", "common", "common"]
+
+
+def test_model_registry_loads_each_model_once(monkeypatch, tmp_path):
+    loads = []
+
+    class LoadCountingModel(CountingModel):
+        def __init__(self, name, *_args, **_kwargs):
+            loads.append(name)
+
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setattr(rag_engine, "SentenceTransformer", LoadCountingModel, raising=False)
+
+    # An empty knowledge base never needs the model
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    KnowledgeBase(str(empty), model_name="m1")
+    assert loads == []
+
+    assert rag_engine.get_model("m1") is rag_engine.get_model("m1")
+    search_knowledge("x", ["a"], threshold=2.0)
+    search_knowledge("y", ["b"], threshold=2.0)
+    assert loads.count("m1") == 1
+    assert loads.count(rag_engine._default_model_name()) == 1
+    assert set(rag_engine.model_stats()) == {"m1", rag_engine._default_model_name()}
+
+
+def test_knowledge_base_indexes_topic_folders_once(tmp_path):
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "_index.json").write_text('{"t1": "first", "t2": "second"}', encoding="utf-8")
+    (folder / "root.txt").write_text("root", encoding="utf-8")
+    for topic, word in (("t1", "alpha"), ("t2", "beta"), ("t3", "gamma")):
+        (folder / topic).mkdir()
+        (folder / topic / "a.txt").write_text(word, encoding="utf-8")
+
+    kb = KnowledgeBase(str(folder))
+    assert sorted(kb.chunks) == ["alpha", "beta", "root"]
+
+    # Without a filter only files directly in the folder are searched
+    assert kb.search("alpha") == []
+    assert kb.search("root") == ["root"]
+    assert kb.search("alpha", topics=["t1"]) == ["alpha"]
+    assert kb.search("alpha", topics=["t2"]) == []
+    assert kb.search("beta", topics=["t1", "t2"]) == ["beta"]
+
+    # Topic folders missing from _index.json are indexed by a successor,
+    # the instance serving the search stays as it is
+    assert kb.missing_topics(["t3"]) == ["t3"]
+    background = rag_engine.BackgroundKnowledgeBase(kb)
+    assert background.search("gamma", topics=["t3"]) == []
+    assert background.wait(5)
+    assert background.search("gamma", topics=["t3"]) == ["gamma"]
+    assert "gamma" in background.chunks and "gamma" not in kb.chunks
+
+
+def test_bm25_index_ranks_and_removes_documents():
+    index = rag_engine.BM25Index()
+    index.add(1, "Postup pro schvalování dílů APQP")
+    index.add(2, "APQP a PPAP, APQP fáze")
+    index.add(3, "Kytice z pověstí národních")
+
+    ranked = index.search("apqp")
+    assert [doc for _score, doc in ranked] == [2, 1]
+    assert index.search("schvalovani dilu", top_k=1)[0][1] == 1
+    # Misspelled terms are expanded to close vocabulary words
+    assert [doc for _score, doc in index.search("povesti narodnch")] == [3]
+
+    index.remove(2, "APQP a PPAP, APQP fáze")
+    assert [doc for _score, doc in index.search("apqp")] == [1]
+    assert len(index) == 2
+
+
+def test_lexical_fallback_only_scores_candidates(monkeypatch):
+    calls = []
+    real = rag_engine._normalized_similarity
+
+    def counting(a, b):
+        calls.append(b)
+        return real(a, b)
+
+    monkeypatch.setattr(rag_engine, "_normalized_similarity", counting)
+    chunks = [f"unrelated paragraph number {i}" for i in range(200)]
+    chunks.append("IATF 16949 audit checklist")
+    assert search_knowledge("IATF audit", chunks) == ["IATF 16949 audit checklist"]
+    assert len(calls) == 1
+
+
+def test_knowledge_base_hybrid_search_fuses_rankings(monkeypatch, tmp_path, tiny_chunks):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+
+    class MappedModel:
+        vectors = {
+            "IATF": [1.0, 0.0],
+            "quality manual": [1.0, 0.0],
+            "IATF 16949 audit": [0.0, 1.0],
+        }
+
+        def encode(self, data, **_kwargs):
+            return np.array([self.vectors[t] for t in data], dtype="float32")
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("quality manual\n\nIATF 16949 audit", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="", model=MappedModel())
+    assert kb._lexical
+
+    assert kb.search("IATF", threshold=0.5) == ["quality manual"]
+    assert kb.search("IATF", threshold=0.5, mode="lexical") == ["IATF 16949 audit"]
+    hybrid = kb.search_scored("IATF", threshold=0.5, mode="hybrid")
+    assert {chunk for _score, chunk in hybrid} == {"quality manual", "IATF 16949 audit"}
+    assert hybrid[0][0] == pytest.approx(1 / 61)
+
+    with pytest.raises(ValueError):
+        kb.search("IATF", mode="fuzzy")
+
+
+def test_vector_knowledge_base_answers_lexical_searches_without_a_rebuild(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "numpy")
+    (tmp_path / "a.txt").write_text("Jablka rostou na stromech.", encoding="utf-8")
+    kb = KnowledgeBase(str(tmp_path), cache_dir="", model=CountingModel(), mode="vector")
+    background = rag_engine.BackgroundKnowledgeBase(kb)
+    assert kb._lexical
+
+    assert background.search("jablka", threshold=0.5, mode="lexical") == ["Jablka rostou na stromech."]
+    assert background.search("jablka", threshold=0.5, mode="hybrid") == ["Jablka rostou na stromech."]
+    assert background.current is kb and background.builds == 0
+
+
+def test_choose_index_type(monkeypatch):
+    monkeypatch.delenv("RAG_INDEX_TYPE", raising=False)
+    assert rag_engine.choose_index_type(1_000) == "flat"
+    assert rag_engine.choose_index_type(200_000) == "ivf"
+    assert rag_engine.choose_index_type(2_000_000) == "ivfpq"
+    monkeypatch.setenv("RAG_INDEX_TYPE", "hnsw")
+    assert rag_engine.choose_index_type(10) == "hnsw"
+    # trained types need enough vectors first
+    assert rag_engine.choose_index_type(10, "ivf") == "flat"
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_vector_index_types_search_and_remove(kind):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((2_000, 16)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ids = np.arange(100, 2_100, dtype="int64")
+    index = rag_engine.VectorIndex.build(vecs, ids, kind)
+    assert index.kind == kind and index.ntotal == 2_000
+
+    _scores, found = index.search(vecs[:1], 3)
+    assert found[0][0] == 100
+    index.remove([100])
+    _scores, found = index.search(vecs[:1], 3)
+    assert 100 not in found[0] and index.ntotal == 1_999
+
+
+def test_choose_codec(monkeypatch):
+    monkeypatch.delenv("RAG_VECTOR_CODEC", raising=False)
+    assert rag_engine.choose_codec(1_000) == "none"
+    monkeypatch.setenv("RAG_VECTOR_CODEC", "pq")
+    assert rag_engine.choose_codec(50_000) == "pq"
+    # product quantization needs enough vectors to train
+    assert rag_engine.choose_codec(500) == "int8"
+    monkeypatch.setenv("RAG_PCA_DIM", "128")
+    assert rag_engine.choose_pca_dim(384, 5_000) == 128
+    assert rag_engine.choose_pca_dim(384, 10) == 0
+    assert rag_engine.choose_pca_dim(64, 5_000) == 0
+
+
+@pytest.mark.parametrize(
+    "kind,codec,pca_dim", [("flat", "fp16", 0), ("flat", "int8", 0), ("ivf", "int8", 24)]
+)
+def test_vector_index_compressed_codecs(monkeypatch, tmp_path, kind, codec, pca_dim):
+    np = pytest.importorskip("numpy")
+    faiss = pytest.importorskip("faiss")
+    monkeypatch.setenv("RAG_INDEX_TYPE", kind)
+    monkeypatch.setenv("RAG_VECTOR_CODEC", codec)
+    monkeypatch.setenv("RAG_PCA_DIM", str(pca_dim))
+    rng = np.random.default_rng(0)
+    # vectors spanning a low dimensional subspace survive the projection
+    vecs = rng.standard_normal((2_000, 16)) @ rng.standard_normal((16, 32))
+    vecs = (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype("float32")
+    ids = np.arange(2_000, dtype="int64")
+    index = rag_engine.VectorIndex.build(vecs, ids)
+    assert (index.kind, index.codec, index.pca_dim) == (kind, codec, pca_dim)
+    assert not index.needs_rebuild
+
+    _scores, found = index.search(vecs[:20], 1)
+    assert (found[:, 0] == ids[:20]).mean() >= 0.9
+    index.remove([0])
+    assert 0 not in index.search(vecs[:1], 3)[1][0]
+
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index.index, path)
+    restored = rag_engine.VectorIndex.restore(
+        faiss.read_index(path), kind, index.trained_size, [], codec, pca_dim
+    )
+    assert restored.dim == 32 and restored.ntotal == 1_999
+    assert (restored.search(vecs[1:2], 1)[1] == index.search(vecs[1:2], 1)[1]).all()
+
+
+def test_knowledge_base_rebuilds_index_when_corpus_grows(monkeypatch, tmp_path, tiny_chunks):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_INDEX_TYPE", "ivf")
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="", model=CountingModel())
+    assert kb.index.kind == "flat"
+
+    paragraphs = "\n\n".join(f"paragraph {i} {'x' * (i % 50)}" for i in range(1_200))
+    (folder / "b.txt").write_text(paragraphs, encoding="utf-8")
+    kb.update()
+    assert kb.index.kind == "ivf"
+    assert kb.index.ntotal == 1_202
+    assert kb.search("beta", threshold=0.0, top_k=50)
+
+
+def test_lru_cache_evicts_and_expires(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(rag_engine.time, "monotonic", lambda: now[0])
+    cache = rag_engine._LRUCache(2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts the least recently used "b"
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 1, "misses": 2}
+
+
+def test_knowledge_base_caches_queries_until_update(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    CountingModel.calls = []
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="", model=CountingModel())
+
+    first = kb.search("alpha", threshold=0.0)
+    assert kb.search("alpha", threshold=0.0) == first
+    assert CountingModel.calls.count(["alpha"]) == 1
+    assert rag_engine.cache_stats()["search_results"]["hits"] == 1
+
+    (folder / "b.txt").write_text("gamma", encoding="utf-8")
+    kb.update()
+    assert "gamma" in kb.search("alpha", threshold=0.0)
+    # the query embedding is still reused after the index changed
+    assert CountingModel.calls.count(["alpha"]) == 1
+
+
+def test_clear_models_drops_cached_query_embeddings():
+    rag_engine._query_embeddings.put(("m", "alpha"), "old vector")
+    rag_engine._search_results.put(("kb", "alpha"), "old hits")
+    rag_engine.clear_models()
+    # a model loaded next may reuse the id of the old one
+    assert rag_engine._query_embeddings.get(("m", "alpha")) is None
+    assert rag_engine._search_results.get(("kb", "alpha")) is None
+
+
+def test_embedding_batcher_groups_concurrent_queries():
+    import threading
+
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return [f"vec:{t}" for t in texts]
+
+    batcher = rag_engine.EmbeddingBatcher(encode, window_ms=200, max_batch=4)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.encode(f"q{i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: f"vec:q{i}" for i in range(8)}
+    assert sum(map(len, calls)) == 8
+    assert len(calls) < 8 and max(map(len, calls)) <= 4
+
+
+def test_embedding_batcher_propagates_errors():
+    def encode(texts):
+        raise RuntimeError("boom")
+
+    batcher = rag_engine.EmbeddingBatcher(encode, window_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.encode("x")
+    assert rag_engine.EmbeddingBatcher(lambda t: ["direct"], window_ms=0).encode("x") == "direct"
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_embedding_batcher_recovers_from_interrupted_worker():
+    calls = []
+
+    def encode(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise SystemExit
+        return [t.upper() for t in texts]
+
+    batcher = rag_engine.EmbeddingBatcher(encode, window_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.encode("x")
+    # the dead worker is not left registered, so a new one serves the next query
+    assert batcher.encode("y") == "Y"
+
+
+@pytest.mark.parametrize("mmap", ["1", "0"])
+def test_knowledge_base_loads_saved_index(monkeypatch, tmp_path, tiny_chunks, mmap):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_INDEX_MMAP", mmap)
+    folder = tmp_path / "kb"
+    (folder / "t1").mkdir(parents=True)
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    (folder / "t1" / "b.txt").write_text("gamma", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb = KnowledgeBase(
+        str(folder), topics=["t1"], cache_dir="", index_dir=index_dir, model=CountingModel()
+    )
+
+    CountingModel.calls = []
+    kb2 = KnowledgeBase(
+        str(folder), topics=["t1"], cache_dir="", index_dir=index_dir, model=CountingModel()
+    )
+    assert CountingModel.calls == []
+    assert sorted(kb2.chunks) == sorted(kb.chunks)
+    assert kb2.search("gamma", threshold=0.0, topics=["t1"]) == ["gamma"]
+
+    # files changed while the server was down are applied incrementally
+    CountingModel.calls = []
+    (folder / "c.txt").write_text("delta", encoding="utf-8")
+    kb3 = KnowledgeBase(
+        str(folder), topics=["t1"], cache_dir="", index_dir=index_dir, model=CountingModel()
+    )
+    assert CountingModel.calls == [["delta"]]
+    assert kb3.index.ntotal == 3
+
+
+def test_knowledge_base_rebuilds_snapshot_of_another_index_type(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "faiss")
+    monkeypatch.setenv("RAG_INDEX_TYPE", "flat")
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert kb.index.kind == "flat"
+
+    monkeypatch.setenv("RAG_INDEX_TYPE", "hnsw")
+    kb2 = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert kb2.index.kind == "hnsw"
+    assert kb2.search("alpha", threshold=0.0, top_k=1) == ["alpha"]
+
+
+def test_knowledge_base_saves_nothing_with_a_temporary_store(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "numpy")
+
+    def no_blob(_folder):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(rag_engine, "_new_blob_path", no_blob)
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha", encoding="utf-8")
+    index_dir = tmp_path / "index"
+    kb = KnowledgeBase(str(folder), cache_dir="", index_dir=str(index_dir), model=CountingModel())
+    assert kb.search("alpha", threshold=0.0, top_k=1) == ["alpha"]
+    # no index files without the meta.json and chunks.idx describing them
+    assert [p for p in index_dir.rglob("*") if p.is_file() and p.name != ".lock"] == []
+
+
+def test_chunk_store_slices_texts_from_blob(tmp_path):
+    store = rag_engine.ChunkStore(str(tmp_path / "chunks-a.bin"))
+    a = store.add("žluťoučký kůň", "/kb/a.txt")
+    b = store.add("beta", "/kb/t1/b.txt", "t1")
+    assert store.get(a) == "žluťoučký kůň" and store.get(b) == "beta"
+    assert store.source(b) == "/kb/t1/b.txt" and store.topic(b) == "t1"
+    store.remove(a)
+    assert a not in store and len(store) == 1
+    assert store.ids() == [b] and store.ids("t1") == [b] and store.ids(None) == []
+
+    meta = store.save_index(str(tmp_path / "chunks.idx"))
+    opened = rag_engine.ChunkStore.open(str(tmp_path), str(tmp_path / "chunks.idx"), meta)
+    assert opened.get(b) == "beta" and a not in opened
+    # appending to a store opened from a snapshot leaves the shared blob alone
+    c = opened.add("gamma", "/kb/c.txt")
+    d = opened.add("delta", "/kb/t2/d.txt", "t2")
+    assert opened.get(c) == "gamma"
+    assert opened.ids(None) == [c] and opened.ids("t1") == [b] and opened.ids("t2") == [d]
+    assert opened.ids("missing") == []
+    assert opened.path != store.path
+    assert (tmp_path / "chunks-a.bin").stat().st_size == meta["size"]
+
+
+def test_snapshot_keeps_blobs_of_open_stores(monkeypatch, tmp_path):
+    import gc
+
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "numpy")
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    served = kb._store.path
+
+    (folder / "b.txt").write_text("beta", encoding="utf-8")
+    successor = kb.successor()
+    # the snapshot moved to a new blob, the served instance still reads the old one
+    assert successor._store.path != served and os.path.exists(served)
+    assert kb.search("alpha", threshold=0.0, top_k=1) == ["alpha"]
+
+    del kb
+    gc.collect()
+    (folder / "c.txt").write_text("gamma", encoding="utf-8")
+    successor.update()
+    blobs = sorted(p.name for p in (tmp_path / "index").rglob("chunks-*.bin"))
+    assert blobs == [os.path.basename(successor._store.path)]
+
+
+def test_knowledge_base_search_cites_sources(tmp_path):
+    folder = tmp_path / "kb"
+    (folder / "t1").mkdir(parents=True)
+    (folder / "a.txt").write_text("alpha", encoding="utf-8")
+    (folder / "t1" / "b.txt").write_text("IATF audit", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), topics=["t1"])
+    hits = kb.search_cited("IATF audit", threshold=0.5)
+    assert hits == [
+        {
+            "text": "IATF audit",
+            "score": 1.0,
+            "source": "t1/b.txt",
+            "sources": ["t1/b.txt"],
+            "topic": "t1",
+        }
+    ]
+
+
+def test_knowledge_base_indexes_documents_once(monkeypatch, tmp_path):
+    import extraction
+
+    calls = []
+
+    def fake_extract(path):
+        calls.append(os.path.basename(path))
+        return "IATF kapitola\n\nAPQP postup"
+
+    monkeypatch.setattr(extraction, "extract_text", fake_extract)
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "manual.pdf").write_bytes(b"%PDF fake")
+    (folder / "guide.docx").write_bytes(b"PK fake")
+    (folder / "guide.txt").write_text("converted guide", encoding="utf-8")
+    (folder / "notes.md").write_text("# Notes\n\nmarkdown text", encoding="utf-8")
+    (folder / "README.md").write_text("About this folder", encoding="utf-8")
+    cache = str(tmp_path / "cache")
+    monkeypatch.setenv("RAG_EXTRACT_WORKERS", "1")
+
+    kb = KnowledgeBase(str(folder), cache_dir=cache)
+    # guide.txt takes precedence over guide.docx with the same stem
+    assert calls == ["manual.pdf"]
+    # each short file is a single chunk with the default chunk settings
+    assert sorted(kb.chunks) == sorted(
+        ["IATF kapitola\n\nAPQP postup", "converted guide", "# Notes\nmarkdown text"]
+    )
+
+    # a full reload reads the extracted text from the cache
+    kb.reload()
+    assert calls == ["manual.pdf"]
+    assert "IATF kapitola\n\nAPQP postup" in kb.chunks
+
+
+def test_knowledge_base_chunks_a_realistic_document_with_defaults(tmp_path):
+    from chunking import count_tokens
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    steps = "\n".join(
+        f"- Krok {i}: zkontrolujte rozměr dílu číslo {i} podle výkresu a zapište výsledek do karty."
+        for i in range(1, 9)
+    )
+    intro = " ".join(
+        f"Odstavec {i} popisuje, jak dodavatel předkládá dokumentaci PPAP zákazníkovi."
+        for i in range(1, 13)
+    )
+    text = (
+        "# Příručka kvality\n\n"
+        f"{intro}\n\n"
+        "## Sekce 1\n"
+        "Postup:\n\n"
+        f"{steps}\n\n"
+        "## Sekce 2\n"
+        "Audit procesu provádí oddělení kvality jednou ročně podle normy VDA 6.3."
+    )
+    (folder / "manual.md").write_text(text, encoding="utf-8")
+
+    kb = KnowledgeBase(str(folder))
+    assert len(kb.chunks) > 3
+    assert all(count_tokens(c) <= 100 for c in kb.chunks)
+    # the lone "Postup:" line is merged into the list that follows it
+    assert "Postup:" not in kb.chunks
+    assert any(c.startswith("## Sekce 1\nPostup:\n\n- Krok 1") for c in kb.chunks)
+    # every section starts a chunk of its own
+    assert not any("## Sekce 1" in c and "## Sekce 2" in c for c in kb.chunks)
+    assert kb.chunks[-1].startswith("## Sekce 2\nAudit procesu")
+    assert kb.search("VDA 6.3") == [kb.chunks[-1]]
+
+
+GUIDE = (
+    "Dodavatel musí předložit PPAP dokumentaci nejpozději dva týdny před "
+    "zahájením sériové výroby a schválení potvrdí oddělení kvality zákazníka."
+)
+
+
+def test_minhash_index_finds_near_duplicates():
+    pytest.importorskip("numpy")
+    index = rag_engine.MinHashIndex(0.8)
+    index.add(1, index.signature(GUIDE))
+    assert index.find(index.signature(GUIDE.upper() + " ")) == 1
+    assert index.find(index.signature(GUIDE.replace("dva týdny", "dva  týdny,"))) == 1
+    assert index.find(index.signature("Zcela jiný odstavec o měření a SPC.")) is None
+    index.remove(1)
+    assert index.find(index.signature(GUIDE)) is None and len(index) == 0
+
+
+def test_knowledge_base_collapses_duplicate_chunks(tmp_path, tiny_chunks):
+    pytest.importorskip("numpy")
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "guide.txt").write_text(GUIDE + "\n\nPůvodní poznámka", encoding="utf-8")
+    copy = GUIDE.rstrip(".") + " (kopie)."
+    (folder / "guide_kopie.txt").write_text(copy, encoding="utf-8")
+    kb = KnowledgeBase(str(folder))
+    assert sorted(kb.chunks) == sorted([GUIDE, "Původní poznámka"])
+    assert kb.stats() == {"files": 2, "chunks": 2, "duplicates": 1}
+    hits = kb.search_cited("PPAP dokumentaci", threshold=0.5)
+    assert hits[0]["source"] == "guide.txt"
+    assert hits[0]["sources"] == ["guide.txt", "guide_kopie.txt"]
+
+    # the copy takes over once the original is gone
+    (folder / "guide.txt").unlink()
+    kb.update()
+    assert kb.chunks == [copy]
+    assert kb.stats()["duplicates"] == 0
+    assert kb.search_cited("PPAP dokumentaci", threshold=0.5)[0]["sources"] == ["guide_kopie.txt"]
+
+
+
+def test_knowledge_base_rebuild_skips_removed_duplicates(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(rag_engine.NumpyIndex, "needs_rebuild", True)
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text(GUIDE, encoding="utf-8")
+    (folder / "b.txt").write_text(GUIDE + " ", encoding="utf-8")
+    (folder / "c.txt").write_text(GUIDE.replace("PPAP", "ppap"), encoding="utf-8")
+    (folder / "d.txt").write_text("Audit procesu provádí oddělení kvality.", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="", model=CountingModel())
+    assert kb.index.ntotal == 2 and kb.duplicates == 2
+
+    # the canonical chunk and one of its copies go, the other copy takes over
+    (folder / "a.txt").unlink()
+    (folder / "c.txt").unlink()
+    kb.update()
+    assert kb.duplicates == 0
+    assert kb.index.ntotal == 2
+    assert sorted(kb.chunks) == sorted([GUIDE, "Audit procesu provádí oddělení kvality."])
+    assert kb.search_cited(GUIDE, threshold=0.0)[0]["sources"] == ["b.txt"]
+
+def test_knowledge_base_keeps_duplicates_in_snapshot(monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text(GUIDE, encoding="utf-8")
+    (folder / "b.txt").write_text(GUIDE + " ", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert kb.index.ntotal == 1 and kb.duplicates == 1
+
+    CountingModel.calls = []
+    (folder / "c.txt").write_text(GUIDE.replace("PPAP", "ppap"), encoding="utf-8")
+    kb2 = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    # the third copy is matched against the saved signatures, nothing is encoded
+    assert CountingModel.calls == []
+    assert kb2.duplicates == 2 and kb2.index.ntotal == 1
+    assert kb2.search_cited(GUIDE, threshold=0.0)[0]["sources"] == ["a.txt", "b.txt", "c.txt"]
+
+    monkeypatch.setenv("RAG_DEDUP_THRESHOLD", "0")
+    kb3 = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert kb3.duplicates == 0 and kb3.index.ntotal == 3
+
+
+def test_background_knowledge_base_swaps_and_coalesces(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    (tmp_path / "a.txt").write_text("Jablka rostou na stromech.", encoding="utf-8")
+    kb = KnowledgeBase(str(tmp_path), cache_dir="")
+    background = rag_engine.BackgroundKnowledgeBase(kb)
+
+    gate = threading.Event()
+    builds = []
+    successor = KnowledgeBase.successor
+
+    def slow_successor(self, topics=None, full=False, on_progress=None, **kwargs):
+        gate.wait(5)
+        builds.append(full)
+        return successor(self, topics, full, on_progress, **kwargs)
+
+    monkeypatch.setattr(KnowledgeBase, "successor", slow_successor)
+    (tmp_path / "b.txt").write_text("Hrušky rostou na zahradě.", encoding="utf-8")
+    assert background.update() == {}
+    for _ in range(500):
+        if background.status()["state"] == "building":
+            break
+        time.sleep(0.01)
+    background.update()
+    background.reload()
+    background.update()
+
+    status = background.status()
+    assert status["pending"] and status["coalesced"] == 2
+    # searches keep using the untouched instance while the build runs
+    assert background.current is kb
+    assert background.chunks == ["Jablka rostou na stromech."]
+
+    gate.set()
+    assert background.wait(10)
+    assert builds == [False, True]
+    assert background.current is not kb
+    assert kb.chunks == ["Jablka rostou na stromech."]
+    assert sorted(background.chunks) == [
+        "Hrušky rostou na zahradě.",
+        "Jablka rostou na stromech.",
+    ]
+    status = background.status()
+    assert status["generation"] == 2 and status["state"] == "idle"
+    assert not status["pending"] and status["last_error"] is None
+
+
+class PoolModel(CountingModel):
+    """Counting model with the multi-process pool API of sentence-transformers."""
+
+    pools: list = []
+
+    def start_multi_process_pool(self, target_devices):
+        PoolModel.pools.append(list(target_devices))
+        return {"open": True}
+
+    def encode_multi_process(self, data, pool, batch_size=32, **_kwargs):
+        assert pool["open"] and batch_size == 8
+        return CountingModel.encode(self, data) * 3
+
+    def stop_multi_process_pool(self, pool):
+        pool["open"] = False
+        PoolModel.pools.append("stopped")
+
+
+def test_knowledge_base_encodes_large_builds_in_process_pool(monkeypatch, tmp_path, tiny_chunks):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    CountingModel.calls = []
+    PoolModel.pools = []
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setattr(rag_engine, "SentenceTransformer", PoolModel, raising=False)
+    monkeypatch.setattr(rag_engine, "_MIN_POOL_CHUNKS", 3)
+    monkeypatch.setenv("RAG_ENCODE_PROCESSES", "4")
+    monkeypatch.setenv("RAG_ENCODE_BATCH", "8")
+
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta\n\ngamma", encoding="utf-8")
+    kb = KnowledgeBase(str(folder), cache_dir="")
+    assert PoolModel.pools == [["cpu"] * 4, "stopped"]
+    assert CountingModel.calls == [["alpha", "beta", "gamma"]]
+    assert kb.index.ntotal == 3
+
+    # small updates are encoded in-process without starting workers
+    (folder / "b.txt").write_text("delta", encoding="utf-8")
+    kb.update()
+    assert PoolModel.pools == [["cpu"] * 4, "stopped"]
+    assert CountingModel.calls[-1] == ["delta"]
+
+    with rag_engine.CorpusEncoder(PoolModel(), min_chunks=0) as encode:
+        vectors = encode(["x", "yy"])
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+
+def test_numpy_index_searches_batches_exactly():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((500, 16)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    index = rag_engine.NumpyIndex.build(vecs, np.arange(1_000, 1_500, dtype="int64"))
+    assert index.ntotal == 500 and not index.needs_rebuild
+
+    scores, found = index.search(vecs[:4], 5)
+    expected = np.argsort(-(vecs[:4] @ vecs.T), axis=1)[:, :5] + 1_000
+    assert (found == expected).all()
+    assert np.all(scores[:, :-1] >= scores[:, 1:])
+
+    index.remove([1_000, 1_499, 42])
+    _scores, found = index.search(vecs[:1], 3)
+    assert 1_000 not in found[0] and index.ntotal == 498
+    _scores, found = index.search(vecs[498:499], 1)
+    assert found[0][0] == 1_498
+
+    small = rag_engine.NumpyIndex.build(vecs[:2], np.array([7, 8], dtype="int64"))
+    scores, found = small.search(vecs[:1], 4)
+    assert found[0].tolist() == [7, 8, -1, -1] and scores[0][3] == -np.inf
+
+
+@pytest.mark.parametrize("mmap", ["1", "0"])
+def test_knowledge_base_numpy_backend_saves_and_updates(monkeypatch, tmp_path, tiny_chunks, mmap):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(rag_engine, "VECTOR_SUPPORT", True)
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "numpy")
+    monkeypatch.setenv("RAG_INDEX_MMAP", mmap)
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    (folder / "b.txt").write_text("gamma", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert isinstance(kb.index, rag_engine.NumpyIndex)
+    assert kb.search("gamma", threshold=0.0, top_k=1) == ["gamma"]
+
+    CountingModel.calls = []
+    kb2 = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+    assert CountingModel.calls == [] and kb2.index.ntotal == 3
+
+    (folder / "b.txt").unlink()
+    (folder / "c.txt").write_text("delta", encoding="utf-8")
+    kb2.update()
+    assert sorted(kb2.chunks) == ["alpha", "beta", "delta"]
+    assert kb2.index.ntotal == 3
+    assert kb2.search("delta", threshold=0.0, top_k=1) == ["delta"]
+
+    if rag_engine.faiss is not None:
+        # a snapshot of the other backend is rebuilt instead of loaded
+        monkeypatch.setenv("RAG_VECTOR_BACKEND", "faiss")
+        CountingModel.calls = []
+        kb3 = KnowledgeBase(str(folder), cache_dir="", index_dir=index_dir, model=CountingModel())
+        assert isinstance(kb3.index, rag_engine.VectorIndex)
+        assert sorted(CountingModel.calls[0]) == ["alpha", "beta", "delta"]
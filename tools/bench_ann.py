@@ -0,0 +1,153 @@
+"""Report recall@k, query latency and memory of the vector index types.
+
+The exact float32 brute-force index is the reference. Every other type and
+vector codec is built on the same synthetic, clustered and normalized vectors
+and queried one vector at a time, like ``KnowledgeBase.search`` does. Memory is
+the serialized index size, which is what the index keeps resident::
+
+    python -m tools.bench_ann
+    python -m tools.bench_ann --sizes 10000,100000,1000000 --types ivf,ivfpq
+    python -m tools.bench_ann --nprobe 64 --ef-search 128
+    python -m tools.bench_ann --types flat --codecs none,fp16,int8,pq --pca 0,128
+    python -m tools.bench_ann --types numpy,flat --sizes 10000,100000
+
+``numpy`` is the brute-force :class:`rag_engine.NumpyIndex` used without
+faiss; codecs and PCA do not apply to it and it is the only type available
+when faiss is not installed.
+
+The synthetic vectors spread over all dimensions, which is the worst case
+for PQ and PCA. ``--from-index rag_index/<key>/index.faiss`` benchmarks the
+embeddings of a saved flat knowledge index instead.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+import rag_engine
+from rag_engine import faiss
+
+
+def synthetic_vectors(size: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Return *size* normalized vectors scattered around random centres."""
+    centres = rng.standard_normal((max(size // 200, 8), dim)).astype("float32")
+    vectors = np.empty((size, dim), dtype="float32")
+    step = 100_000
+    for start in range(0, size, step):
+        count = min(step, size - start)
+        labels = rng.integers(0, len(centres), count)
+        noise = rng.standard_normal((count, dim)).astype("float32")
+        vectors[start:start + count] = centres[labels] + 0.6 * noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def snapshot_vectors(path: str) -> np.ndarray:
+    """Return the vectors of a flat index saved by ``KnowledgeBase``."""
+    index = faiss.read_index(path)
+    base = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def make_queries(vectors: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Return noisy copies of random corpus vectors."""
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    queries = picked + 0.1 * rng.standard_normal(picked.shape).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run_queries(index, queries: np.ndarray, k: int) -> tuple[list[float], np.ndarray]:
+    """Search every query on its own and return latencies (ms) and ids."""
+    times, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _scores, ids = index.search(query[None, :], k)
+        times.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return times, np.array(found)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Return the mean share of the exact top-k found by the index."""
+    hits = [len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]
+    return statistics.mean(hits)
+
+
+def _percentile(times: list[float], q: float) -> float:
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * q))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark vector index types")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma separated corpus sizes")
+    parser.add_argument(
+        "--types", default="flat,ivf,ivfpq,hnsw,numpy", help="Index types to compare"
+    )
+    parser.add_argument("--codecs", default="none", help="RAG_VECTOR_CODEC values to compare")
+    parser.add_argument("--pca", default="0", help="RAG_PCA_DIM values to compare")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, help="Sets RAG_NPROBE for IVF indexes")
+    parser.add_argument("--ef-search", type=int, help="Sets RAG_EF_SEARCH for HNSW")
+    parser.add_argument("--from-index", help="Use the vectors of this saved flat index")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.nprobe:
+        os.environ["RAG_NPROBE"] = str(args.nprobe)
+    if args.ef_search:
+        os.environ["RAG_EF_SEARCH"] = str(args.ef_search)
+
+    rng = np.random.default_rng(args.seed)
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    if faiss is None:
+        if args.from_index or set(types) - {"numpy"}:
+            parser.error("faiss-cpu is required for all types except numpy")
+
+    codecs = [c.strip() for c in args.codecs.split(",") if c.strip()]
+    pcas = [int(p) for p in args.pca.split(",")]
+    print(
+        f"{'size':>9} {'type':<6} {'codec':<5} {'pca':>4} {'build s':>8} {'index MB':>9}"
+        f" {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    sizes = [0] if args.from_index else [int(s) for s in args.sizes.split(",")]
+    for size in sizes:
+        if args.from_index:
+            vectors = snapshot_vectors(args.from_index)
+            size = len(vectors)
+        else:
+            vectors = synthetic_vectors(size, args.dim, rng)
+        ids = np.arange(size, dtype="int64")
+        queries = make_queries(vectors, args.queries, rng)
+        os.environ["RAG_PCA_DIM"] = "0"
+        exact = rag_engine.NumpyIndex.build(vectors, ids)
+        _times, truth = run_queries(exact, queries, args.k)
+        del exact
+        for kind, codec, pca in ((t, c, p) for t in types for c in codecs for p in pcas):
+            if kind == "numpy" and (codec, pca) != (codecs[0], pcas[0]):
+                continue  # codecs and PCA do not apply
+            os.environ["RAG_PCA_DIM"] = str(pca)
+            start = time.perf_counter()
+            if kind == "numpy":
+                index = rag_engine.NumpyIndex.build(vectors, ids)
+                size_mb = index.nbytes / 2**20
+            else:
+                index = rag_engine.VectorIndex.build(vectors, ids, kind, codec)
+                size_mb = len(faiss.serialize_index(index.index)) / 2**20
+            build = time.perf_counter() - start
+            times, found = run_queries(index, queries, args.k)
+            print(
+                f"{size:>9} {kind:<6} {index.codec:<5} {index.pca_dim:>4} {build:>8.2f}"
+                f" {size_mb:>9.1f} {recall(found, truth):>9.3f}"
+                f" {_percentile(times, 0.5):>8.3f} {_percentile(times, 0.99):>8.3f}"
+            )
+            del index
+
+
+if __name__ == "__main__":
+    main()
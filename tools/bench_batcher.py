@@ -0,0 +1,106 @@
+"""Measure query encoding throughput with and without micro-batching.
+
+Every client thread encodes distinct queries in a loop, either calling the
+model directly with a batch of one or through
+:class:`rag_engine.EmbeddingBatcher`. Without ``sentence-transformers`` (or
+with ``--synthetic``) a stand-in model with a fixed per-call overhead and a
+per-query cost is used::
+
+    python -m tools.bench_batcher
+    python -m tools.bench_batcher --clients 1,8,32 --window-ms 5 --batch-size 32
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import numpy as np
+
+import rag_engine
+
+
+class SyntheticModel:
+    """Model whose cost is ``call_ms`` per call plus ``item_ms`` per text."""
+
+    def __init__(self, call_ms: float, item_ms: float, dim: int = 384):
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self.dim = dim
+        self._lock = threading.Lock()  # one forward pass at a time, like the GIL
+
+    def encode(self, texts, **_kwargs):
+        with self._lock:
+            time.sleep((self.call_ms + self.item_ms * len(texts)) / 1000)
+        vecs = np.ones((len(texts), self.dim), dtype="float32")
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def run(encode, clients: int, per_client: int) -> tuple[float, list[float]]:
+    """Return queries per second and per-query latencies in ms."""
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def client(n: int) -> None:
+        own = []
+        for i in range(per_client):
+            start = time.perf_counter()
+            encode(f"dotaz {n} číslo {i}")
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return clients * per_client / (time.perf_counter() - start), latencies
+
+
+def _p95(times: list[float]) -> float:
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * 0.95))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched query encoding")
+    parser.add_argument("--clients", default="1,8,32", help="Comma separated client counts")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per client")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--synthetic", action="store_true", help="Always use the stand-in model")
+    parser.add_argument("--call-ms", type=float, default=4.0, help="Stand-in cost per call")
+    parser.add_argument("--item-ms", type=float, default=0.3, help="Stand-in cost per query")
+    args = parser.parse_args()
+
+    if rag_engine.VECTOR_SUPPORT and not args.synthetic:
+        model = rag_engine.get_model()
+        print(f"model: {rag_engine._default_model_name()}")
+    else:
+        model = SyntheticModel(args.call_ms, args.item_ms)
+        print(f"model: synthetic ({args.call_ms} ms/call + {args.item_ms} ms/query)")
+
+    def direct(text: str):
+        return model.encode([text], show_progress_bar=False, normalize_embeddings=True)[0]
+
+    for clients in (int(c) for c in args.clients.split(",")):
+        batcher = rag_engine.EmbeddingBatcher(
+            lambda texts: model.encode(
+                texts, show_progress_bar=False, normalize_embeddings=True
+            ),
+            window_ms=args.window_ms,
+            max_batch=args.batch_size,
+        )
+        for name, encode in (("direct", direct), ("batched", batcher.encode)):
+            qps, latencies = run(encode, clients, args.queries)
+            print(
+                f"{clients:>3} clients {name:<8} {qps:8.1f} q/s"
+                f"  p50 {statistics.median(latencies):7.2f} ms  p95 {_p95(latencies):7.2f} ms"
+            )
+        print(f"{'':>12} mean batch {batcher.stats()['mean_batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Compare blank-line paragraphs with the token-bounded chunker.
+
+Both splitters run on the same corpus, a folder of knowledge files or a
+synthetic one mixing headings, lists, one-line fragments and page-long
+PDF-style blocks. The report lists chunk counts, token sizes, the size of
+a float32 index and retrieval quality::
+
+    python -m tools.bench_chunking
+    python -m tools.bench_chunking --folder knowledge --max-seq 128
+
+Every query quotes words of one sentence, including its last word (a
+unique tag in the synthetic corpus), and a hit means the sentence is
+inside one of the ``--k`` chunks returned. Only the first ``--max-seq``
+tokens of a chunk are indexed, as the embedding model truncates longer
+input. Without ``sentence-transformers`` (or with ``--lexical``) the
+chunks are ranked with :class:`rag_engine.BM25Index` instead of vectors.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+import rag_engine
+from chunking import chunk_settings, chunk_text, count_tokens
+from extraction import extract_text, list_documents
+from tools.bench_lexical import WORDS
+
+
+def synthetic_documents(count: int, rng: random.Random) -> list[str]:
+    """Return *count* Markdown documents with uniquely tagged sentences."""
+    docs, n = [], 0
+
+    def sentence() -> str:
+        nonlocal n
+        n += 1
+        return " ".join(rng.choices(WORDS, k=rng.randint(6, 18)) + [f"s{n}"]).capitalize() + "."
+
+    for d in range(count):
+        parts = [f"# Dokument {d}"]
+        for s in range(rng.randint(3, 8)):
+            parts.append(f"## Sekce {s + 1}")
+            for _ in range(rng.randint(1, 4)):
+                kind = rng.random()
+                if kind < 0.15:
+                    parts.append(rng.choice(WORDS).capitalize() + ":")
+                elif kind < 0.3:
+                    parts.append("\n".join(f"- {sentence()}" for _ in range(rng.randint(3, 8))))
+                elif kind < 0.5:
+                    # a whole PDF page without blank lines
+                    parts.append(" ".join(sentence() for _ in range(rng.randint(20, 60))))
+                else:
+                    parts.append(" ".join(sentence() for _ in range(rng.randint(1, 5))))
+        docs.append("\n\n".join(parts))
+    return docs
+
+
+def folder_documents(folder: str) -> list[str]:
+    """Return the texts of the knowledge documents in *folder*."""
+    return [extract_text(path) for path in list_documents(folder)]
+
+
+def sentences_of(docs: list[str]) -> list[str]:
+    """Return the sentences usable as query targets."""
+    found = []
+    for doc in docs:
+        for line in doc.split("\n"):
+            line = line.strip().lstrip("-").strip()
+            if line.startswith("#"):
+                continue
+            found.extend(s for s in line.split(". ") if count_tokens(s) >= 6)
+    return [s if s.endswith(".") else s + "." for s in found]
+
+
+def _truncate(text: str, max_seq: int) -> str:
+    tokens = text.split()
+    return " ".join(tokens[:max_seq])
+
+
+def lexical_ranker(chunks: list[str], max_seq: int):
+    index = rag_engine.BM25Index()
+    for i, chunk in enumerate(chunks):
+        index.add(i, _truncate(chunk, max_seq))
+    return lambda query, k: [i for _score, i in index.search(query, k)]
+
+
+def vector_ranker(chunks: list[str], max_seq: int, model):
+    vectors = model.encode(
+        [_truncate(c, max_seq) for c in chunks],
+        batch_size=64,
+        show_progress_bar=False,
+        normalize_embeddings=True,
+    ).astype("float32")
+
+    def rank(query: str, k: int) -> list[int]:
+        q = model.encode([query], show_progress_bar=False, normalize_embeddings=True)[0]
+        return list(np.argsort(-(vectors @ q))[:k])
+
+    return rank
+
+
+def evaluate(name: str, chunks: list[str], targets: list[tuple[str, str]], args, model) -> None:
+    sizes = sorted(count_tokens(c) for c in chunks)
+    start = time.perf_counter()
+    if model is None:
+        rank = lexical_ranker(chunks, args.max_seq)
+    else:
+        rank = vector_ranker(chunks, args.max_seq, model)
+    build = time.perf_counter() - start
+
+    hits, prompt = 0, []
+    for query, sentence in targets:
+        found = rank(query, args.k)
+        hits += any(sentence in chunks[i] for i in found)
+        prompt.append(sum(len(chunks[i]) for i in found))
+    print(
+        f"{name:<11} {len(chunks):>7} {statistics.mean(sizes):>7.1f}"
+        f" {sizes[min(len(sizes) - 1, int(len(sizes) * 0.95))]:>6} {sizes[-1]:>6}"
+        f" {sum(s > args.max_seq for s in sizes):>8}"
+        f" {len(chunks) * args.dim * 4 / 2**20:>8.1f}"
+        f" {hits / len(targets):>7.3f} {statistics.mean(prompt):>9.0f} {build:>7.2f}"
+    )
+
+
+def main() -> None:
+    max_tokens, overlap, min_tokens = chunk_settings()
+    parser = argparse.ArgumentParser(description="Benchmark knowledge chunking")
+    parser.add_argument("--folder", help="Use this knowledge folder instead of a synthetic one")
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5, help="Chunks returned per query")
+    parser.add_argument("--max-seq", type=int, default=128, help="Tokens seen by the model")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension for index size")
+    parser.add_argument("--tokens", type=int, default=max_tokens, help="RAG_CHUNK_TOKENS")
+    parser.add_argument("--overlap", type=int, default=overlap, help="RAG_CHUNK_OVERLAP")
+    parser.add_argument("--min-tokens", type=int, default=min_tokens, help="RAG_CHUNK_MIN_TOKENS")
+    parser.add_argument("--lexical", action="store_true", help="Rank with BM25 even with a model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.folder:
+        docs = folder_documents(args.folder)
+    else:
+        docs = synthetic_documents(args.documents, rng)
+    sentences = sentences_of(docs)
+    if not sentences:
+        parser.error("no sentences to query")
+    targets = []
+    for sentence in rng.sample(sentences, min(args.queries, len(sentences))):
+        # a few words plus the last one, the sentence tag in the synthetic corpus
+        words = sentence.rstrip(".").split()
+        start = rng.randrange(max(len(words) - 4, 1))
+        targets.append((" ".join(words[start:start + 3] + words[-1:]), sentence))
+
+    model = None
+    if rag_engine.VECTOR_SUPPORT and not args.lexical:
+        model = rag_engine.get_model()
+    print(f"ranking: {'BM25' if model is None else rag_engine._default_model_name()}")
+    print(f"chunker: {args.tokens} tokens, {args.overlap} overlap, {args.min_tokens} min")
+    print(
+        f"{'splitter':<11} {'chunks':>7} {'mean':>7} {'p95':>6} {'max':>6}"
+        f" {'>max-seq':>8} {'index MB':>8} {'hit@' + str(args.k):>7} {'prompt ch':>9} {'build s':>7}"
+    )
+    paragraphs = [p for doc in docs for p in rag_engine._split_paragraphs(doc)]
+    chunks = [
+        c for doc in docs
+        for c in chunk_text(doc, args.tokens, args.overlap, args.min_tokens)
+    ]
+    evaluate("paragraphs", paragraphs, targets, args, model)
+    evaluate("chunker", chunks, targets, args, model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measure corpus encoding throughput against the number of processes.
+
+The corpus (synthetic, or the paragraphs of ``--folder``) is encoded with
+:class:`rag_engine.CorpusEncoder` once per process count. The time needed to
+start the worker processes is reported separately from the encoding itself.
+Without ``sentence-transformers`` (or with ``--synthetic``) a stand-in model
+that burns ``--item-ms`` of CPU per paragraph in each worker is used::
+
+    python -m tools.bench_encode --paragraphs 20000
+    python -m tools.bench_encode --processes 1,4,8,16 --batch-size 64
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+import rag_engine
+from tools.bench_lexical import folder_corpus, synthetic_corpus
+
+
+def _burn(texts: list[str], item_ms: float, dim: int) -> np.ndarray:
+    """Spend ``item_ms`` of CPU per text and return deterministic vectors."""
+    deadline = time.process_time() + item_ms * len(texts) / 1000
+    while time.process_time() < deadline:
+        pass
+    rng = np.random.default_rng(len(texts))
+    return rng.standard_normal((len(texts), dim)).astype("float32")
+
+
+class SyntheticModel:
+    """CPU-bound model with the multi-process API of ``sentence-transformers``."""
+
+    def __init__(self, item_ms: float, dim: int = 384):
+        self.item_ms = item_ms
+        self.dim = dim
+
+    def encode(self, texts, **_kwargs):
+        vecs = _burn(texts, self.item_ms, self.dim)
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    def start_multi_process_pool(self, target_devices):
+        return multiprocessing.get_context("spawn").Pool(len(target_devices))
+
+    def encode_multi_process(self, texts, pool, batch_size=32, **_kwargs):
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        parts = pool.starmap(_burn, [(b, self.item_ms, self.dim) for b in batches])
+        return np.concatenate(parts)
+
+    def stop_multi_process_pool(self, pool):
+        pool.terminate()
+        pool.join()
+
+
+def _default_processes() -> str:
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return ",".join(map(str, counts))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark multi-process corpus encoding")
+    parser.add_argument("--paragraphs", type=int, default=20_000)
+    parser.add_argument("--folder", help="Encode the paragraphs of this folder instead")
+    parser.add_argument(
+        "--processes", default=_default_processes(), help="Comma separated process counts"
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--synthetic", action="store_true", help="Always use the stand-in model")
+    parser.add_argument("--item-ms", type=float, default=2.0, help="Stand-in cost per paragraph")
+    args = parser.parse_args()
+
+    if args.folder:
+        corpus = folder_corpus(args.folder)
+    else:
+        corpus = synthetic_corpus(args.paragraphs, random.Random(0))
+
+    if rag_engine.VECTOR_SUPPORT and not args.synthetic:
+        model = rag_engine.get_model()
+        print(f"model: {rag_engine._default_model_name()}")
+    else:
+        model = SyntheticModel(args.item_ms)
+        print(f"model: synthetic ({args.item_ms} ms/paragraph)")
+    print(f"{len(corpus)} paragraphs, {os.cpu_count()} cores, batch size {args.batch_size}")
+
+    baseline = None
+    for processes in (int(p) for p in args.processes.split(",")):
+        with rag_engine.CorpusEncoder(
+            model, processes=processes, batch_size=args.batch_size, min_chunks=0
+        ) as encode:
+            start = time.perf_counter()
+            vectors = encode(corpus)
+            seconds = time.perf_counter() - start - encode.pool_seconds
+        assert len(vectors) == len(corpus)
+        rate = len(corpus) / seconds
+        baseline = baseline or rate
+        print(
+            f"{processes:>3} processes {rate:9.1f} chunks/s"
+            f"  speed-up {rate / baseline:5.2f}x  pool start {encode.pool_seconds:6.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
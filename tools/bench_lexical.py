@@ -0,0 +1,125 @@
+"""Benchmark the BM25 fallback search against the old ``_similarity`` scan.
+
+Run from the repository root, either on the knowledge folder or on a
+synthetic corpus::
+
+    python -m tools.bench_lexical --folder knowledge
+    python -m tools.bench_lexical --paragraphs 20000 --queries 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import rag_engine
+
+WORDS = (
+    "audit dodavatel kvalita reklamace postup projekt výroba schválení díl "
+    "norma požadavek kontrola proces riziko plán změna zákazník vzorek měření "
+    "apqp ppap iatf saq fmea spc msa sériová dokumentace odpovědnost termín"
+).split()
+
+
+def synthetic_corpus(paragraphs: int, rng: random.Random) -> list[str]:
+    """Return *paragraphs* random sentences built from :data:`WORDS`."""
+    corpus = []
+    for i in range(paragraphs):
+        words = rng.choices(WORDS, k=rng.randint(20, 120))
+        words.append(f"id{i}")
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def folder_corpus(folder: str) -> list[str]:
+    """Return paragraphs of every ``.txt`` file below *folder*."""
+    corpus: list[str] = []
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if name.endswith(".txt"):
+                text = rag_engine.load_txt_file(os.path.join(root, name))
+                corpus.extend(rag_engine._split_paragraphs(text))
+    return corpus
+
+
+def pick_queries(corpus: list[str], count: int, rng: random.Random) -> list[str]:
+    """Return short word sequences sampled from random paragraphs."""
+    queries = []
+    for _ in range(count):
+        words = rng.choice(corpus).split()
+        start = rng.randrange(max(len(words) - 2, 1))
+        queries.append(" ".join(words[start:start + rng.randint(1, 3)]))
+    return queries
+
+
+def similarity_scan(query: str, corpus: list[str], threshold: float, top_k: int):
+    """The pre-BM25 fallback: score every paragraph with ``_similarity``."""
+    scored = [(rag_engine._similarity(query, c), c) for c in corpus]
+    scored = [c for c in scored if c[0] >= threshold]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[:top_k]
+
+
+def bm25_search(index, query: str, corpus: list[str], threshold: float, top_k: int):
+    """The BM25 fallback as used by ``KnowledgeBase.search``."""
+    pool = index.search(query, max(top_k * 4, 20))
+    hits = [(i, corpus[i]) for _score, i in pool]
+    return [(score, corpus[i]) for score, i in rag_engine._rerank(query, hits, threshold)[:top_k]]
+
+
+def _timed(fn, *args) -> tuple[float, list[tuple[float, str]]]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _summary(name: str, times: list[float]) -> str:
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+    return (
+        f"{name:<16} mean {statistics.mean(times):9.2f} ms"
+        f"  p50 {statistics.median(times):9.2f} ms  p95 {p95:9.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare BM25 with the _similarity scan")
+    parser.add_argument("--folder", help="Use paragraphs of the .txt files in this folder")
+    parser.add_argument("--paragraphs", type=int, default=5000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=30, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = folder_corpus(args.folder) if args.folder else synthetic_corpus(args.paragraphs, rng)
+    if not corpus:
+        parser.error("no paragraphs found")
+    queries = pick_queries(corpus, args.queries, rng)
+    print(f"corpus: {len(corpus)} paragraphs, {sum(map(len, corpus)) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    index = rag_engine.BM25Index()
+    for i, chunk in enumerate(corpus):
+        index.add(i, chunk)
+    print(f"BM25 build: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    scan_times, bm25_times, agree = [], [], 0
+    for query in queries:
+        t_scan, old = _timed(similarity_scan, query, corpus, args.threshold, args.top_k)
+        t_bm25, new = _timed(bm25_search, index, query, corpus, args.threshold, args.top_k)
+        scan_times.append(t_scan)
+        bm25_times.append(t_bm25)
+        agree += [score for score, _c in old] == [score for score, _c in new]
+    print(_summary("_similarity scan", scan_times))
+    print(_summary("BM25", bm25_times))
+    print(
+        f"speedup {statistics.mean(scan_times) / max(statistics.mean(bm25_times), 1e-9):.1f}x,"
+        f" queries with identical top-{args.top_k} scores: {agree}/{len(queries)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compare memory search over the JSONL cache with the SQLite FTS5 store.
+
+For every size a synthetic conversation log is written to a temporary
+folder, loaded like ``main._read_memory_file`` and searched with the old
+linear scan and with the :class:`memory.MemorySearchIndex` used by
+``main.search_memory``; the same log is imported into a
+:class:`memory.SqliteMemoryStore` and searched through its FTS5 index::
+
+    python -m tools.bench_memory
+    python -m tools.bench_memory --sizes 10000,100000 --queries 50
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, UTC
+
+import rag_engine
+from memory import MemorySearchIndex, MemoryTimeline, SegmentedLog, SqliteMemoryStore
+from tools.bench_lexical import WORDS, _summary
+
+
+def write_log(folder: str, entries: int, rng: random.Random) -> SegmentedLog:
+    """Write *entries* question/answer pairs spread over the last 30 days."""
+    log = SegmentedLog(folder)
+    start = datetime.now(UTC) - timedelta(days=30)
+    step = timedelta(days=30) / entries
+    by_day: dict[str, list[str]] = {}
+    for i in range(entries):
+        ts = (start + step * i).isoformat()
+        question = " ".join(rng.choices(WORDS, k=rng.randint(4, 12))) + f" id{i}"
+        answer = " ".join(rng.choices(WORDS, k=rng.randint(10, 40)))
+        day = by_day.setdefault(ts[:10], [])
+        day.append(json.dumps({"timestamp": ts, "role": "user", "message": question}) + "\n")
+        day.append(json.dumps({"timestamp": ts, "role": "assistant", "message": answer}) + "\n")
+    for day, lines in by_day.items():
+        log.append("".join(lines), day)
+    return log
+
+
+def read_cache(log: SegmentedLog) -> list[dict]:
+    """Pair the lines of *log* into cache entries like ``main._read_memory_file``."""
+    entries, pending = [], None
+    for line in log.lines():
+        obj = json.loads(line)
+        if obj["role"] == "user":
+            pending = obj["message"]
+        elif pending is not None:
+            entries.append({"user": pending, "jarvik": obj["message"]})
+            pending = None
+    return entries
+
+
+def linear_search(query: str, entries: list[dict]) -> list[dict]:
+    """The scan ``main.search_memory`` did before the trigram index."""
+    results = []
+    q = rag_engine._strip_diacritics(query.lower())
+    for entry in reversed(entries):
+        user_text = rag_engine._strip_diacritics(entry.get("user", "").lower())
+        jarvik_text = rag_engine._strip_diacritics(entry.get("jarvik", "").lower())
+        if q in user_text or q in jarvik_text:
+            results.append(entry)
+        if len(results) >= 5:
+            break
+    return results
+
+
+def _timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench(entries: int, queries: int, rng: random.Random) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        log = write_log(os.path.join(tmp, "public.d"), entries, rng)
+        cache = read_cache(log)
+        jsonl_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = MemorySearchIndex(lambda text: rag_engine._strip_diacritics(text.lower()))
+        index.add("public", cache)
+        view = MemoryTimeline().view([("public", cache)])
+        index_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = SqliteMemoryStore(os.path.join(tmp, "memory.db"))
+        batch: list[str] = []
+        for line in log.lines():
+            batch.append(line)
+            if len(batch) >= 20_000:
+                store.insert("public", batch)
+                batch = []
+        store.insert("public", batch)
+        sqlite_load = time.perf_counter() - start
+        db_mb = os.path.getsize(store.path) / 1e6
+
+        # Common words stop the scan early, rare ids make it read everything.
+        words = [rng.choice(WORDS) for _ in range(queries // 2)]
+        words += [f"id{rng.randrange(entries)}" for _ in range(queries - len(words))]
+        scan = [_timed(linear_search, q, cache) for q in words]
+        indexed = [
+            _timed(view.find, index, rag_engine._strip_diacritics(q.lower())) for q in words
+        ]
+        fts = [_timed(store.search, ["public"], q) for q in words]
+        store.close()
+
+    print(
+        f"{entries} entries: JSONL write+load {jsonl_load:.1f} s, index {index_build:.1f} s,"
+        f" SQLite import {sqlite_load:.1f} s ({db_mb:.0f} MB)"
+    )
+    print("  " + _summary("linear scan", scan))
+    print("  " + _summary("trigram index", indexed))
+    print("  " + _summary("SQLite FTS5", fts))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark memory search backends")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma separated entry counts")
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in (int(s) for s in args.sizes.split(",")):
+        bench(size, args.queries, rng)
+
+
+if __name__ == "__main__":
+    main()
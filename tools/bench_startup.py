@@ -0,0 +1,102 @@
+"""Compare knowledge base startup: cold build, warm load and mmap load.
+
+A synthetic corpus is written to a temporary folder (or ``--folder`` is
+used) and :class:`rag_engine.KnowledgeBase` is created three times:
+
+* cold  – no snapshot and no embedding cache, every paragraph is encoded
+* warm  – the saved snapshot is read into memory (``RAG_INDEX_MMAP=0``)
+* mmap  – the saved snapshot is memory mapped (``RAG_INDEX_MMAP=1``)
+
+Without ``sentence-transformers`` (or with ``--synthetic``) a stand-in
+model costing ``--item-ms`` per paragraph is used::
+
+    python -m tools.bench_startup --paragraphs 20000
+    python -m tools.bench_startup --folder knowledge
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import rag_engine
+from tools.bench_lexical import synthetic_corpus
+
+
+class SyntheticModel:
+    """Deterministic model costing ``item_ms`` per encoded text."""
+
+    def __init__(self, item_ms: float, dim: int = 384):
+        self.item_ms = item_ms
+        self.dim = dim
+
+    def encode(self, texts, **_kwargs):
+        time.sleep(self.item_ms * len(texts) / 1000)
+        rng = np.random.default_rng(len(texts))
+        vecs = rng.standard_normal((len(texts), self.dim)).astype("float32")
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def write_corpus(folder: str, paragraphs: int, per_file: int, seed: int) -> None:
+    """Write *paragraphs* synthetic paragraphs to ``.txt`` files in *folder*."""
+    corpus = synthetic_corpus(paragraphs, random.Random(seed))
+    for n, start in enumerate(range(0, len(corpus), per_file)):
+        path = os.path.join(folder, f"doc{n:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(corpus[start:start + per_file]))
+
+
+def timed_start(folder: str, model, index_dir: str, mmap: str) -> tuple[float, int, object]:
+    """Return seconds and RSS growth of creating a knowledge base."""
+    os.environ["RAG_INDEX_MMAP"] = mmap
+    rss = rag_engine._rss_bytes()
+    start = time.perf_counter()
+    kb = rag_engine.KnowledgeBase(folder, cache_dir="", index_dir=index_dir, model=model)
+    return time.perf_counter() - start, rag_engine._rss_bytes() - rss, kb
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base startup")
+    parser.add_argument("--folder", help="Use this knowledge folder instead of a synthetic one")
+    parser.add_argument("--paragraphs", type=int, default=10000, help="Synthetic corpus size")
+    parser.add_argument("--per-file", type=int, default=50, help="Paragraphs per synthetic file")
+    parser.add_argument("--synthetic", action="store_true", help="Always use the stand-in model")
+    parser.add_argument("--item-ms", type=float, default=2.0, help="Stand-in cost per paragraph")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if rag_engine.VECTOR_SUPPORT and not args.synthetic:
+        model = rag_engine.get_model()
+    else:
+        rag_engine.VECTOR_SUPPORT = True
+        model = SyntheticModel(args.item_ms)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if not folder:
+            folder = os.path.join(tmp, "knowledge")
+            os.makedirs(folder)
+            write_corpus(folder, args.paragraphs, args.per_file, args.seed)
+        index_dir = os.path.join(tmp, "index")
+
+        results = []
+        seconds, rss, kb = timed_start(folder, model, "", "0")
+        results.append(("cold", seconds, rss))
+        del kb
+        rag_engine.KnowledgeBase(folder, cache_dir="", index_dir=index_dir, model=model)
+        for name, mmap in (("warm", "0"), ("mmap", "1")):
+            seconds, rss, kb = timed_start(folder, model, index_dir, mmap)
+            results.append((name, seconds, rss))
+            del kb
+
+        print(f"corpus: {len(rag_engine._load_folder(folder))} paragraphs")
+        for name, seconds, rss in results:
+            print(f"{name:<5} {seconds:8.2f} s  RSS +{rss / 2**20:7.1f} MB")
+        print(f"speedup cold/mmap {results[0][1] / max(results[2][1], 1e-9):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Convert knowledge documents to plain text or Markdown in parallel.
+
+Files are fanned out over a process pool and large PDFs are additionally
+split into page ranges converted by different workers. Page text is
+written to disk as it is extracted. Outputs whose source hash matches the
+manifest of the previous run are skipped::
+
+    python -m tools.convert                       # knowledge/ -> knowledge_txt/
+    python -m tools.convert --format md           # knowledge/ -> knowledge_md/
+    python -m tools.convert --input docs --output out --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from extraction import SUPPORTED_EXTENSIONS, extract_text
+
+try:
+    import pdfplumber
+except ImportError:  # pragma: no cover - simple import guard
+    pdfplumber = None
+
+SOURCE_EXTENSIONS = (".txt", ".md", ".pdf", ".docx")
+MANIFEST_NAME = ".convert_manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def md_title(path: Path) -> str:
+    return "# " + path.stem.replace("_", " ").title() + "\n"
+
+
+def pdf_page_count(path: Path) -> int:
+    if pdfplumber is None:
+        raise RuntimeError("pdfplumber required for PDF conversion")
+    with pdfplumber.open(str(path)) as pdf:
+        return len(pdf.pages)
+
+
+# ---------------------------------------------------------------------------
+# Worker tasks (module level so they can be pickled)
+# ---------------------------------------------------------------------------
+
+def convert_pages(path: str, out_path: str, first: int, last: int, fmt: str) -> Tuple[int, float]:
+    """Stream PDF pages ``first..last-1`` of *path* into *out_path*.
+
+    Returns the number of pages written and the seconds spent.
+    """
+    start = time.perf_counter()
+    if pdfplumber is None:
+        raise RuntimeError("pdfplumber required for PDF conversion")
+    with pdfplumber.open(path) as pdf, open(out_path, "w", encoding="utf-8") as out:
+        for i in range(first, last):
+            page = pdf.pages[i]
+            text = (page.extract_text() or "").strip()
+            if fmt == "md":
+                out.write(f"\n## Sekce {i + 1}\n{text}\n")
+            else:
+                out.write(("\n\n" if i else "") + text)
+            if hasattr(page, "flush_cache"):
+                page.flush_cache()
+    return last - first, time.perf_counter() - start
+
+
+def convert_document(path: str, out_path: str, fmt: str) -> Tuple[int, float]:
+    """Convert a TXT, MD or DOCX file; returns sections written and seconds."""
+    start = time.perf_counter()
+    source = Path(path)
+    text = extract_text(path)
+    with open(out_path, "w", encoding="utf-8") as out:
+        if fmt == "md" and source.suffix.lower() != ".md":
+            blocks = [b.strip() for b in text.split("\n\n") if b.strip()]
+            out.write(md_title(source))
+            for i, block in enumerate(blocks, start=1):
+                out.write(f"\n## Sekce {i}\n{block}\n")
+            count = len(blocks)
+        else:
+            out.write(text)
+            count = 1
+    return count, time.perf_counter() - start
+
+
+# ---------------------------------------------------------------------------
+# Planning and assembly
+# ---------------------------------------------------------------------------
+
+class _Job:
+    """One source file and the parts it is converted in."""
+
+    def __init__(self, source: Path, output: Path, sha: str):
+        self.source = source
+        self.output = output
+        self.sha = sha
+        self.parts: List[str] = []
+        self.futures: List[Future] = []
+        self.error: Exception | None = None
+
+
+def unique_sources(sources: List[Path]) -> Tuple[List[Path], List[Path]]:
+    """Split *sources* into one file per stem and the duplicates left out.
+
+    ``x.pdf`` and ``x.docx`` would both write ``x.txt``; like
+    :func:`extraction.list_documents` the extension listed first in
+    :data:`extraction.SUPPORTED_EXTENSIONS` wins.
+    """
+    best: Dict[str, Path] = {}
+    for source in sorted(sources, key=lambda p: SUPPORTED_EXTENSIONS.index(p.suffix.lower())):
+        best.setdefault(source.stem, source)
+    kept = set(best.values())
+    return sorted(kept), [p for p in sources if p not in kept]
+
+
+def plan(
+    sources: List[Path], output_dir: Path, fmt: str, manifest: Dict[str, dict]
+) -> Tuple[List[_Job], int]:
+    """Return the jobs for changed *sources* and the number of skipped files."""
+    jobs, skipped = [], 0
+    for source in sources:
+        output = output_dir / f"{source.stem}.{fmt}"
+        sha = file_sha256(source)
+        entry = manifest.get(source.name)
+        if entry and entry.get("sha256") == sha and entry.get("format") == fmt and output.exists():
+            skipped += 1
+            continue
+        jobs.append(_Job(source, output, sha))
+    return jobs, skipped
+
+
+def submit(job: _Job, fmt: str, pages_per_task: int, run) -> None:
+    """Queue the tasks of *job* using ``run(fn, *args) -> Future``."""
+    # Parts are named after the source, never shared by two jobs.
+    tmp = f"{job.output.parent / job.source.name}.{os.getpid()}"
+    if job.source.suffix.lower() != ".pdf":
+        job.parts = [tmp + ".part0"]
+        job.futures = [run(convert_document, str(job.source), job.parts[0], fmt)]
+        return
+    pages = pdf_page_count(job.source)
+    for n, first in enumerate(range(0, max(pages, 1), pages_per_task)):
+        part = f"{tmp}.part{n}"
+        job.parts.append(part)
+        last = min(first + pages_per_task, pages)
+        job.futures.append(run(convert_pages, str(job.source), part, first, last, fmt))
+
+
+def assemble(job: _Job, fmt: str) -> Tuple[int, float]:
+    """Join the parts of *job* into its output; returns pages and seconds."""
+    results = [f.result() for f in job.futures]
+    tmp = f"{job.output}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        if fmt == "md" and job.source.suffix.lower() == ".pdf":
+            out.write(md_title(job.source))
+        for part in job.parts:
+            with open(part, "r", encoding="utf-8") as f:
+                for block in iter(lambda: f.read(1 << 20), ""):
+                    out.write(block)
+    os.replace(tmp, job.output)
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def _cleanup(job: _Job) -> None:
+    for part in job.parts:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+class _Inline:
+    """Stand-in for a process pool that runs tasks right away."""
+
+    def submit(self, fn, *args) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+def convert_folder(
+    input_dir: Path,
+    output_dir: Path,
+    fmt: str = "txt",
+    workers: int | None = None,
+    pages_per_task: int = 25,
+) -> Dict[str, int]:
+    """Convert every supported file of *input_dir* and print a report."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+
+    sources = sorted(
+        p for p in input_dir.iterdir() if p.is_file() and p.suffix.lower() in SOURCE_EXTENSIONS
+    )
+    sources, duplicates = unique_sources(sources)
+    for source in duplicates:
+        print(f"Skipped:   {source.name} (another file has the same name)")
+    start = time.perf_counter()
+    jobs, skipped = plan(sources, output_dir, fmt, manifest)
+    workers = workers or os.cpu_count() or 1
+    stats = {
+        "converted": 0,
+        "skipped": skipped,
+        "duplicates": len(duplicates),
+        "failed": 0,
+        "pages": 0,
+    }
+    total_bytes = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and jobs else _Inline()
+    with pool:
+        for job in jobs:
+            try:
+                submit(job, fmt, pages_per_task, pool.submit)
+            except Exception as e:
+                job.error = e
+        for job in jobs:
+            try:
+                if job.error is not None:
+                    raise job.error
+                pages, seconds = assemble(job, fmt)
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Failed:    {job.source.name}: {e}")
+                continue
+            finally:
+                _cleanup(job)
+            stats["converted"] += 1
+            stats["pages"] += pages
+            total_bytes += job.source.stat().st_size
+            manifest[job.source.name] = {"sha256": job.sha, "format": fmt}
+            print(f"Converted: {job.source.name} -> {job.output.name} ({pages} pages/sections, {seconds:.2f} s)")
+
+    if stats["converted"]:
+        manifest_path.write_text(
+            json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+    elapsed = time.perf_counter() - start
+    print(
+        f"{stats['converted']} converted, {stats['skipped']} unchanged, {stats['failed']} failed"
+        f" in {elapsed:.2f} s ({stats['pages'] / max(elapsed, 1e-9):.1f} pages/s,"
+        f" {total_bytes / 2**20 / max(elapsed, 1e-9):.1f} MB/s, {workers} workers)"
+    )
+    return stats
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Convert knowledge documents to text or Markdown")
+    parser.add_argument("--format", choices=("txt", "md"), default="txt")
+    parser.add_argument("--input", default=os.getenv("KNOWLEDGE_DIR", "knowledge"))
+    parser.add_argument("--output", help="Defaults to knowledge_txt or knowledge_md")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--pages-per-task", type=int, default=25, help="PDF pages per worker task")
+    args = parser.parse_args(argv)
+
+    output = Path(args.output or f"knowledge_{args.format}")
+    convert_folder(Path(args.input), output, args.format, args.workers, args.pages_per_task)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,42 @@
 import os
 import json
 import argparse
+import sys
+from collections import deque
+from typing import Iterable
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from memory import SegmentedLog, SqliteMemoryStore, segment_dir  # noqa: E402
+
 MEMORY_DIR = os.getenv("MEMORY_DIR", os.path.join(BASE_DIR, "memory"))
 DEFAULT_FILE = os.path.join(MEMORY_DIR, "public.jsonl")
 
 
+def open_log(path: str, backend: str = "jsonl"):
+    """Return the log of the memory file *path* in the given storage *backend*."""
+    if backend == "sqlite":
+        # memory/public.jsonl or memory/<nick>/log.jsonl next to memory/memory.db
+        root, folder = os.path.dirname(path), "public"
+        if os.path.basename(path) != "public.jsonl":
+            root, folder = os.path.split(root)
+        store = SqliteMemoryStore(os.path.join(root, "memory.db"))
+        return store.log(folder, legacy=path)
+    return SegmentedLog(segment_dir(path), legacy=path)
+
+
+def iter_memory(path: str, backend: str = "jsonl") -> Iterable[dict]:
+    """Yield the entries of *path* and of its day segments, oldest first."""
+    for line in open_log(path, backend).lines():
+        if line.strip():
+            yield json.loads(line)
+
+
 def load_memory(path: str) -> list[dict]:
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as fh:
-        return [json.loads(line) for line in fh if line.strip()]
+    return list(iter_memory(path))
 
 
-def search_entries(entries: list[dict], query: str) -> list[dict]:
+def search_entries(entries: Iterable[dict], query: str) -> list[dict]:
     q = query.lower()
     out: list[dict] = []
     for item in entries:
@@ -26,18 +48,26 @@ def search_entries(entries: list[dict], query: str) -> list[dict]:
 def main() -> None:
     parser = argparse.ArgumentParser(description="Search or display Jarvik memory logs")
     parser.add_argument("--folder", default=DEFAULT_FILE, help="Memory folder or file")
-    parser.add_argument("-n", "--last", type=int, default=5, help="Show last N entries when no query is given")
+    parser.add_argument("-n", "--last", type=int, default=5, help="Show last N entries (or search hits with sqlite)")
     parser.add_argument("-q", "--query", help="Search for a string")
+    parser.add_argument(
+        "--backend",
+        choices=["jsonl", "sqlite"],
+        default=os.getenv("MEMORY_BACKEND", "jsonl"),
+        help="Memory storage, defaults to MEMORY_BACKEND",
+    )
     args = parser.parse_args()
 
     path = args.folder
     if os.path.isdir(path):
         path = os.path.join(path, "log.jsonl")
-    entries = load_memory(path)
-    if args.query:
-        entries = search_entries(entries, args.query)
+    if args.query and args.backend == "sqlite":
+        log = open_log(path, args.backend)
+        entries = log.store.search([log.folder], args.query, limit=args.last)
+    elif args.query:
+        entries = search_entries(iter_memory(path, args.backend), args.query)
     else:
-        entries = entries[-args.last:]
+        entries = list(deque(iter_memory(path, args.backend), maxlen=args.last))
     print(json.dumps(entries, indent=2, ensure_ascii=False))
 
 